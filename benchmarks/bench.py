@@ -0,0 +1,292 @@
+"""End-to-end benchmark suite for the ankicli hot paths.
+
+Generates a synthetic vault, times every phase of the parsing / syncing pipeline and emits the results as json, e.g.:
+
+    python -m benchmarks.bench --files 50 --cards 40 --output bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+from benchmarks.fake_anki import FakeAnkiServer
+from benchmarks.vault_generator import VaultConfig, generate_vault
+
+from ankicli import noteModule2, parseModule, pipelineModule, syncModule
+from ankicli.anki_api import deckModule, requestModule
+from ankicli.renderer.img_plugin import im_list
+from ankicli.renderer.rendererModule import get_markdown
+
+IMPORT_SCRIPT = "import time; t = time.perf_counter(); import ankicli.noteModule2; print(time.perf_counter() - t)"
+
+
+def timed(func, repeat: int, setup=None) -> dict:
+    """Function to time func over several repetitions. Returns summary statistics in seconds."""
+
+    samples = []
+    items = None
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        items = func(state) if setup is not None else func()
+        samples.append(time.perf_counter() - start)
+
+    return {
+        "repeat": repeat,
+        "items": items,
+        "min_s": min(samples),
+        "mean_s": statistics.fmean(samples),
+        "median_s": statistics.median(samples),
+        "max_s": max(samples),
+    }
+
+
+def import_time(repeat: int) -> dict:
+    """Function to measure the import time of the package entry point in a fresh interpreter"""
+
+    def run_import():
+        out = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], capture_output=True, text=True, check=True)
+        return float(out.stdout)
+
+    samples = [run_import() for _ in range(repeat)]
+    return {
+        "repeat": repeat,
+        "items": 1,
+        "min_s": min(samples),
+        "mean_s": statistics.fmean(samples),
+        "median_s": statistics.median(samples),
+        "max_s": max(samples),
+    }
+
+
+def copy_vault(source: Path, target: Path) -> list[Path]:
+    """Function to (re)create a pristine copy of the generated vault"""
+
+    if target.exists():
+        shutil.rmtree(target)
+    shutil.copytree(source, target)
+    return sorted(target.glob("*.md"))
+
+
+def sync_vault(files: list[Path]) -> int:
+    """Function to run the full per-file sync, as done in example.py"""
+
+    for file in files:
+        nset = noteModule2.NoteSet.from_file(file)
+
+        nset.check_deck()
+        nset.check_notes()
+        nset.upload_new_notes()
+        nset.update_existing_notes()
+        nset.upload_media()
+        nset.save_file()
+
+    return len(files)
+
+
+def run(config: VaultConfig, repeat: int, port: int) -> dict:
+    """Function to generate a vault and benchmark every phase on it"""
+
+    workdir = Path(tempfile.mkdtemp(prefix="ankicli-bench-"))
+    source = workdir / "vault"
+    paths = generate_vault(source, config)
+
+    # images are looked up relative to the working directory
+    cwd = os.getcwd()
+    os.chdir(source)
+
+    try:
+        results = {"import": import_time(repeat)}
+
+        # # # frontmatter =====
+        def frontmatter():
+            for path in paths:
+                lines = parseModule.get_lines(path)
+                properties, _ = parseModule.extract_properties(lines)
+                metadata = parseModule.get_properties_metadata(properties)
+                parseModule.get_deck(metadata)
+                parseModule.get_tags(metadata)
+            return len(paths)
+
+        results["frontmatter"] = timed(frontmatter, repeat)
+
+        bodies = [parseModule.extract_properties(parseModule.get_lines(p))[1] for p in paths]
+
+        # # # grouping =====
+        def grouping():
+            for body in bodies:
+                parseModule.group_lines(body)
+            return len(bodies)
+
+        results["grouping"] = timed(grouping, repeat)
+
+        groups = [group for body in bodies for group in parseModule.group_lines(body)]
+
+        # # # parse_card (card parsing as done by NoteSet.from_file) =====
+        def parse_cards():
+            for group in groups:
+                parseModule.read_card(group)
+            return len(groups)
+
+        results["parse_card"] = timed(parse_cards, repeat)
+
+        cards = [parseModule.read_card(group) for group in groups]
+        sides = [side for card in cards if card.is_card for side in (card.front, card.back)]
+
+        # # # render =====
+        markdown = get_markdown()
+
+        def render():
+            for side in sides:
+                markdown(side)
+            im_list.clear()
+            return len(sides)
+
+        results["render"] = timed(render, repeat)
+
+        # # # assembly (full NoteSet construction from file, note store included) =====
+        def assembly():
+            for path in paths:
+                noteModule2.NoteSet.from_file(path)
+            im_list.clear()
+            return len(paths)
+
+        results["assembly"] = timed(assembly, repeat)
+
+        nsets = [noteModule2.NoteSet.from_file(path) for path in paths]
+        im_list.clear()
+
+        # # # insert_card_id =====
+        def insert_ids():
+            n = 0
+            for nset in nsets:
+                for id, i in enumerate(nset.notes.cards(), start=1):
+                    parseModule.replace_card_id(nset.notes.text[i], id, bool(nset.notes.inline[i]))
+                    n += 1
+            return n
+
+        results["insert_card_id"] = timed(insert_ids, repeat)
+
+        # # # save =====
+        def save(files):
+            for nset, file in zip(nsets, files):
+                nset.file_path = file
+                nset.save_file()
+            return len(nsets)
+
+        results["save"] = timed(save, repeat, setup=lambda: copy_vault(source, workdir / "save"))
+
+        # # # full sync against a local fake ankiConnect =====
+        requests_sent = []
+
+        def sync(files):
+            with FakeAnkiServer(port=port) as server:
+                os.environ["AnkiConnection"] = "0"
+                deckModule.registry.invalidate()
+                requestModule.cache.clear()
+                os.chdir(files[0].parent)
+                n = sync_vault(files)
+                requests_sent.append(dict(server.anki.calls))
+            im_list.clear()
+            return n
+
+        results["sync"] = timed(sync, repeat, setup=lambda: copy_vault(source, workdir / "sync"))
+        results["sync"]["requests"] = requests_sent[-1]
+
+        # # # vault-level sync (VaultSync) against a local fake ankiConnect =====
+        requests_sent = []
+
+        def vault_sync(files):
+            with FakeAnkiServer(port=port) as server:
+                os.environ["AnkiConnection"] = "0"
+                deckModule.registry.invalidate()
+                requestModule.cache.clear()
+                os.chdir(files[0].parent)
+                syncModule.VaultSync.from_directory(files[0].parent).run()
+                requests_sent.append(dict(server.anki.calls))
+            im_list.clear()
+            return len(files)
+
+        results["vault_sync"] = timed(vault_sync, repeat, setup=lambda: copy_vault(source, workdir / "sync"))
+        results["vault_sync"]["requests"] = requests_sent[-1]
+
+        # # # pipelined sync (SyncPipeline) against a local fake ankiConnect =====
+        requests_sent, stages, scheduling = [], [], []
+
+        def pipeline_sync(files):
+            with FakeAnkiServer(port=port) as server:
+                os.environ["AnkiConnection"] = "0"
+                deckModule.registry.invalidate()
+                requestModule.cache.clear()
+                requestModule.scheduler.reset_stats()
+                os.chdir(files[0].parent)
+                stages.append(pipelineModule.SyncPipeline(files[0].parent).run())
+                requests_sent.append(dict(server.anki.calls))
+                scheduling.append(requestModule.scheduler.stats())
+            im_list.clear()
+            return len(files)
+
+        results["pipeline_sync"] = timed(pipeline_sync, repeat, setup=lambda: copy_vault(source, workdir / "sync"))
+        results["pipeline_sync"]["requests"] = requests_sent[-1]
+        results["pipeline_sync"]["stages"] = stages[-1]
+        results["pipeline_sync"]["scheduler"] = scheduling[-1]
+
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "config": asdict(config),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=VaultConfig.files)
+    parser.add_argument("--cards", type=int, default=VaultConfig.cards_per_file)
+    parser.add_argument("--inline-ratio", type=float, default=VaultConfig.inline_ratio)
+    parser.add_argument("--mathjax", type=float, default=VaultConfig.mathjax_density)
+    parser.add_argument("--images", type=float, default=VaultConfig.image_density)
+    parser.add_argument("--seed", type=int, default=VaultConfig.seed)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765, help="port of the fake ankiConnect server")
+    parser.add_argument("--output", type=Path, default=None, help="json output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    config = VaultConfig(
+        files=args.files,
+        cards_per_file=args.cards,
+        inline_ratio=args.inline_ratio,
+        mathjax_density=args.mathjax,
+        image_density=args.images,
+        seed=args.seed,
+    )
+
+    # the library prints progress information: keep stdout clean for the json report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(config, args.repeat, args.port)
+
+    output = json.dumps(report, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        args.output.write_text(output + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""Module implementing a local, in-memory fake of the ankiConnect HTTP server used by the benchmark suite"""
+
+import itertools
+import json
+import re
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_VERSION = '{"apiVersion": "AnkiConnect v.6"}'
+DUPLICATE_ERROR = "cannot create note because it is a duplicate"
+MODELS = {
+    "Basic": ["Front", "Back"],
+    "Basic (and reversed card)": ["Front", "Back"],
+}
+
+
+def strip_html(text):
+    """Function to remove html tags from a field, as done by anki before checking for duplicates"""
+    return re.sub(r"<[^>]+>", "", text).strip()
+
+
+def split_query(query):
+    """Function to split an anki search into its terms, removing quotes but keeping backslash escapes"""
+
+    terms, term, quoted, escaped = [], "", False, False
+    for char in query:
+        if escaped:
+            term += char if char == '"' else "\\" + char
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char.isspace() and not quoted:
+            if term:
+                terms.append(term)
+            term = ""
+        else:
+            term += char
+
+    if term:
+        terms.append(term)
+    return terms
+
+
+def search_pattern(value):
+    """Function to translate an anki field search value into an exact-match regular expression"""
+
+    pattern, escaped = "", False
+    for char in value:
+        if escaped:
+            pattern += re.escape(char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == "*":
+            pattern += ".*"
+        elif char == "_":
+            pattern += "."
+        else:
+            pattern += re.escape(char)
+    return pattern
+
+
+class FakeAnki:
+    """In-memory collection answering the subset of ankiConnect actions used by ankicli"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1_700_000_000_000)
+        self.decks = {"Default": 1}
+        self.notes = {}
+        self.cards = {}
+        self.media = {}
+        self.calls = Counter()
+
+    # # # helpers =====
+    def _note_info(self, nid):
+        note = self.notes.get(nid)
+        if note is None:
+            return {}
+
+        fields = {
+            name: {"value": note["fields"].get(name, ""), "order": order}
+            for order, name in enumerate(MODELS[note["modelName"]])
+        }
+        return {
+            "noteId": nid,
+            "modelName": note["modelName"],
+            "tags": list(note["tags"]),
+            "fields": fields,
+            "cards": list(note["cards"]),
+            "mod": note["mod"],
+        }
+
+    def _is_duplicate(self, note):
+        # like anki, compare the first field stripped of its html
+        front = strip_html(note["fields"].get("Front", ""))
+        return any(
+            n["modelName"] == note["modelName"] and strip_html(n["fields"].get("Front", "")) == front
+            for n in self.notes.values()
+        )
+
+    def _can_add(self, note):
+        if note.get("deckName") not in self.decks:
+            return "deck was not found"
+        if note.get("modelName") not in MODELS:
+            return "model was not found"
+        if not note.get("fields", {}).get("Front"):
+            return "cannot create note because it is empty"
+        if self._is_duplicate(note):
+            return DUPLICATE_ERROR
+        return None
+
+    def _add(self, note):
+        if self._can_add(note) is not None:
+            return None
+
+        nid = next(self.ids)
+        n_cards = 2 if note["modelName"] == "Basic (and reversed card)" else 1
+        cards = [next(self.ids) for _ in range(n_cards)]
+        for cid in cards:
+            self.cards[cid] = {"note": nid, "deckName": note["deckName"]}
+
+        self.notes[nid] = {
+            "modelName": note["modelName"],
+            "fields": dict(note["fields"]),
+            "tags": list(note.get("tags", [])),
+            "cards": cards,
+            "mod": 0,
+        }
+        return nid
+
+    def _matches(self, nid, term):
+        note = self.notes[nid]
+
+        if term.startswith("-"):
+            return not self._matches(nid, term[1:])
+
+        key, sep, value = term.partition(":")
+        key = key.lower()
+
+        if sep and key == "deck":
+            # deck searches include subdecks
+            decks = {self.cards[cid]["deckName"] for cid in note["cards"]}
+            return any(re.fullmatch(search_pattern(value) + "(::.*)?", d, flags=re.I) for d in decks)
+        if sep and key == "note":
+            return re.fullmatch(search_pattern(value), note["modelName"], flags=re.I) is not None
+        if sep and key == "nid":
+            return str(nid) in value.split(",")
+        if sep and key in {"front", "back"}:
+            field = note["fields"].get(key.capitalize(), "")
+            return re.fullmatch(search_pattern(value), field, flags=re.S) is not None
+
+        return any(term.lower() in v.lower() for v in note["fields"].values())
+
+    def _find_notes(self, query):
+        terms = split_query(query)
+        return [nid for nid in self.notes if all(self._matches(nid, t) for t in terms)]
+
+    # # # actions =====
+    def action(self, action, params):
+        """Method to answer a single action. Returns the (result, error) pair."""
+
+        self.calls[action] += 1
+        handler = getattr(self, f"act_{action}", None)
+        if handler is None:
+            return None, f"unsupported action: {action}"
+
+        try:
+            return handler(**params), None
+        except Exception as er:
+            return None, str(er)
+
+    def act_version(self):
+        return 6
+
+    def act_multi(self, actions):
+        results = []
+        for a in actions:
+            result, error = self.action(a["action"], a.get("params", {}))
+            results.append({"result": result, "error": error})
+        return results
+
+    def act_deckNames(self):
+        return list(self.decks)
+
+    def act_deckNamesAndIds(self):
+        return dict(self.decks)
+
+    def act_createDeck(self, deck):
+        parts = deck.split("::")
+        for i in range(1, len(parts) + 1):
+            self.decks.setdefault("::".join(parts[:i]), next(self.ids))
+        return self.decks[deck]
+
+    def act_deleteDecks(self, decks, cardsToo=True):
+        # like ankiConnect, the subdecks and the cards of every deck are deleted with it
+        if not cardsToo:
+            raise Exception("Since Anki 2.1.28 it's not possible to delete decks without deleting cards as well")
+
+        deleted = {d for d in self.decks for deck in decks if d == deck or d.startswith(deck + "::")}
+        for deck in deleted:
+            self.decks.pop(deck)
+        cards = {cid for cid, card in self.cards.items() if card["deckName"] in deleted}
+        self.act_deleteNotes([nid for nid, note in self.notes.items() if cards.intersection(note["cards"])])
+
+    def act_getDeckStats(self, decks):
+        stats = {}
+        for deck in decks:
+            total = sum(1 for c in self.cards.values() if c["deckName"] == deck)
+            stats[str(self.decks[deck])] = {"name": deck, "total_in_deck": total}
+        return stats
+
+    def act_modelNames(self):
+        return list(MODELS)
+
+    def act_modelFieldNames(self, modelName):
+        return list(MODELS[modelName])
+
+    def act_notesInfo(self, notes):
+        return [self._note_info(nid) for nid in notes]
+
+    def act_canAddNotesWithErrorDetail(self, notes):
+        results = []
+        for note in notes:
+            error = self._can_add(note)
+            results.append({"canAdd": True} if error is None else {"canAdd": False, "error": error})
+        return results
+
+    def act_addNote(self, note):
+        error = self._can_add(note)
+        if error is not None:
+            raise Exception(error)
+        return self._add(note)
+
+    def act_addNotes(self, notes):
+        return [self._add(note) for note in notes]
+
+    def act_updateNote(self, note):
+        self.act_updateNoteFields(note)
+        if "tags" in note:
+            self.notes[note["id"]]["tags"] = list(note["tags"])
+
+    def act_updateNoteFields(self, note):
+        stored = self.notes.get(note["id"])
+        if stored is None:
+            raise Exception(f"Note was not found: {note['id']}")
+        stored["fields"].update(note.get("fields", {}))
+        stored["mod"] += 1
+
+    def act_addTags(self, notes, tags):
+        for nid in notes:
+            stored = self.notes[nid]["tags"]
+            stored.extend(t for t in tags.split() if t.casefold() not in {s.casefold() for s in stored})
+            self.notes[nid]["mod"] += 1
+
+    def act_removeTags(self, notes, tags):
+        removed = {t.casefold() for t in tags.split()}
+        for nid in notes:
+            self.notes[nid]["tags"] = [t for t in self.notes[nid]["tags"] if t.casefold() not in removed]
+            self.notes[nid]["mod"] += 1
+
+    def act_notesModTime(self, notes):
+        # like ankiConnect, a missing note makes the whole action fail
+        for nid in notes:
+            if nid not in self.notes:
+                raise Exception(f"Note was not found: {nid}")
+        return [{"noteId": nid, "mod": self.notes[nid]["mod"]} for nid in notes]
+
+    def act_findNotes(self, query):
+        return self._find_notes(query)
+
+    def act_getDecks(self, cards):
+        decks = {}
+        for cid in cards:
+            if cid in self.cards:
+                decks.setdefault(self.cards[cid]["deckName"], []).append(cid)
+        return decks
+
+    def act_changeDeck(self, cards, deck):
+        self.act_createDeck(deck)
+        for cid in cards:
+            self.cards[cid]["deckName"] = deck
+
+    def act_deleteNotes(self, notes):
+        for nid in notes:
+            note = self.notes.pop(nid, None)
+            for cid in note["cards"] if note else []:
+                self.cards.pop(cid, None)
+
+    def act_storeMediaFile(self, filename, data=None, path=None, url=None):
+        self.media[filename] = data if data is not None else path
+        return filename
+
+
+class FakeAnkiHandler(BaseHTTPRequestHandler):
+    """Request handler mimicking the ankiConnect http server"""
+
+    def _respond(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        if not body:
+            payload = API_VERSION
+        else:
+            request = json.loads(body)
+            with self.server.anki.lock:
+                result, error = self.server.anki.action(request["action"], request.get("params", {}))
+            payload = json.dumps({"result": result, "error": error})
+
+        data = payload.encode("utf-8")
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client stopped waiting (request timeout)
+            pass
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeAnkiServer:
+    """Context manager running a FakeAnki instance behind a local http server in a background thread"""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.anki = FakeAnki()
+        self.httpd = ThreadingHTTPServer((host, port), FakeAnkiHandler)
+        self.httpd.anki = self.anki
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
@@ -0,0 +1,122 @@
+"""Module to generate synthetic vaults (markdown files, images) for the benchmark suite"""
+
+import random
+import struct
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass
+class VaultConfig:
+    """Parameters describing the shape of a synthetic vault"""
+
+    files: int = 20
+    cards_per_file: int = 50
+    inline_ratio: float = 0.5
+    mathjax_density: float = 0.2
+    image_density: float = 0.05
+    images: int = 5
+    seed: int = 0
+
+
+WORDS = (
+    "capital river mountain theorem integral protein enzyme orbit vector matrix "
+    "language empire treaty element crystal neuron market climate signal circuit"
+).split()
+
+INLINE_MATH = ["$x^2$", "$\\frac{a}{b}$", "$e^{i\\pi} + 1 = 0$", "$\\sum_{k=0}^{n} k$"]
+BLOCK_MATH = ["$$\\int_0^1 x \\, dx$$", "$$a^2 + b^2 = c^2$$"]
+
+
+def png_bytes(width: int = 4, height: int = 4) -> bytes:
+    """Function to build a tiny valid png image without external dependencies"""
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    raw = b"".join(b"\x00" + b"\x80\x40\x20" * width for _ in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw))
+        + chunk(b"IEND", b"")
+    )
+
+
+def sentence(rng: random.Random, n: int) -> str:
+    """Function to build a random sentence of n words"""
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def decorate(text: str, rng: random.Random, config: VaultConfig, block: bool) -> str:
+    """Function to randomly add mathjax expressions and images to a card side"""
+
+    if rng.random() < config.mathjax_density:
+        if block and rng.random() < 0.5:
+            text = f"{text} {rng.choice(BLOCK_MATH)}"
+        else:
+            text = f"{text} {rng.choice(INLINE_MATH)}"
+
+    if config.images and rng.random() < config.image_density:
+        text = f"{text} ![[image{rng.randrange(config.images)}.png]]"
+
+    return text
+
+
+def card_lines(index: int, rng: random.Random, config: VaultConfig) -> list[str]:
+    """Function to build the lines of a single card, either inline or block formatted"""
+
+    question = decorate(f"Question {index} about {sentence(rng, 6)}?", rng, config, False)
+
+    if rng.random() < config.inline_ratio:
+        separator = ":::" if rng.random() < 0.2 else "::"
+        answer = decorate(sentence(rng, 4), rng, config, False)
+        return [f">{question} {separator} {answer}\n"]
+
+    answers = [decorate(sentence(rng, 8), rng, config, True) for _ in range(rng.randint(1, 3))]
+    return [f">[!question]- {question} #card\n"] + [f">{a}\n" for a in answers] + ["\n"]
+
+
+def file_lines(index: int, rng: random.Random, config: VaultConfig) -> list[str]:
+    """Function to build all the lines of a single vault file, frontmatter included"""
+
+    lines = [
+        "---\n",
+        f"deck: Benchmark::Deck {index % 10}\n",
+        f"tags: [benchmark, file{index}]\n",
+        "---\n",
+        "\n",
+        f"# Generated file {index}\n",
+        "\n",
+    ]
+
+    for card in range(config.cards_per_file):
+        lines.extend(card_lines(index * config.cards_per_file + card, rng, config))
+
+    return lines
+
+
+def generate_vault(directory: Path, config: VaultConfig) -> list[Path]:
+    """Function to write a synthetic vault to the given directory. Returns the paths of the generated files."""
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(config.seed)
+
+    # write the images first, so that the renderer can find them while parsing
+    image = png_bytes()
+    for i in range(config.images):
+        (directory / f"image{i}.png").write_bytes(image)
+
+    paths = []
+    for i in range(config.files):
+        path = directory / f"file{i:05d}.md"
+        with open(path, mode="w", encoding="utf-8") as f:
+            f.writelines(file_lines(i, rng, config))
+        paths.append(path)
+
+    return paths
@@ -1,23 +1,20 @@
+import sys
 from pathlib import Path
-from ankicli import noteModule2
+from ankicli.syncModule import VaultSync
+from ankicli.watchModule import VaultWatcher
 
 
 def main():
     directory = Path(r"./vault")
 
-    if not directory.exists() or not directory.is_dir():
-        raise ValueError(f"Directory {directory} does not exist or is not a directory.")
+    # with --watch, sync the vault then every file as it is saved, until Ctrl+C
+    if "--watch" in sys.argv:
+        VaultWatcher(directory).watch()
+        return
 
-    for file in directory.glob("*.md"):
-        print(file)
-        nset = noteModule2.NoteSet.from_file(file)
-
-        nset.check_deck()
-        nset.check_notes()
-        nset.upload_new_notes()
-        nset.update_existing_notes()
-        nset.upload_media()
-        nset.save_file()
+    # parse every file of the vault, then sync them all at once
+    vault = VaultSync.from_directory(directory)
+    vault.run()
 
 if __name__ == "__main__":
     main()
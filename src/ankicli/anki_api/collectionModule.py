@@ -0,0 +1,149 @@
+import json
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+from urllib.parse import quote
+
+from ankicli.anki_api.requestModule import CHUNK_SIZE, chunks
+from ankicli.anki_api.snapshotModule import RemoteSnapshot
+from ankicli.logModule import get_logger
+
+"""Module to read the notes of a local anki collection (collection.anki2) directly, without going through ankiConnect"""
+
+# set up logger
+logger = get_logger(__name__)
+
+
+class CollectionReader:
+    """Read-only access to a local anki collection file.
+
+    The collection is opened with immutable=1, so sqlite neither locks it nor writes to it; with copy=True it is
+    first copied (with its write-ahead log) to a temporary directory, which is safer while anki is running.
+    Notes are read with bulk queries and returned as a RemoteSnapshot, so the checks and the diff of the sync can run
+    at database speed while writes still go through ankiConnect.
+
+    Both the legacy schema (models and decks stored as json in the col table) and the newer one (notetypes, fields and
+    decks tables) are supported."""
+
+    def __init__(self, path, copy: bool = False):
+        self.path = Path(path)
+        self.tmpdir = None
+
+        if copy:
+            self.tmpdir = tempfile.TemporaryDirectory()
+            target = Path(self.tmpdir.name) / self.path.name
+            shutil.copy2(self.path, target)
+            wal = self.path.with_name(self.path.name + "-wal")
+            if wal.exists():
+                shutil.copy2(wal, target.with_name(target.name + "-wal"))
+            self.con = sqlite3.connect(target)
+        else:
+            self.con = sqlite3.connect(f"file:{quote(self.path.resolve().as_posix())}?mode=ro&immutable=1", uri=True)
+
+        self.models = self.load_models()
+        self.decks = self.load_decks()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self.con.close()
+        if self.tmpdir is not None:
+            self.tmpdir.cleanup()
+
+    def has_table(self, name: str) -> bool:
+        """Method to check that a table exists in the collection"""
+
+        query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+        return self.con.execute(query, (name,)).fetchone() is not None
+
+    def load_models(self) -> dict[int, tuple[str, list[str]]]:
+        """Method returning the note models of the collection, as {model id: (name, [field names])}"""
+
+        if self.has_table("notetypes"):
+            models = {id: (name, []) for id, name in self.con.execute("SELECT id, name FROM notetypes")}
+            for ntid, name in self.con.execute("SELECT ntid, name FROM fields ORDER BY ntid, ord"):
+                models[ntid][1].append(name)
+            return models
+
+        (models,) = self.con.execute("SELECT models FROM col").fetchone()
+        return {
+            int(id): (model["name"], [field["name"] for field in sorted(model["flds"], key=lambda f: f["ord"])])
+            for id, model in json.loads(models).items()
+        }
+
+    def load_decks(self) -> dict[int, str]:
+        """Method returning the decks of the collection, as {deck id: deck name}"""
+
+        if self.has_table("decks"):
+            # the newer schema separates the levels of a deck name with \x1f
+            return {id: name.replace("\x1f", "::") for id, name in self.con.execute("SELECT id, name FROM decks")}
+
+        (decks,) = self.con.execute("SELECT decks FROM col").fetchone()
+        return {int(id): deck["name"] for id, deck in json.loads(decks).items()}
+
+    def note_ids(self) -> list[int]:
+        """Method returning the ids of every note of the collection"""
+        return [id for (id,) in self.con.execute("SELECT id FROM notes ORDER BY id")]
+
+    def mod_times(self, ids=None) -> dict[int, int]:
+        """Method returning the modification time of the given notes (every note if None), as {note id: mod}"""
+
+        if ids is None:
+            return dict(self.con.execute("SELECT id, mod FROM notes"))
+
+        mods = {}
+        for chunk in chunks(list(ids), CHUNK_SIZE):
+            query = f"SELECT id, mod FROM notes WHERE id IN ({','.join('?' * len(chunk))})"
+            mods.update(self.con.execute(query, chunk))
+
+        return mods
+
+    def notes_info(self, ids) -> tuple[list[dict], dict[int, str]]:
+        """Method returning the notes with the given ids in the format of the ankiConnect notesInfo action (an empty
+        dictionary for the notes that don't exist), and the {card id: deck name} of their cards"""
+
+        ids = list(ids)
+        infos, card_decks = {}, {}
+
+        for chunk in chunks(ids, CHUNK_SIZE):
+            marks = ",".join("?" * len(chunk))
+
+            for id, mid, mod, tags, flds in self.con.execute(
+                f"SELECT id, mid, mod, tags, flds FROM notes WHERE id IN ({marks})", chunk
+            ):
+                name, fields = self.models.get(mid, (None, []))
+                values = zip(fields, flds.split("\x1f"))
+                infos[id] = {
+                    "noteId": id,
+                    "modelName": name,
+                    "tags": tags.split(),
+                    "fields": {field: {"value": value, "order": n} for n, (field, value) in enumerate(values)},
+                    "cards": [],
+                    "mod": mod,
+                }
+
+            for cid, nid, did in self.con.execute(
+                f"SELECT id, nid, did FROM cards WHERE nid IN ({marks}) ORDER BY nid, ord", chunk
+            ):
+                infos[nid]["cards"].append(cid)
+                card_decks[cid] = self.decks.get(did)
+
+        return [infos.get(id, {}) for id in ids], card_decks
+
+    def snapshot(self, ids) -> RemoteSnapshot:
+        """Method returning a RemoteSnapshot of the notes with the given ids, read from the collection"""
+
+        ids = list(dict.fromkeys(ids))
+        infos, card_decks = self.notes_info(ids)
+
+        snapshot = RemoteSnapshot()
+        snapshot.add_notes(ids, infos)
+        snapshot.card_decks.update(card_decks)
+
+        logger.debug(f"Read {len(ids)} notes from the collection {self.path}")
+        return snapshot
@@ -2,16 +2,111 @@ from ankicli.anki_api import requestModule
 
 """Module to handle deck-related requests, like deck creation, deletion, etc"""
 
+# error of ankiConnect when a note is added to a deck that does not exist
+DECK_NOT_FOUND = "deck was not found"
+
+
+def deck_hierarchy(name: str) -> list[str]:
+    """Function returning a deck name preceded by the names of all its parent decks, e.g. for 'A::B::C':
+    ['A', 'A::B', 'A::B::C']"""
+
+    parts = name.split("::")
+    return ["::".join(parts[: i + 1]) for i in range(len(parts))]
+
+
+class DeckRegistry:
+    """Session cache of the decks of the current anki user.
+
+    Deck names and ids are downloaded once (with a single deckNamesAndIds request) and membership checks are answered
+    from memory. The registry is updated when decks are created or deleted through it.
+    The decks of every ankiConnect server are kept apart: the registry answers for the server of the current thread
+    (see requestModule.use_endpoint)."""
+
+    def __init__(self):
+        self.servers = {}
+
+    @property
+    def decks(self) -> dict[str, int] | None:
+        return self.servers.get(requestModule.current_url())
+
+    @decks.setter
+    def decks(self, decks: dict[str, int] | None) -> None:
+        self.servers[requestModule.current_url()] = decks
+
+    def load(self, force=False) -> dict[str, int]:
+        """Method returning the {deck name: deck id} dictionary, downloading it if needed (or if force is True)"""
+
+        if self.decks is None or force:
+            self.decks = dict(requestModule.request_action("deckNamesAndIds")["result"])
+
+        return self.decks
+
+    def invalidate(self) -> None:
+        """Method to drop the cached decks (of every server), they will be downloaded again from anki on next use"""
+
+        self.servers = {}
+        requestModule.cache.discard(requestModule.DECK_READS)
+
+    def exists(self, name: str) -> bool:
+        """Method to check if a deck exists"""
+        return name in self.load()
+
+    def deck_id(self, name: str) -> int | None:
+        """Method returning the id of a deck, None if the deck does not exist"""
+        return self.load().get(name)
+
+    def missing(self, names) -> list[str]:
+        """Method returning the decks (parent decks included) that have to be created for all the given decks to
+        exist. Parents come before their children."""
+
+        decks = self.load()
+        missing = {deck for name in names for deck in deck_hierarchy(name) if deck not in decks}
+
+        return sorted(missing, key=lambda deck: (deck.count("::"), deck))
+
+    def ensure(self, names) -> list[str]:
+        """Method to make sure that all the given decks exist, creating the missing ones (and their parents) with a
+        single batched request. Returns the names of the created decks."""
+
+        missing = self.missing(names)
+
+        if missing:
+            results = requestModule.request_multi(
+                [requestModule.make_action("createDeck", deck=deck) for deck in missing]
+            )
+
+            for deck, result in zip(missing, results):
+                if result["error"] is None:
+                    self.decks[deck] = result["result"]
+                else:
+                    print(f"Creation of deck '{deck}' unsuccessful. Exception raised: {result['error']}")
+
+        return missing
+
+    def add(self, name: str, id: int) -> None:
+        """Method to register a newly created deck (and its parents, created by anki along with it)"""
+
+        decks = self.load()
+        for deck in deck_hierarchy(name)[:-1]:
+            decks.setdefault(deck, None)
+        decks[name] = id
+
+    def discard(self, name: str) -> None:
+        """Method to unregister a deleted deck, along with its subdecks"""
+
+        decks = self.load()
+        for deck in [d for d in decks if d == name or d.startswith(name + "::")]:
+            del decks[deck]
+
+
+# deck registry shared by the whole session
+registry = DeckRegistry()
+
 
 @requestModule.ensure_connectivity
 def deck_exists(name):
     """Low level function to check if a deck already exists for the current anki user"""
-    deck_names = requestModule.request_action("deckNames")["result"]
-
-    if name in deck_names:
-        return True
-    else:
-        return False
+    return registry.exists(name)
 
 
 @requestModule.ensure_connectivity
@@ -44,9 +139,17 @@ def create_deck(name):
     if result is None:
         print("Deck creation unsuccessful.")
     else:
+        registry.add(name, result)
         print(f"Deck creation successful. Deck ID: {result}")
 
 
+@requestModule.ensure_connectivity
+def ensure_decks(names):
+    """Function to make sure that all the given decks (and their parents) exist, creating the missing ones in a single
+    batched request"""
+    return registry.ensure(names)
+
+
 @requestModule.ensure_connectivity
 def delete_deck(name, force=False):
     """Function to delete a deck for the current user"""
@@ -63,3 +166,4 @@ def delete_deck(name, force=False):
         )
     else:
         requestModule.request_action("deleteDecks", decks=[name], cardsToo=True)
+        registry.discard(name)
@@ -0,0 +1,188 @@
+import base64
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+
+from ankicli.anki_api.requestModule import bind_context, current_url, make_action, request_body, request_multi
+from ankicli.logModule import get_logger
+
+"""Module uploading media files to anki, by path (local anki) or as base64 data (remote anki, e.g. through an ssh
+tunnel or in a container)"""
+
+# set up logger
+logger = get_logger(__name__)
+
+# bytes read from a file at a time while it is encoded (a multiple of 3, so that the chunks encode without padding)
+CHUNK_BYTES = 3 * 2**16
+
+# files up to SMALL_FILE bytes are encoded in memory and sent together, up to MULTI_BYTES bytes per multi request
+SMALL_FILE = 2**18
+MULTI_BYTES = 2**22
+
+# number of uploads sent in parallel
+MEDIA_WORKERS = 4
+
+# hosts of the ankiConnect servers sharing the filesystem of ankicli
+LOCAL_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+
+def is_local(url: str) -> bool:
+    """Function to check whether an ankiConnect server runs on this machine (and can read the media by path)"""
+    return urlparse(url).hostname in LOCAL_HOSTS
+
+
+def encoded_size(size: int) -> int:
+    """Function returning the length of the base64 encoding of size bytes"""
+    return 4 * ((size + 2) // 3)
+
+
+def encode_file(path) -> str:
+    """Function returning the base64 encoding of a (small) file"""
+    return base64.b64encode(Path(path).read_bytes()).decode("ascii")
+
+
+class MediaBody:
+    """File-like body of a storeMediaFile request in the data form. The file is base64-encoded chunk by chunk while the
+    body is read (i.e. while it is sent), so at most CHUNK_BYTES of it are held in memory whatever its size.
+
+    The length of the body is known in advance (see encoded_size), so the request is sent with a Content-Length, as
+    ankiConnect expects."""
+
+    def __init__(self, filename: str, path, chunk_size: int = CHUNK_BYTES):
+        if chunk_size % 3:
+            raise ValueError(f"The chunk size must be a multiple of 3, got {chunk_size}.")
+
+        self.path = Path(path)
+        self.chunk_size = chunk_size
+
+        # the json of the request, split around the (empty) data string
+        request = json.dumps(make_action("storeMediaFile", filename=filename, data=""))
+        head, tail = request.rsplit('""', 1)
+        self.head, self.tail = (head + '"').encode(), ('"' + tail).encode()
+        self.length = len(self.head) + encoded_size(self.path.stat().st_size) + len(self.tail)
+
+        self.parts = self.generate()
+        self.buffer = b""
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self):
+        while chunk := self.read(self.chunk_size):
+            yield chunk
+
+    def generate(self):
+        """Generator yielding the parts of the body: the json head, the encoded chunks of the file and the json tail"""
+
+        yield self.head
+        with open(self.path, mode="rb") as f:
+            while chunk := f.read(self.chunk_size):
+                yield base64.b64encode(chunk)
+        yield self.tail
+
+    def read(self, size: int = -1) -> bytes:
+        """Method returning the next size bytes of the body (the rest of it without size)"""
+
+        while size < 0 or len(self.buffer) < size:
+            part = next(self.parts, None)
+            if part is None:
+                break
+            self.buffer += part
+
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class MediaUploader:
+    """Uploader of media files to the ankiConnect server of the thread (see requestModule.use_endpoint).
+
+    A local anki reads the files by path, with a single multi request. A remote one receives them as base64 data: the
+    small files are encoded in memory and grouped in multi requests of at most multi_bytes, the large ones are streamed
+    one per request (see MediaBody). The requests are sent by a pool of workers, so that memory holds at most workers
+    requests and remote uploads are bounded by the bandwidth, not by the encoding."""
+
+    def __init__(
+        self,
+        data: bool | None = None,
+        workers: int = MEDIA_WORKERS,
+        small_file: int = SMALL_FILE,
+        multi_bytes: int = MULTI_BYTES,
+    ):
+        # None: data form for the servers that are not local
+        self.data = data
+        self.workers = workers
+        self.small_file = small_file
+        self.multi_bytes = multi_bytes
+
+    def groups(self, files: dict[str, Path]) -> tuple[list[list[str]], list[str]]:
+        """Method splitting the files into groups of small files (sent together) and large files (streamed)"""
+
+        groups, large = [], []
+        group, group_bytes = [], 0
+        for name, path in files.items():
+            size = path.stat().st_size
+            if size > self.small_file:
+                large.append(name)
+                continue
+
+            if group and group_bytes + size > self.multi_bytes:
+                groups.append(group)
+                group, group_bytes = [], 0
+            group.append(name)
+            group_bytes += size
+
+        if group:
+            groups.append(group)
+
+        return groups, large
+
+    @staticmethod
+    def send_group(names: list[str], files: dict[str, Path]) -> list[str]:
+        """Method to send a group of small files with a multi request, returning the names of the failed uploads"""
+
+        actions = [make_action("storeMediaFile", filename=name, data=encode_file(files[name])) for name in names]
+        results = request_multi(actions)
+        return [name for name, result in zip(names, results) if result is None or result["error"] is not None]
+
+    @staticmethod
+    def send_large(name: str, path: Path) -> list[str]:
+        """Method to stream a large file, returning its name if the upload failed"""
+
+        response = request_body("storeMediaFile", MediaBody(name, path))
+        return [name] if response is None or response["error"] is not None else []
+
+    def upload(self, files: dict[str, Path]) -> list[str]:
+        """Method to upload media files, given as {filename: path}. Returns the names of the files that could not be
+        uploaded."""
+
+        files = {name: Path(path) for name, path in files.items()}
+        if not files:
+            return []
+
+        data = not is_local(current_url()) if self.data is None else self.data
+        if not data:
+            paths = {name: str(path.absolute()) for name, path in files.items()}
+            results = request_multi([make_action("storeMediaFile", filename=name, path=paths[name]) for name in paths])
+            failed = [name for name, result in zip(files, results) if result is None or result["error"] is not None]
+        else:
+            groups, large = self.groups(files)
+            logger.debug(f"Uploading {len(files)} media files: {len(groups)} multi requests, {len(large)} streamed")
+
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(bind_context(self.send_group), group, files) for group in groups]
+                futures += [pool.submit(bind_context(self.send_large), name, files[name]) for name in large]
+                failed = [name for future in futures for name in future.result()]
+
+        for name in failed:
+            logger.warning(f"Upload of media file {name} failed")
+
+        return failed
+
+
+def store_media(files: dict, data: bool | None = None, **kwargs) -> list[str]:
+    """Function to upload media files, given as {filename: path}, to the server of the thread (see MediaUploader).
+    Returns the names of the files that could not be uploaded."""
+    return MediaUploader(data=data, **kwargs).upload(files)
@@ -1,43 +1,360 @@
+import contextlib
+import copy
+import heapq
+import itertools
 import json
 import os
+import threading
 import time
 
-import requests
-
-"""Module containing low-level request handlers for the ankiConnect HTTP server"""
+"""Module containing low-level request handlers for the ankiConnect HTTP server.
+The requests library is imported on the first request, not at module load."""
 
 localhost = "http://127.0.0.1"
 PORT = "8765"
 link = localhost + ":" + PORT
 
+# per-thread context of the requests: endpoint (url) and deadline
+context = threading.local()
+
+
+def current_url() -> str:
+    """Function returning the url of the ankiConnect server the requests of this thread go to (see use_endpoint)"""
+    return getattr(context, "url", link)
+
+
+@contextlib.contextmanager
+def use_endpoint(url: str):
+    """Context manager sending the requests of this thread (made without an explicit url) to another ankiConnect
+    server, e.g. another anki instance or profile"""
+
+    previous = current_url()
+    context.url = url
+    try:
+        yield url
+    finally:
+        context.url = previous
+
+
+def bind_context(func):
+    """Function wrapping func so that it runs with the endpoint and deadline of the calling thread, e.g. when it is
+    submitted to a pool of worker threads"""
+
+    url, deadline = current_url(), current_deadline()
+
+    def wrapper(*args, **kwargs):
+        previous = current_url(), current_deadline()
+        context.url, context.deadline = url, deadline
+        try:
+            return func(*args, **kwargs)
+        finally:
+            context.url, context.deadline = previous
+
+    return wrapper
+
+
+# # # timeouts =====
+# seconds allowed to open the connection, and to wait for the answer of a request
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 30
+
+# read timeouts of the actions that can take long on large collections or batches
+READ_TIMEOUTS = {
+    "multi": 300,
+    "addNotes": 300,
+    "deleteNotes": 300,
+    "notesInfo": 120,
+    "findNotes": 120,
+    "canAddNotesWithErrorDetail": 120,
+    "storeMediaFile": 120,
+}
+
+# read timeout of the connection check
+CHECK_TIMEOUT = 5
+
+
+class RequestTimeout(TimeoutError):
+    """Raised when ankiConnect does not answer a request in time (e.g. anki is blocked on a dialog)"""
+
+
+class DeadlineExceeded(RequestTimeout):
+    """Raised when the time given to a whole operation (see Deadline) runs out"""
+
+
+class Deadline:
+    """Time limit of a whole operation, e.g. a sync. While a Deadline is active (used as a context manager), the
+    timeouts of every request are cut to the remaining time, and no request is sent once it has passed."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.end = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Method returning the seconds left before the deadline"""
+        return self.end - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, what: str = "operation") -> None:
+        """Method raising DeadlineExceeded if the deadline has passed"""
+
+        if self.expired():
+            raise DeadlineExceeded(f"The {what} did not complete within {self.seconds} seconds")
+
+    def __enter__(self):
+        self.previous, context.deadline = current_deadline(), self
+        return self
+
+    def __exit__(self, *exc):
+        context.deadline = self.previous
+
+
+def current_deadline() -> Deadline | None:
+    """Function returning the deadline of the operation running in this thread, if any"""
+    return getattr(context, "deadline", None)
+
+
+def request_timeout(action) -> tuple[float, float]:
+    """Function returning the (connect, read) timeouts of an action, cut to the time left before the active deadline"""
+
+    connect, read = CONNECT_TIMEOUT, READ_TIMEOUTS.get(action, READ_TIMEOUT)
+
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.check(f"request '{action}'")
+        remaining = deadline.remaining()
+        connect, read = min(connect, remaining), min(read, remaining)
+
+    return connect, read
+
+
+# # # scheduler =====
+# priorities of the requests, lower first
+INTERACTIVE, BULK, MEDIA = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk", MEDIA: "media"}
+
+# actions sending or reading many notes at once, and media actions
+BULK_ACTIONS = {"addNotes", "deleteNotes", "notesInfo", "notesModTime", "canAddNotesWithErrorDetail", "changeDeck"}
+MEDIA_ACTIONS = {"storeMediaFile", "retrieveMediaFile"}
+
+# largest multi request still treated as interactive
+SMALL_MULTI = 10
+
+
+def request_priority(action, params: dict | None = None) -> int:
+    """Function returning the scheduling priority of a request: media uploads last, bulk reads and writes (and large
+    multi requests) after the small, interactive ones"""
+
+    if action == "multi":
+        actions = (params or {}).get("actions", [])
+        if any(a["action"] in MEDIA_ACTIONS for a in actions):
+            return MEDIA
+        if len(actions) > SMALL_MULTI or any(a["action"] in BULK_ACTIONS for a in actions):
+            return BULK
+        return INTERACTIVE
+
+    if action in MEDIA_ACTIONS:
+        return MEDIA
+    return BULK if action in BULK_ACTIONS else INTERACTIVE
+
+
+class RequestScheduler:
+    """Scheduler of the requests sent to ankiConnect, to keep anki responsive during large syncs.
+
+    A request is sent once a slot is free (at most max_in_flight requests at a time, None for no limit) and a token is
+    available (token bucket of burst tokens refilled at rate per second, None for no limit). Waiting requests are
+    served by priority (see request_priority), then in order of arrival. Waiting stops with DeadlineExceeded if the
+    active Deadline passes. The number of waiting requests and the time they waited are recorded per priority."""
+
+    def __init__(self, rate: float | None = None, burst: int = 10, max_in_flight: int | None = 4):
+        self.cond = threading.Condition()
+        self.waiting = []
+        self.order = itertools.count()
+        self.in_flight = 0
+        self.configure(rate, burst, max_in_flight)
+        self.reset_stats()
+
+    def configure(self, rate: float | None = None, burst: int = 10, max_in_flight: int | None = 4) -> None:
+        """Method to change the limits of the scheduler"""
+
+        with self.cond:
+            self.rate = rate
+            self.burst = burst
+            self.max_in_flight = max_in_flight
+            self.tokens = float(burst)
+            self.refilled = time.monotonic()
+            self.cond.notify_all()
+
+    def reset_stats(self) -> None:
+        with self.cond:
+            self.requests = {name: 0 for name in PRIORITY_NAMES.values()}
+            self.wait_time = {name: 0.0 for name in PRIORITY_NAMES.values()}
+            self.max_wait = {name: 0.0 for name in PRIORITY_NAMES.values()}
+            self.max_depth = 0
+
+    def refill(self) -> None:
+        """Method to add the tokens earned since the last refill"""
+
+        now = time.monotonic()
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def next_wait(self, ticket) -> float | None:
+        """Method returning 0 if the request holding ticket can be sent now, else how long to wait (None: until
+        notified)"""
+
+        if self.waiting[0] != ticket:
+            return None
+        if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+            return None
+
+        self.refill()
+        if self.rate is not None and self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        return 0
+
+    def acquire(self, priority: int = INTERACTIVE) -> None:
+        """Method waiting for the turn of a request of the given priority"""
+
+        start = time.monotonic()
+        with self.cond:
+            ticket = (priority, next(self.order))
+            heapq.heappush(self.waiting, ticket)
+            self.max_depth = max(self.max_depth, len(self.waiting))
+
+            deadline = current_deadline()
+            try:
+                while (wait := self.next_wait(ticket)) != 0:
+                    if deadline is not None:
+                        deadline.check("wait for a request slot")
+                        wait = deadline.remaining() if wait is None else min(wait, deadline.remaining())
+                    self.cond.wait(timeout=wait)
+            except DeadlineExceeded:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.cond.notify_all()
+                raise
+
+            heapq.heappop(self.waiting)
+            self.in_flight += 1
+            if self.rate is not None:
+                self.tokens -= 1
+
+            # the next request in line may be able to go too
+            self.cond.notify_all()
+
+            name = PRIORITY_NAMES[priority]
+            waited = time.monotonic() - start
+            self.requests[name] += 1
+            self.wait_time[name] += waited
+            self.max_wait[name] = max(self.max_wait[name], waited)
+
+    def release(self) -> None:
+        """Method to free the slot of a completed request"""
+
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, action, params: dict | None = None):
+        """Context manager holding a slot for the duration of a request"""
+
+        self.acquire(request_priority(action, params))
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        """Method returning the metrics of the scheduler: current and maximum queue depth, requests in flight, and
+        number of requests, total and maximum wait time per priority"""
+
+        with self.cond:
+            return {
+                "depth": len(self.waiting),
+                "max_depth": self.max_depth,
+                "in_flight": self.in_flight,
+                "priorities": {
+                    name: {
+                        "requests": self.requests[name],
+                        "wait": round(self.wait_time[name], 4),
+                        "max_wait": round(self.max_wait[name], 4),
+                    }
+                    for name in PRIORITY_NAMES.values()
+                },
+            }
+
+
+# request scheduler of the default server, shared by the whole session, and of the other servers
+scheduler = RequestScheduler()
+schedulers = {link: scheduler}
+schedulers_lock = threading.Lock()
+
+
+def get_scheduler(url: str) -> RequestScheduler:
+    """Function returning the scheduler of the requests sent to a server (each anki instance has its own limits)"""
+
+    with schedulers_lock:
+        if url not in schedulers:
+            schedulers[url] = RequestScheduler(scheduler.rate, scheduler.burst, scheduler.max_in_flight)
+        return schedulers[url]
+
 
-def check_connection(url=link):
-    """Low level function to check connection to ankiConnect server"""
+# time of the last successful connection check of the servers other than the default one
+connection_checks = {}
+
+
+def check_connection(url=None):
+    """Low level function to check connection to ankiConnect server. Raises RequestTimeout if the server does not
+    answer in time, as the other requests do."""
+
+    url = current_url() if url is None else url
 
     # adds a check to the environment variable AnkiConnection to see if the connection has been checked in the last ten
     # seconds. If it is, assume it is still open and return True without further checks. This is done to avoid calling
     # the function 100 times in a matter of seconds when uploading a large amount of cards.
-    if time.time() - float(os.environ.get("AnkiConnection", "0")) < 10:
+    # The checks of the other servers are kept in connection_checks.
+    last_check = os.environ.get("AnkiConnection", "0") if url == link else connection_checks.get(url, "0")
+    if time.time() - float(last_check) < 10:
         return True
 
+    import requests
+
+    # the check gets the time left before the active deadline, like any other request
+    connect, read = request_timeout("version")
+    timeout = (connect, min(read, CHECK_TIMEOUT))
+
     try:
         # checks connection to the http server by making a get request and checking its return value against the
         # hardcoded one
-        r = requests.get(url=url)
+        with get_scheduler(url).slot("version"):
+            try:
+                r = requests.get(url=url, timeout=timeout)
+            except requests.Timeout as er:
+                if current_deadline() is not None and current_deadline().expired():
+                    raise DeadlineExceeded("The deadline passed while checking the connection") from er
+                raise RequestTimeout(f"ankiConnect did not answer the connection check within {timeout[1]} s") from er
         check_string = '{"apiVersion": "AnkiConnect v.6"}'
 
         if r.text == check_string:
-            os.environ["AnkiConnection"] = str(time.time())
+            record_check(url, str(time.time()))
             return True
         else:
-            os.environ["AnkiConnection"] = "0"
+            record_check(url, "0")
             raise Exception(
                 f"Connection to ankiConnect unsuccessful. Expected response: {check_string}.n"
                 f"Actual response: {r.text}"
             )
 
+    except RequestTimeout:
+        # anki is open but blocked: the caller stops cleanly instead of treating it as a refused connection
+        record_check(url, "0")
+        raise
     except Exception as er:
-        os.environ["AnkiConnection"] = "0"
+        record_check(url, "0")
         print(
             "The connection was refused from the server. Check that Anki is open and AnkiConnect is installed."
         )
@@ -45,11 +362,21 @@ def check_connection(url=link):
         return False
 
 
+def record_check(url: str, value: str) -> None:
+    """Function to record the time of the last successful connection check of a server ("0" after a failure)"""
+
+    if url == link:
+        os.environ["AnkiConnection"] = value
+    else:
+        connection_checks[url] = value
+
+
 def ensure_connectivity(func):
-    """Decorator used to check connection before read/write operations"""
+    """Decorator used to check connection before read/write operations, to the server given by the url keyword argument
+    (the server of the thread without it)"""
 
     def wrapper(*args, **kwargs):
-        if check_connection() is True:
+        if check_connection(kwargs.get("url")) is True:
             if len(kwargs) == 0:
                 return func(*args)
             else:
@@ -66,8 +393,25 @@ def create_request(action, version, **kwargs):
 
 
 def invoke_request(url, action, version, **kwargs):
-    """Sends request to the ankiConnect HTTP server and returns the response object"""
-    r = requests.get(url=url, data=create_request(action, version, **kwargs))
+    """Sends request to the ankiConnect HTTP server and returns the response object. Raises RequestTimeout if the server
+    does not answer in time (see request_timeout)."""
+    return send_request(url, action, create_request(action, version, **kwargs), kwargs)
+
+
+def send_request(url, action, body, params: dict | None = None):
+    """Sends a request body (a json string, or a file-like object with a length streamed to the server) through the
+    scheduler of the server and returns the response object"""
+    import requests
+
+    try:
+        with get_scheduler(url).slot(action, params):
+            timeout = request_timeout(action)
+            r = requests.get(url=url, data=body, timeout=timeout)
+    except requests.Timeout as er:
+        if current_deadline() is not None and current_deadline().expired():
+            raise DeadlineExceeded(f"The deadline passed while waiting for '{action}'") from er
+        raise RequestTimeout(f"ankiConnect did not answer '{action}' within {timeout[1]} seconds") from er
+
     return r
 
 
@@ -84,12 +428,137 @@ def check_result(response):
         raise Exception(f"Server returned error: {response['error']}")
 
 
+# # # read cache =====
+# seconds during which the result of a read action is reused
+CACHE_TTL = 30
+
+# read-only actions whose results are cached
+CACHED_ACTIONS = {"deckNames", "deckNamesAndIds", "modelNames", "modelFieldNames", "findNotes", "getDeckStats"}
+
+NOTE_READS = {"findNotes", "getDeckStats"}
+DECK_READS = {"deckNames", "deckNamesAndIds"} | NOTE_READS
+MODEL_READS = {"modelNames", "modelFieldNames"} | NOTE_READS
+
+# cached actions whose results can be changed by a write action. Actions that are neither cached nor listed here
+# (e.g. unknown ones) clear the whole cache.
+INVALIDATIONS = {
+    # reads that are not cached and writes that don't change the cached reads
+    **dict.fromkeys(
+        ("version", "notesInfo", "notesModTime", "cardsInfo", "getDecks", "canAddNotes", "canAddNotesWithErrorDetail"),
+        set(),
+    ),
+    **dict.fromkeys(("storeMediaFile", "retrieveMediaFile", "getMediaFilesNames", "deleteMediaFile"), set()),
+    # writes
+    **dict.fromkeys(("createDeck", "deleteDecks", "changeDeck"), DECK_READS),
+    **dict.fromkeys(
+        ("addNote", "addNotes", "updateNote", "updateNoteFields", "updateNoteTags", "addTags", "removeTags"), NOTE_READS
+    ),
+    **dict.fromkeys(("deleteNotes", "clearUnusedTags", "replaceTags", "replaceTagsInAllNotes"), NOTE_READS),
+    **dict.fromkeys(("createModel", "modelFieldAdd", "modelFieldRemove", "modelFieldRename"), MODEL_READS),
+}
+
+
+class RequestCache:
+    """Read-through cache of the results of the read-only ankiConnect actions (CACHED_ACTIONS).
+
+    Results are keyed by (url, action, params) and reused for ttl seconds. Sending a write action drops the cached
+    results it can change (see INVALIDATIONS), e.g. createDeck drops deckNames. Hits and misses are counted per action.
+    Results are copied in and out of the cache, so callers can modify them freely."""
+
+    def __init__(self, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        self.entries = {}
+        self.hits = {}
+        self.misses = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(url, action, params) -> tuple:
+        return url, action, json.dumps(params, sort_keys=True)
+
+    def get(self, url, action, params):
+        """Method returning the cached result of an action, None if it is not cached (or expired)"""
+
+        if action not in CACHED_ACTIONS or self.ttl <= 0:
+            return None
+
+        with self.lock:
+            entry = self.entries.get(self.key(url, action, params))
+            hit = entry is not None and time.monotonic() - entry[0] < self.ttl
+
+            counters = self.hits if hit else self.misses
+            counters[action] = counters.get(action, 0) + 1
+
+        return copy.deepcopy(entry[1]) if hit else None
+
+    def put(self, url, action, params, result) -> None:
+        """Method to cache the result of an action, if it is a read-only one"""
+
+        if action in CACHED_ACTIONS and self.ttl > 0 and result is not None:
+            with self.lock:
+                self.entries[self.key(url, action, params)] = (time.monotonic(), copy.deepcopy(result))
+
+    def invalidate(self, action) -> None:
+        """Method to drop the cached results that can be changed by an action"""
+
+        if action in CACHED_ACTIONS:
+            return
+
+        actions = INVALIDATIONS.get(action)
+        with self.lock:
+            if actions is None:
+                self.entries.clear()
+            elif actions:
+                self.entries = {key: entry for key, entry in self.entries.items() if key[1] not in actions}
+
+    def discard(self, actions) -> None:
+        """Method to drop the cached results of the given actions (of every server), e.g. after a change made in anki
+        outside of ankicli"""
+
+        with self.lock:
+            self.entries = {key: entry for key, entry in self.entries.items() if key[1] not in actions}
+
+    def clear(self) -> None:
+        """Method to empty the cache and reset its statistics"""
+
+        with self.lock:
+            self.entries.clear()
+            self.hits.clear()
+            self.misses.clear()
+
+    def stats(self) -> dict:
+        """Method returning the number of hits and misses of the cache, in total and per action"""
+
+        actions = sorted(set(self.hits) | set(self.misses))
+        return {
+            "hits": sum(self.hits.values()),
+            "misses": sum(self.misses.values()),
+            "actions": {a: {"hits": self.hits.get(a, 0), "misses": self.misses.get(a, 0)} for a in actions},
+        }
+
+
+# read cache shared by the whole session
+cache = RequestCache()
+
+
 @ensure_connectivity
-def request_action(action, url=link, version=6, **kwargs):
-    """Higher level function that handles the whole connection process and returns the server response"""
+def request_action(action, url=None, version=6, **kwargs):
+    """Higher level function that handles the whole connection process and returns the server response. The results of
+    read-only actions are served from the session cache while they are fresh. Without url, the request goes to the
+    server of the thread (see use_endpoint)."""
+
+    url = current_url() if url is None else url
+
+    result = cache.get(url, action, kwargs)
+    if result is not None:
+        return {"result": result, "error": None}
 
     response = invoke_request(url, action, version, **kwargs).json()
 
+    # the writes (even failed ones, that may be partially applied) make the related cached reads stale
+    for sub_action in [a["action"] for a in kwargs.get("actions", [])] if action == "multi" else [action]:
+        cache.invalidate(sub_action)
+
     try:
         check_result(response)
     except KeyError as er:
@@ -101,5 +570,82 @@ def request_action(action, url=link, version=6, **kwargs):
     except Exception as er:
         print(f"Action '{action}' unsuccessful. Exception raised: {er}")
         response = {"result": None, "error": er}
+    else:
+        cache.put(url, action, kwargs, response["result"])
 
     return response
+
+
+@ensure_connectivity
+def request_body(action, body, url=None):
+    """Higher level function sending a pre-built request body of an action (e.g. a file-like object encoding a media
+    file while it is sent, see mediaModule) and returning the server response"""
+
+    url = current_url() if url is None else url
+    response = send_request(url, action, body).json()
+    cache.invalidate(action)
+
+    try:
+        check_result(response)
+    except Exception as er:
+        print(f"Action '{action}' unsuccessful. Exception raised: {er}")
+        response = {"result": None, "error": er}
+
+    return response
+
+
+# default number of items sent in a single request by the chunked helpers
+CHUNK_SIZE = 1000
+
+
+def chunks(items: list, size: int = CHUNK_SIZE):
+    """Generator yielding consecutive slices of items, each containing at most size elements"""
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def request_chunked(action, key, items, chunk_size=CHUNK_SIZE, url=None, version=6, **kwargs) -> list:
+    """Higher level function sending an action whose parameter 'key' is a (possibly long) list in chunks of chunk_size
+    items. Returns the concatenation of the list results."""
+
+    results = []
+    for chunk in chunks(list(items), chunk_size):
+        response = request_action(action, url=url, version=version, **{key: chunk}, **kwargs)
+
+        if response is None or response["result"] is None:
+            error = None if response is None else response["error"]
+            raise Exception(f"Action '{action}' unsuccessful. Exception raised: {error}")
+
+        results.extend(response["result"])
+
+    return results
+
+
+def make_action(action, version=6, **kwargs) -> dict:
+    """Creates the dictionary describing a single action of a 'multi' request"""
+    return {"action": action, "version": version, "params": kwargs}
+
+
+def request_multi(actions: list[dict], chunk_size=CHUNK_SIZE, url=None) -> list[dict]:
+    """Higher level function sending several actions (see make_action) through 'multi' requests, chunk_size actions at
+    a time. Returns a list of {"result": ..., "error": ...} dictionaries, one per action. The read-only actions found in
+    the session cache are not sent."""
+
+    url = current_url() if url is None else url
+
+    results = [None] * len(actions)
+    for n, action in enumerate(actions):
+        result = cache.get(url, action["action"], action["params"])
+        if result is not None:
+            results[n] = {"result": result, "error": None}
+
+    pending = [n for n, result in enumerate(results) if result is None]
+    if pending:
+        sent = request_chunked("multi", "actions", [actions[n] for n in pending], chunk_size=chunk_size, url=url)
+
+        for n, result in zip(pending, sent):
+            results[n] = result
+            if result["error"] is None:
+                cache.put(url, actions[n]["action"], actions[n]["params"], result["result"])
+
+    return results
@@ -0,0 +1,145 @@
+import hashlib
+import html
+import re
+
+from ankicli.anki_api import requestModule
+from ankicli.logModule import get_logger
+
+"""Module to build anki search queries and to resolve the ids of notes rejected as duplicates"""
+
+# set up logger
+logger = get_logger(__name__)
+
+DUPLICATE_ERROR = "cannot create note because it is a duplicate"
+
+# characters with a special meaning inside a quoted anki search term
+SEARCH_SPECIAL_CHARS = re.compile(r'([\\"*_])')
+HTML_IMG = re.compile(r"<img[^>]*?src=[\"']?([^\"'>]+)[\"']?[^>]*>", re.IGNORECASE)
+HTML_TAG = re.compile(r"<[^>]*>", re.DOTALL)
+
+
+def escape_search(text: str) -> str:
+    """Function to escape the characters that anki would interpret as wildcards or syntax in a quoted search term"""
+    return SEARCH_SPECIAL_CHARS.sub(r"\\\1", text)
+
+
+def search_term(key: str, value: str) -> str:
+    """Function returning a quoted 'key:value' search term matching value literally"""
+    return f'"{key}:{escape_search(value)}"'
+
+
+def field_query(field: str, value: str, model: str | None = None, deck: str | None = None) -> str:
+    """Function returning a search matching the notes whose field is exactly value, optionally restricted to a note
+    model and a deck"""
+
+    terms = [search_term(field, value)]
+    if model is not None:
+        terms.insert(0, search_term("note", model))
+    if deck is not None:
+        terms.insert(0, search_term("deck", deck))
+
+    return " ".join(terms)
+
+
+def deck_query(deck: str, subdecks: bool = True) -> str:
+    """Function returning a search matching the notes of a deck, optionally leaving out the notes of its subdecks"""
+
+    query = search_term("deck", deck)
+    if not subdecks:
+        query += f' -"deck:{escape_search(deck)}::*"'
+
+    return query
+
+
+def strip_html(text: str) -> str:
+    """Function to strip the html from a field, keeping media filenames, as anki does before checking duplicates"""
+
+    text = HTML_IMG.sub(r" \1 ", text)
+    text = HTML_TAG.sub("", text)
+    return html.unescape(text).strip()
+
+
+def field_checksum(text: str) -> int:
+    """Function returning the checksum anki uses to detect duplicate notes (first 8 hex digits of the sha1 of the
+    html-stripped field)"""
+    return int(hashlib.sha1(strip_html(text).encode("utf-8")).hexdigest()[:8], 16)
+
+
+class DuplicateResolver:
+    """Resolves the ids of the notes that anki refused to add because they are duplicates.
+
+    Every note is first looked up with an escaped, field-scoped exact search, all the searches being sent at once
+    through multi requests. Notes that are not found (e.g. because the html differs) or found more than once are then
+    looked up in a local index {front checksum: [note ids]} of their model, built once per model: like anki, the
+    duplicates are searched in the whole collection, not only in the deck of the note.
+
+    An id is given to a single card: the notes resolving to an id already used by another card (see resolve) are left
+    unresolved, so that two cards of the vault never share a note."""
+
+    def __init__(self, field="Front"):
+        self.field = field
+        self.index = {}
+
+    def resolve(self, notes: list[dict], claimed=()) -> list[int | None]:
+        """Method returning the id of the existing note each given note is a duplicate of (None if it can't be
+        determined unambiguously, or if the id is in claimed, the ids already used by the other cards of the sync)"""
+
+        if not notes:
+            return []
+
+        # batched exact searches
+        actions = [
+            requestModule.make_action(
+                "findNotes", query=field_query(self.field, note["fields"][self.field], model=note["modelName"])
+            )
+            for note in notes
+        ]
+        results = requestModule.request_multi(actions)
+        ids = [
+            result["result"][0]
+            if result is not None and result["error"] is None and len(result["result"] or []) == 1
+            else None
+            for result in results
+        ]
+
+        # fall back to the model index for the unresolved notes
+        for n, note in enumerate(notes):
+            if ids[n] is None:
+                candidates = self.model_index(note["modelName"]).get(field_checksum(note["fields"][self.field]), [])
+                if len(candidates) == 1:
+                    ids[n] = candidates[0]
+
+        # a note already used by another card is not given again
+        claimed = set(claimed)
+        for n, id in enumerate(ids):
+            if id is None:
+                continue
+            if id in claimed:
+                logger.warning(
+                    f"The card '{strip_html(notes[n]['fields'][self.field])}' duplicates the note {id}, already used "
+                    "by another card: it is left out"
+                )
+                ids[n] = None
+            else:
+                claimed.add(id)
+
+        return ids
+
+    def model_index(self, model: str) -> dict:
+        """Method returning the {front checksum: [note ids]} index of the notes of a model, building it on first use.
+        If anki can't be searched, the index is empty (and built again on next use)."""
+
+        if model not in self.index:
+            response = requestModule.request_action("findNotes", query=search_term("note", model))
+            if response is None or response["result"] is None:
+                logger.warning(f"The notes of the model {model} could not be searched for duplicates")
+                return {}
+
+            index = {}
+            for info in requestModule.request_chunked("notesInfo", "notes", response["result"]):
+                if info and self.field in info["fields"]:
+                    index.setdefault(field_checksum(info["fields"][self.field]["value"]), []).append(info["noteId"])
+
+            self.index[model] = index
+
+        return self.index[model]
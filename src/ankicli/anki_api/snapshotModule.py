@@ -0,0 +1,107 @@
+from ankicli.anki_api import requestModule
+
+"""Module to gather, in a single pass, the state of existing notes on the anki server"""
+
+
+def fetch_mod_times(ids, chunk_size=requestModule.CHUNK_SIZE) -> dict[int, int]:
+    """Function returning the modification time of the given notes, as {note id: mod}. Notes that don't exist anymore
+    are left out."""
+
+    mods = {}
+    for chunk in requestModule.chunks(list(ids), chunk_size):
+        response = requestModule.request_action("notesModTime", notes=chunk)
+
+        if response is not None and response["result"] is not None:
+            mods.update({entry["noteId"]: entry["mod"] for entry in response["result"]})
+        else:
+            # a deleted note makes the whole action fail: read the chunk with notesInfo instead
+            infos = requestModule.request_chunked("notesInfo", "notes", chunk, chunk_size=chunk_size)
+            mods.update({info["noteId"]: info["mod"] for info in infos if info})
+
+    return mods
+
+
+class RemoteSnapshot:
+    """State of a set of existing notes on the anki server: fields, tags, model and the decks of their cards.
+
+    The snapshot is built with one chunked pass (notesInfo, then getDecks for the cards of the chunk) and is then
+    shared by every check that needs information about existing notes, instead of each one querying anki again."""
+
+    def __init__(self):
+        self.notes = {}
+        self.card_decks = {}
+
+    @classmethod
+    def fetch(cls, ids, chunk_size=requestModule.CHUNK_SIZE):
+        """Method to build a snapshot of the notes with the given ids"""
+        return cls().load(ids, chunk_size)
+
+    def load(self, ids, chunk_size=requestModule.CHUNK_SIZE):
+        """Method to add the notes with the given ids to the snapshot, fetching them from anki. Returns the snapshot."""
+
+        ids = list(dict.fromkeys(ids))
+
+        for chunk in requestModule.chunks(ids, chunk_size):
+            infos = requestModule.request_chunked("notesInfo", "notes", chunk, chunk_size=chunk_size)
+            self.add_notes(chunk, infos)
+
+            cards = [card for info in infos if info for card in info["cards"]]
+            if cards:
+                decks = requestModule.request_action("getDecks", cards=cards)["result"]
+                self.add_card_decks(decks)
+
+        return self
+
+    def add_notes(self, ids: list[int], infos: list[dict]) -> None:
+        """Method to add notesInfo results to the snapshot. Deleted notes (empty results) are stored as None."""
+
+        for id, info in zip(ids, infos):
+            self.notes[id] = info if info else None
+
+    def add_card_decks(self, decks: dict[str, list[int]]) -> None:
+        """Method to add getDecks results ({deck: [card ids]}) to the snapshot"""
+
+        for deck, cards in decks.items():
+            self.card_decks.update(dict.fromkeys(cards, deck))
+
+    def merge(self, other: "RemoteSnapshot"):
+        """Method to add the notes of another snapshot to this one. Returns the snapshot."""
+
+        self.notes.update(other.notes)
+        self.card_decks.update(other.card_decks)
+        return self
+
+    def __contains__(self, id) -> bool:
+        return id in self.notes
+
+    def exists(self, id: int) -> bool:
+        """Method to check that a note of the snapshot still exists on the server"""
+        return self.notes.get(id) is not None
+
+    def info(self, id: int) -> dict | None:
+        """Method returning the raw notesInfo entry of a note, None if the note does not exist"""
+        return self.notes.get(id)
+
+    def fields(self, id: int) -> dict[str, str]:
+        """Method returning the fields of a note as a {field name: value} dictionary"""
+        return {name: field["value"] for name, field in self.notes[id]["fields"].items()}
+
+    def tags(self, id: int) -> list[str]:
+        """Method returning the tags of a note"""
+        return self.notes[id]["tags"]
+
+    def model(self, id: int) -> str:
+        """Method returning the model name of a note"""
+        return self.notes[id]["modelName"]
+
+    def cards(self, id: int) -> list[int]:
+        """Method returning the card ids of a note"""
+        return self.notes[id]["cards"]
+
+    def decks(self, id: int) -> set[str]:
+        """Method returning the names of the decks containing the cards of a note"""
+        return {self.card_decks[card] for card in self.cards(id) if card in self.card_decks}
+
+    def wrong_deck_cards(self, id: int, deck: str) -> list[int]:
+        """Method returning the cards of a note that are not in the given deck"""
+        return [card for card in self.cards(id) if self.card_decks.get(card, deck) != deck]
@@ -0,0 +1,339 @@
+import base64
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+from ankicli.anki_api.deckModule import deck_hierarchy
+from ankicli.anki_api.searchModule import field_checksum, strip_html
+from ankicli.logModule import get_logger
+from ankicli.stateModule import file_key
+
+"""Module to export NoteSets to an anki package (.apkg), to be imported in anki as a single file"""
+
+# set up logger
+logger = get_logger(__name__)
+
+# number of notes written to the collection in a single executemany
+BATCH_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE col (
+    id integer primary key, crt integer not null, mod integer not null, scm integer not null, ver integer not null,
+    dty integer not null, usn integer not null, ls integer not null, conf text not null, models text not null,
+    decks text not null, dconf text not null, tags text not null
+);
+CREATE TABLE notes (
+    id integer primary key, guid text not null, mid integer not null, mod integer not null, usn integer not null,
+    tags text not null, flds text not null, sfld integer not null, csum integer not null, flags integer not null,
+    data text not null
+);
+CREATE TABLE cards (
+    id integer primary key, nid integer not null, did integer not null, ord integer not null, mod integer not null,
+    usn integer not null, type integer not null, queue integer not null, due integer not null, ivl integer not null,
+    factor integer not null, reps integer not null, lapses integer not null, left integer not null,
+    odue integer not null, odid integer not null, flags integer not null, data text not null
+);
+CREATE TABLE revlog (
+    id integer primary key, cid integer not null, usn integer not null, ease integer not null, ivl integer not null,
+    lastIvl integer not null, factor integer not null, time integer not null, type integer not null
+);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn on notes (usn);
+CREATE INDEX ix_cards_usn on cards (usn);
+CREATE INDEX ix_revlog_usn on revlog (usn);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_cards_sched on cards (did, queue, due);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+CREATE INDEX ix_notes_csum on notes (csum);
+"""
+
+# schema version of the legacy collection format (collection.anki2)
+SCHEMA_VERSION = 11
+
+# note models that can be exported: {name: (id, [templates (front, back)])}
+MODELS = {
+    "Basic": (1342697561419, [("{{Front}}", "{{FrontSide}}<hr id=answer>{{Back}}")]),
+    "Basic (and reversed card)": (
+        1342697561420,
+        [
+            ("{{Front}}", "{{FrontSide}}<hr id=answer>{{Back}}"),
+            ("{{Back}}", "{{FrontSide}}<hr id=answer>{{Front}}"),
+        ],
+    ),
+}
+FIELDS = ("Front", "Back")
+
+MODEL_CSS = ".card {\n font-family: arial;\n font-size: 20px;\n text-align: center;\n color: black;\n}\n"
+
+DECK_CONF = {
+    "id": 1,
+    "name": "Default",
+    "mod": 0,
+    "usn": 0,
+    "maxTaken": 60,
+    "autoplay": True,
+    "timer": 0,
+    "replayq": True,
+    "dyn": False,
+    "new": {"bury": False, "delays": [1, 10], "initialFactor": 2500, "ints": [1, 4, 0], "order": 1, "perDay": 20},
+    "lapse": {"delays": [10], "leechAction": 1, "leechFails": 8, "minInt": 1, "mult": 0},
+    "rev": {"bury": False, "ease4": 1.3, "ivlFct": 1, "maxIvl": 36500, "perDay": 200, "hardFactor": 1.2},
+}
+
+
+def guid(key: str) -> str:
+    """Function returning a stable anki guid for a note, so that importing the package again updates the notes instead
+    of duplicating them"""
+    return base64.b64encode(hashlib.sha1(key.encode("utf-8")).digest(), altchars=b"-_").decode()[:10]
+
+
+def model_json(name: str, mtime: int) -> dict:
+    """Function returning the legacy json description of a note model"""
+
+    id, templates = MODELS[name]
+    return {
+        "id": id,
+        "name": name,
+        "type": 0,
+        "mod": mtime,
+        "usn": -1,
+        "sortf": 0,
+        "did": 1,
+        "tmpls": [
+            {"name": f"Card {n + 1}", "ord": n, "qfmt": qfmt, "afmt": afmt, "did": None, "bqfmt": "", "bafmt": ""}
+            for n, (qfmt, afmt) in enumerate(templates)
+        ],
+        "flds": [
+            {"name": field, "ord": n, "sticky": False, "rtl": False, "font": "Arial", "size": 20, "media": []}
+            for n, field in enumerate(FIELDS)
+        ],
+        "css": MODEL_CSS,
+        "latexPre": "\\documentclass[12pt]{article}\n\\special{papersize=3in,5in}\n\\begin{document}\n",
+        "latexPost": "\\end{document}",
+        "tags": [],
+        "vers": [],
+        "req": [[n, "any", [n % len(FIELDS)]] for n in range(len(templates))],
+    }
+
+
+def deck_json(id: int, name: str, mtime: int) -> dict:
+    """Function returning the legacy json description of a deck"""
+
+    return {
+        "id": id,
+        "name": name,
+        "mod": mtime,
+        "usn": -1,
+        "desc": "",
+        "dyn": 0,
+        "conf": 1,
+        "collapsed": False,
+        "extendNew": 10,
+        "extendRev": 50,
+        "newToday": [0, 0],
+        "revToday": [0, 0],
+        "lrnToday": [0, 0],
+        "timeToday": [0, 0],
+    }
+
+
+class ApkgExporter:
+    """Writer of an anki package holding the notes of NoteSets, built with sqlite3 and zipfile only.
+
+    NoteSets are consumed one at a time (they can be produced lazily, e.g. parsed file by file) and their notes are
+    written to the collection in batches of batch_size rows, so memory does not grow with the size of the vault. Media
+    files are streamed into the archive when the package is closed.
+
+    Notes keep their anki id if they have one; the ids given to the other notes can be written to an IdJournal, so
+    that the next sync puts them in the files once the package has been imported.
+
+    Usage:
+        with ApkgExporter("vault.apkg") as exporter:
+            exporter.add_notesets(NoteSet.from_file(path) for path in paths)
+    """
+
+    def __init__(self, path, batch_size: int = BATCH_SIZE, journal=None):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.journal = journal
+        self.mtime = int(time.time())
+
+        # note and card ids are millisecond timestamps, as in anki
+        self.ids = itertools.count(int(time.time() * 1000))
+        self.decks = {"Default": 1}
+        self.models = set()
+        self.media = {}
+        self.n_notes = 0
+        self.n_cards = 0
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.tmpdir.name) / "collection.anki2"
+        self.con = sqlite3.connect(self.db_path)
+        self.con.executescript(SCHEMA)
+
+        self.note_rows = []
+        self.card_rows = []
+        self.journal_entries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def deck_id(self, name: str) -> int:
+        """Method returning the id of a deck of the package, adding it (and its parents) if missing"""
+
+        for deck in deck_hierarchy(name):
+            if deck not in self.decks:
+                self.decks[deck] = next(self.ids)
+
+        return self.decks[name]
+
+    def add_noteset(self, nset) -> None:
+        """Method to add the cards and media of a NoteSet to the package"""
+
+        notes = nset.notes
+        did = self.deck_id(nset.deckName)
+        tags = f" {' '.join(notes.tags)} " if notes.tags else ""
+        path = file_key(nset.file_path)
+
+        for i, ordinal in notes.ordinals().items():
+            model = notes.modelName[i]
+            if model not in MODELS:
+                logger.warning(f"Note model '{model}' can't be exported, skipping card {ordinal} of {nset.file_path}")
+                continue
+            self.models.add(model)
+
+            id = notes.get_id(i)
+            if id is None:
+                id = next(self.ids)
+                self.journal_entries.append(
+                    {"file": path, "ordinal": ordinal, "fingerprint": notes.fingerprint(i), "id": id}
+                )
+
+            fields = [notes.fields(i)[field] for field in FIELDS]
+            self.note_rows.append(
+                (
+                    id,
+                    guid(str(id)),
+                    MODELS[model][0],
+                    self.mtime,
+                    -1,
+                    tags,
+                    "\x1f".join(fields),
+                    strip_html(fields[0]),
+                    field_checksum(fields[0]),
+                    0,
+                    "",
+                )
+            )
+
+            for ord in range(len(MODELS[model][1])):
+                self.n_cards += 1
+                self.card_rows.append(
+                    (next(self.ids), id, did, ord, self.mtime, -1, 0, 0, self.n_cards, 0, 0, 0, 0, 0, 0, 0, 0, "")
+                )
+
+            if len(self.note_rows) >= self.batch_size:
+                self.flush()
+
+        for file in nset.media:
+            self.media.setdefault(file["filename"], Path(file["path"]))
+
+    def add_notesets(self, nsets) -> None:
+        """Method to add the NoteSets of an iterable to the package, one at a time"""
+
+        for nset in nsets:
+            self.add_noteset(nset)
+
+    def flush(self) -> None:
+        """Method to write the pending rows to the collection"""
+
+        if self.note_rows:
+            with self.con:
+                self.con.executemany("INSERT OR REPLACE INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)", self.note_rows)
+                self.con.executemany(
+                    "INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", self.card_rows
+                )
+
+            self.n_notes += len(self.note_rows)
+            self.note_rows = []
+            self.card_rows = []
+
+        if self.journal is not None and self.journal_entries:
+            self.journal.write(self.journal_entries)
+            self.journal_entries = []
+
+    def write_collection(self) -> None:
+        """Method to write the collection metadata (models, decks and configuration)"""
+
+        models = {str(MODELS[name][0]): model_json(name, self.mtime) for name in sorted(self.models)}
+        decks = {str(id): deck_json(id, name, self.mtime) for name, id in self.decks.items()}
+        conf = {
+            "nextPos": self.n_cards + 1,
+            "curDeck": 1,
+            "curModel": None,
+            "sortType": "noteFld",
+            "sortBackwards": False,
+        }
+
+        with self.con:
+            self.con.execute(
+                "INSERT INTO col VALUES (1,?,?,?,?,0,0,0,?,?,?,?,?)",
+                (
+                    self.mtime,
+                    self.mtime * 1000,
+                    self.mtime * 1000,
+                    SCHEMA_VERSION,
+                    json.dumps(conf),
+                    json.dumps(models),
+                    json.dumps(decks),
+                    json.dumps({"1": DECK_CONF}),
+                    json.dumps({}),
+                ),
+            )
+
+    def close(self) -> None:
+        """Method to complete the package: the collection and the media are zipped into path"""
+
+        self.flush()
+        self.write_collection()
+        self.con.close()
+
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with zipfile.ZipFile(tmp, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.write(self.db_path, "collection.anki2")
+
+            # media are stored with numeric names, mapped to their filename by the 'media' file
+            for n, file in enumerate(self.media.values()):
+                zf.write(file, str(n))
+            zf.writestr("media", json.dumps({str(n): name for n, name in enumerate(self.media)}))
+
+        os.replace(tmp, self.path)
+        self.tmpdir.cleanup()
+        logger.info(f"Exported {self.n_notes} notes and {len(self.media)} media files to {self.path}")
+
+    def discard(self) -> None:
+        """Method to abandon the package without writing it"""
+
+        self.con.close()
+        self.tmpdir.cleanup()
+
+
+def export_apkg(nsets, path, batch_size: int = BATCH_SIZE, journal=None) -> Path:
+    """Function to export the notes of an iterable of NoteSets to an anki package. Returns the path of the package."""
+
+    with ApkgExporter(path, batch_size=batch_size, journal=journal) as exporter:
+        exporter.add_notesets(nsets)
+
+    return exporter.path
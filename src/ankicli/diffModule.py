@@ -0,0 +1,71 @@
+from ankicli.anki_api.requestModule import make_action, request_multi
+
+"""Module to compute minimal updates between local notes and their state on the anki server"""
+
+
+def diff_fields(local: dict[str, str], remote: dict[str, str]) -> dict[str, str]:
+    """Function returning the local fields whose value differs from the remote one"""
+    return {name: value for name, value in local.items() if remote.get(name) != value}
+
+
+def diff_tags(local, remote) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    """Function returning the tags to add to and to remove from the remote note for it to match the local tags.
+    Anki tags are case-insensitive, so are the comparisons."""
+
+    local_folded = {tag.casefold() for tag in local}
+    remote_folded = {tag.casefold() for tag in remote}
+
+    added = tuple(sorted({tag for tag in local if tag.casefold() not in remote_folded}))
+    removed = tuple(sorted({tag for tag in remote if tag.casefold() not in local_folded}))
+
+    return added, removed
+
+
+class UpdatePlan:
+    """Collection of the minimal changes needed to bring existing notes up to date.
+
+    Changed fields are sent through updateNoteFields (only the fields that differ), tag changes are grouped by tag set
+    so that a single addTags / removeTags action covers every note sharing the same change."""
+
+    def __init__(self):
+        self.fields = {}
+        self.added_tags = {}
+        self.removed_tags = {}
+
+    def __len__(self) -> int:
+        return len(self.fields) + len(self.added_tags) + len(self.removed_tags)
+
+    def add_note(self, id: int, fields: dict[str, str], tags, remote_fields: dict[str, str], remote_tags) -> bool:
+        """Method to add a note to the plan, given its local and remote fields and tags. Returns True if the note
+        needs to be updated."""
+
+        changed = diff_fields(fields, remote_fields)
+        added, removed = diff_tags(tags, remote_tags)
+
+        if changed:
+            self.fields[id] = changed
+        if added:
+            self.added_tags.setdefault(added, []).append(id)
+        if removed:
+            self.removed_tags.setdefault(removed, []).append(id)
+
+        return bool(changed or added or removed)
+
+    def actions(self) -> list[dict]:
+        """Method returning the list of ankiConnect actions implementing the plan"""
+
+        actions = [
+            make_action("updateNoteFields", note={"id": id, "fields": fields}) for id, fields in self.fields.items()
+        ]
+        actions += [
+            make_action("removeTags", notes=ids, tags=" ".join(tags)) for tags, ids in self.removed_tags.items()
+        ]
+        actions += [make_action("addTags", notes=ids, tags=" ".join(tags)) for tags, ids in self.added_tags.items()]
+
+        return actions
+
+    def send(self) -> list[dict]:
+        """Method to send the plan to anki, batching every action through multi requests"""
+
+        actions = self.actions()
+        return request_multi(actions) if actions else []
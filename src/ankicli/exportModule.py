@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+from ankicli.anki_api.requestModule import CHUNK_SIZE, chunks, make_action, request_action, request_multi
+from ankicli.anki_api.searchModule import deck_query
+from ankicli.logModule import get_logger
+from ankicli.parseModule import format_card
+from ankicli.renderer.htmlModule import html_to_markdown
+
+"""Module to export anki decks to markdown files, in the card format read by parseModule"""
+
+# set up logger
+logger = get_logger(__name__)
+
+# note models whose cards can be written as markdown
+EXPORT_MODELS = ("Basic", "Basic (and reversed card)")
+
+
+def note_lines(info: dict) -> list[str] | None:
+    """Function returning the markdown lines of a note given in the notesInfo format, followed by an empty line.
+    Returns None if the note can't be written as a card (unsupported model or empty question)."""
+
+    if info.get("modelName") not in EXPORT_MODELS:
+        return None
+
+    fields = {name: field["value"] for name, field in info["fields"].items()}
+    front, back = html_to_markdown(fields.get("Front", "")), html_to_markdown(fields.get("Back", ""))
+    if not front:
+        return None
+
+    return format_card(front, back, info["noteId"], info["modelName"]) + ["\n"]
+
+
+def frontmatter(deck: str, tags) -> list[str]:
+    """Function returning the yaml frontmatter lines of a file of the given deck and tags"""
+
+    # json strings and lists are valid yaml, and quote every special character
+    return ["---\n", f"deck: {json.dumps(deck)}\n", f"tags: {json.dumps(list(tags))}\n", "---\n", "\n"]
+
+
+def deck_file_name(deck: str) -> str:
+    """Function returning the name of the markdown file of a deck"""
+    return "".join("_" if c in '<>:"/\\|?*' else c for c in deck.replace("::", " - ")) + ".md"
+
+
+def split_file_name(path: Path, tags: tuple[str, ...]) -> Path:
+    """Function returning the path of the file holding the notes of a deck that have the given tags"""
+    return path.with_name(deck_file_name(f"{path.stem} - {' '.join('#' + tag for tag in tags) or 'no tags'}"))
+
+
+def export_deck(deck: str, path, ids: list[int] | None = None, subdecks: bool = False, chunk_size=CHUNK_SIZE) -> int:
+    """Function to write the notes of a deck to a markdown file, with their ids. Returns the number of cards written.
+
+    The notes are requested chunk_size at a time and each chunk is written to disk before the next one is requested,
+    so memory does not grow with the size of the deck. Tags are only held by the frontmatter of a file, so the notes
+    are grouped by tags: the largest group goes to path, the other ones to files named after their tags next to it
+    (see split_file_name), and every note keeps its tags when the files are synced back. The files are only replaced
+    once they are complete. ids can be given if the notes of the deck have already been searched."""
+
+    path = Path(path)
+    if ids is None:
+        ids = request_action("findNotes", query=deck_query(deck, subdecks=subdecks))["result"]
+
+    logger.info(f"Exporting {len(ids)} notes of the deck {deck} to {path}")
+
+    # the cards are written first, one body file per set of tags, as the groups are only known at the end
+    bodies, counts, skipped = {}, {}, 0
+
+    for chunk in chunks(ids, chunk_size):
+        groups = {}
+        for info in request_action("notesInfo", notes=chunk)["result"]:
+            lines = note_lines(info) if info else None
+            if lines is None:
+                skipped += 1
+                continue
+
+            groups.setdefault(tuple(sorted(set(info["tags"]))), []).append(lines)
+
+        for tags, notes in groups.items():
+            body = bodies.setdefault(tags, path.with_name(f"{path.name}.{len(bodies)}.body"))
+            with open(body, mode="a", encoding="utf-8") as f:
+                for lines in notes:
+                    f.writelines(lines)
+            counts[tags] = counts.get(tags, 0) + len(notes)
+
+    main = max(counts, key=counts.get) if counts else ()
+    bodies.setdefault(main, None)
+
+    for tags, body in bodies.items():
+        target = path if tags == main else split_file_name(path, tags)
+        tmp = target.with_name(target.name + ".tmp")
+        with open(tmp, mode="w", encoding="utf-8") as f:
+            f.writelines(frontmatter(deck, tags))
+            if body is not None:
+                with open(body, encoding="utf-8") as cards:
+                    shutil.copyfileobj(cards, f)
+
+        os.replace(tmp, target)
+        if body is not None:
+            body.unlink()
+
+    if len(counts) > 1:
+        logger.info(f"The notes of the deck {deck} have {len(counts)} sets of tags, written to {len(counts)} files")
+    if skipped:
+        logger.warning(f"{skipped} notes of the deck {deck} can't be written as markdown cards and were skipped")
+
+    return sum(counts.values())
+
+
+def export_decks(decks: list[str], directory, chunk_size=CHUNK_SIZE) -> dict[str, Path]:
+    """Function to write every given deck (without its subdecks) to its own markdown file in directory. The notes of
+    every deck are searched with a single multi request. Returns the {deck: path} of the files written."""
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    results = request_multi([make_action("findNotes", query=deck_query(deck, subdecks=False)) for deck in decks])
+
+    paths = {}
+    for deck, result in zip(decks, results):
+        if result["error"] is not None:
+            logger.warning(f"Deck {deck} could not be searched: {result['error']}")
+            continue
+
+        paths[deck] = directory / deck_file_name(deck)
+        count = export_deck(deck, paths[deck], ids=result["result"], chunk_size=chunk_size)
+        print(f"Exported {count} cards of the deck {deck} to {paths[deck]}")
+
+    return paths
@@ -0,0 +1,120 @@
+import threading
+from pathlib import Path
+
+from ankicli.anki_api.collectionModule import CollectionReader
+from ankicli.anki_api.requestModule import link, use_endpoint
+from ankicli.journalModule import IdJournal
+from ankicli.logModule import get_logger
+from ankicli.noteModule2 import NoteSet
+from ankicli.queueModule import OfflineQueue
+from ankicli.stateModule import SyncState
+from ankicli.syncModule import VaultSync
+
+"""Module to sync a vault to several anki instances (ankiConnect servers) at once"""
+
+# set up logger
+logger = get_logger(__name__)
+
+
+class Endpoint:
+    """An ankiConnect server (anki instance or profile) the vault is synced to, with its own sync options.
+
+    The ids of the notes differ from one anki instance to the other, so at most one endpoint can keep them in the
+    markdown files (write_ids=True); the other ones keep them in their own SyncState (sidecar mode)."""
+
+    def __init__(
+        self,
+        url: str = link,
+        state: SyncState | None = None,
+        write_ids: bool = False,
+        journal: IdJournal | None = None,
+        queue: OfflineQueue | None = None,
+        collection: CollectionReader | None = None,
+    ):
+        if state is None and not write_ids:
+            raise ValueError(f"Endpoint {url} needs a SyncState to keep the ids out of the markdown files.")
+
+        self.url = url
+        self.state = state
+        self.write_ids = write_ids
+        self.journal = journal
+        self.queue = queue
+        self.collection = collection
+
+    def __repr__(self) -> str:
+        return f"Endpoint({self.url!r})"
+
+
+class FanOutSync:
+    """Sync of a vault to several endpoints: the files are parsed and rendered once, then the network phases of every
+    endpoint (see VaultSync) run concurrently, each in its own thread with its own requests, deck registry and request
+    scheduler. N endpoints cost about one parse plus the slowest network run.
+
+    Every endpoint syncs its own copy of the parsed files; only the endpoint with write_ids=True saves the files.
+    Keyword arguments (e.g. pull_remote) are passed to every VaultSync."""
+
+    def __init__(self, nsets: list[NoteSet], endpoints: list[Endpoint], **kwargs):
+        if sum(endpoint.write_ids for endpoint in endpoints) > 1:
+            raise ValueError("Only one endpoint can keep the ids in the markdown files.")
+        if len({endpoint.url for endpoint in endpoints}) != len(endpoints):
+            raise ValueError("Every endpoint must have its own url.")
+
+        self.endpoints = endpoints
+        self.syncs = {}
+        for endpoint in endpoints:
+            self.syncs[endpoint.url] = VaultSync(
+                nsets if endpoint.write_ids else [nset.copy(keep_ids=False) for nset in nsets],
+                state=endpoint.state,
+                write_ids=endpoint.write_ids,
+                journal=endpoint.journal,
+                queue=endpoint.queue,
+                collection=endpoint.collection,
+                **kwargs,
+            )
+
+        self.results = {}
+        self.errors = {}
+
+    @classmethod
+    def from_directory(cls, directory, endpoints: list[Endpoint], pattern="*.md", **kwargs):
+        """Method to instantiate a FanOutSync object parsing every file matching pattern in directory once"""
+
+        directory = Path(directory)
+
+        if not directory.exists() or not directory.is_dir():
+            raise ValueError(f"Directory {directory} does not exist or is not a directory.")
+
+        logger.info(f"Parsing vault: {directory}")
+        return cls([NoteSet.from_file(file) for file in sorted(directory.glob(pattern))], endpoints, **kwargs)
+
+    def sync_endpoint(self, endpoint: Endpoint, prune: bool, deadline: float | None) -> None:
+        """Method running the sync of an endpoint, with every request of the thread sent to it"""
+
+        try:
+            with use_endpoint(endpoint.url):
+                self.results[endpoint.url] = self.syncs[endpoint.url].run(prune=prune, deadline=deadline)
+        except Exception as e:
+            logger.error(f"Sync to {endpoint.url} failed: {e!r}")
+            self.results[endpoint.url] = False
+            self.errors[endpoint.url] = e
+
+    def run(self, prune: bool = False, deadline: float | None = None) -> dict[str, bool]:
+        """Method to sync the vault to every endpoint concurrently (see VaultSync.run for prune and deadline). Returns
+        {url: True if the sync completed}. The first error is raised once every endpoint is done."""
+
+        threads = [
+            threading.Thread(target=self.sync_endpoint, args=(endpoint, prune, deadline), name=endpoint.url)
+            for endpoint in self.endpoints
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for url, completed in self.results.items():
+            print(f"Sync to {url}: {'completed' if completed else 'not completed (stopped or queued)'}.")
+
+        if self.errors:
+            raise next(iter(self.errors.values()))
+
+        return self.results
@@ -0,0 +1,113 @@
+import json
+import os
+from pathlib import Path
+
+from ankicli.logModule import get_logger
+from ankicli.stateModule import file_key
+
+"""Module handling the write-ahead journal of the ids created on anki and not yet saved to the markdown files"""
+
+# set up logger
+logger = get_logger(__name__)
+
+
+class IdJournal:
+    """Append-only journal of the (file, card, id) entries of the notes created on anki.
+
+    Entries are appended and fsynced as soon as anki returns the ids, before the files are saved: if the sync is
+    interrupted, replaying the journal at the next run gives the cards their id back, instead of uploading them again
+    and repairing the duplicates. The journal is cleared once the files are saved.
+    Cards are identified by their ordinal in the file and their content fingerprint (see NoteStore.fingerprint)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def __len__(self) -> int:
+        return len(self.entries())
+
+    def append(self, nset, rows: list[int]) -> None:
+        """Method to append the ids of the given rows of a NoteSet to the journal, syncing it to disk"""
+
+        notes = nset.notes
+        path = file_key(nset.file_path)
+        ordinals = notes.ordinals()
+
+        self.write(
+            {"file": path, "ordinal": ordinals[i], "fingerprint": notes.fingerprint(i), "id": notes.ids[i]}
+            for i in rows
+            if notes.get_id(i) is not None
+        )
+
+    def write(self, entries) -> None:
+        """Method to append {"file", "ordinal", "fingerprint", "id"} entries to the journal, syncing it to disk"""
+
+        lines = [json.dumps(entry) + "\n" for entry in entries]
+
+        if lines:
+            with open(self.path, mode="a", encoding="utf-8") as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def entries(self) -> list[dict]:
+        """Method returning the entries of the journal. A last line left incomplete by a crash is ignored."""
+
+        if not self.path.exists():
+            return []
+
+        entries = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping incomplete journal entry: {line!r}")
+
+        return entries
+
+    def replay(self, nsets) -> int:
+        """Method to give their journaled id back to the cards of the given NoteSets that don't have one. A card is
+        matched by ordinal if its fingerprint is unchanged, by fingerprint among the file cards otherwise.
+        Returns the number of ids restored."""
+
+        entries = {}
+        for entry in self.entries():
+            entries.setdefault(entry["file"], []).append(entry)
+
+        restored = 0
+        for nset in nsets:
+            notes = nset.notes
+            file_entries = entries.get(file_key(nset.file_path), [])
+            if not file_entries:
+                continue
+
+            cards = notes.cards()
+            new_rows = set(notes.new_cards())
+            used = set(notes.get_ids(cards))
+
+            for entry in file_entries:
+                if entry["id"] in used:
+                    continue
+
+                # same card at the same position, or the same content somewhere else in the file
+                ordinal = entry["ordinal"]
+                candidates = [cards[ordinal]] if ordinal < len(cards) else []
+                candidates += [i for i in cards if i in new_rows]
+
+                for i in candidates:
+                    if i in new_rows and notes.fingerprint(i) == entry["fingerprint"]:
+                        notes.set_id(i, entry["id"])
+                        new_rows.discard(i)
+                        used.add(entry["id"])
+                        restored += 1
+                        break
+
+        if restored:
+            logger.info(f"Restored {restored} ids from the journal {self.path}")
+
+        return restored
+
+    def clear(self) -> None:
+        """Method to empty the journal, once every journaled id is safely saved"""
+
+        self.path.unlink(missing_ok=True)
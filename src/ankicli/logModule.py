@@ -0,0 +1,25 @@
+import logging
+import sys
+
+"""Module to handle the logging setup shared by every ankicli module"""
+
+formatter = logging.Formatter("%(name)s::%(levelname)s - %(message)s")
+
+
+def get_logger(name: str, level=logging.WARNING) -> logging.Logger:
+    """Function returning the logger for an ankicli module. A single stdout handler is attached to the package
+    logger the first time this is called, module loggers propagate their records to it."""
+
+    # attach the stdout handler to the package logger only once
+    package_logger = logging.getLogger("ankicli")
+    if not any(getattr(h, "ankicli_handler", False) for h in package_logger.handlers):
+        handler = logging.StreamHandler(stream=sys.stdout)
+        handler.setLevel(logging.DEBUG)
+        handler.setFormatter(formatter)
+        handler.ankicli_handler = True
+        package_logger.addHandler(handler)
+
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+
+    return logger
@@ -21,24 +21,33 @@ def get_model_fields(model_name):
     return result
 
 
+def get_model_list():
+    """Function returning a dictionary containing all the models available for the current user, with their fields.
+    The dictionary is built on first use (instead of at import) and reused afterwards."""
+
+    if not model_list:
+        if requestModule.check_connection():
+            for name in get_model_names():
+                model_list.setdefault(name, get_model_fields(name))
+        else:
+            raise ConnectionError("Could not connect to anki.")
+
+    return model_list
+
+
 def model_exists(model_name):
     """Low-level function to check if a certain modelName exists for the current user"""
-    return model_name in model_list.keys()
+    return model_name in get_model_list().keys()
 
 
 def check_model_fields(model_name, model_fields):
     """Low-level function to check that all the fields provided are in the modelName definition"""
 
-    actual_fields = model_list[model_name]
+    actual_fields = get_model_list()[model_name]
     actual_fields.sort()
     model_fields.sort()
     return model_fields == actual_fields
 
 
-# define a dictionary containing all the models available for the current user
+# define a dictionary containing all the models available for the current user, filled by get_model_list
 model_list = {}
-if requestModule.check_connection():
-    for name in get_model_names():
-        model_list.setdefault(name, get_model_fields(name))
-else:
-    raise ConnectionError("Could not connect to anki.")
@@ -1,28 +1,48 @@
 import json
-import logging
-import sys
-
-import numpy as np
-import pandas as pd
-
+import threading
 
 from ankicli import parseModule
 from ankicli.anki_api import deckModule
-from ankicli.anki_api.requestModule import request_action
+from ankicli.anki_api.mediaModule import store_media
+from ankicli.anki_api.searchModule import DUPLICATE_ERROR, DuplicateResolver
+from ankicli.anki_api.snapshotModule import RemoteSnapshot
+from ankicli.diffModule import UpdatePlan
+from ankicli.anki_api.requestModule import make_action, request_action, request_multi
+from ankicli.logModule import get_logger
+from ankicli.renderer import rendererModule
+from ankicli.renderer.htmlModule import html_to_markdown
 from ankicli.renderer.img_plugin import im_list
-from ankicli.renderer.rendererModule import markdown
+from ankicli.storeModule import NoteStore
 
 # set up logger
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.WARNING)
+logger = get_logger(__name__)
+
+# the renderer collects images in a module-level list: rendering is serialized between threads
+RENDER_LOCK = threading.Lock()
+
+# outcomes of the upload of a new note, other than the error returned by anki
+ADDED = "added"
+DUPLICATE = "duplicate"
+
 
-debug_handler = logging.StreamHandler(stream=sys.stdout)
-debug_handler.setLevel(logging.DEBUG)
+def add_notes(notes: list[dict]) -> list[dict]:
+    """Function to add notes to anki with a single (chunked) multi request of addNote actions, so that every note gets
+    its own error detail. Returns a {"result": id, "error": error} dictionary per note."""
+    return request_multi([make_action("addNote", note=note) for note in notes])
 
-formatter = logging.Formatter("%(name)s::%(levelname)s - %(message)s")
-debug_handler.setFormatter(formatter)
 
-logger.addHandler(debug_handler)
+def split_add_results(rows: list, results: list[dict]) -> tuple[dict, dict]:
+    """Function to split the results of add_notes, aligned with rows, into the dictionaries {row: id} of the added
+    notes and {row: error} of the failed ones"""
+
+    ids, errors = {}, {}
+    for i, result in zip(rows, results):
+        if result["error"] is None and result["result"] is not None:
+            ids[i] = result["result"]
+        else:
+            errors[i] = result["error"] or "note could not be added"
+
+    return ids, errors
 
 
 class NoteSet:
@@ -31,7 +51,9 @@ class NoteSet:
         self.tags = None
         self.file_path = None
         self.media = None
-        self.df = None
+        self.notes = None
+        self.snapshot = None
+        self.outcomes = {}
 
     @classmethod
     def from_file(cls, path: str):
@@ -57,397 +79,311 @@ class NoteSet:
         nset.deckName = parseModule.get_deck(metadata)
         nset.tags = parseModule.get_tags(metadata)
 
-        # group file lines and create pandas.Series and pandas.DataFrame
-        grouped_lines = parseModule.group_lines(lines)
-        grouped_lines = pd.Series(grouped_lines, name="text")
-        grouped_lines = pd.DataFrame(grouped_lines)
-
-        # create and fill pandas.DataFrame with the card information
-        logger.debug("Parsing cards from file lines")
-        df = grouped_lines.text.apply(parseModule.parse_card)
-        df = pd.concat([grouped_lines, df], axis=1)
-
-        # add properties to the DataFrame
-        properties = pd.DataFrame({'text': [properties]})
-        properties = pd.concat([properties, properties.text.apply(parseModule.parse_card, return_empty=True)], axis=1)
+        # create the note store, the properties are stored in the first row
+        notes = NoteStore(nset.deckName, nset.tags)
+        notes.append(properties, parseModule.ParsedCard())
 
-        df = pd.concat([properties, df], ignore_index=True)
+        with RENDER_LOCK:
+            # make sure only the images of this file are collected
+            im_list.clear()
 
-        # format front and back of cards
-        logger.debug("Formatting front and back text")
-        df[["front", "back"]] = df[["front", "back"]].map(markdown)
+            # group file lines, parse them and format front and back of cards
+            logger.debug("Parsing cards from file lines")
+            markdown = rendererModule.get_markdown()
+            for group in parseModule.group_lines(lines):
+                card = parseModule.read_card(group)
 
-        # add media
-        logger.debug("Scraping images from file lines")
-        nset.media = im_list.copy()
+                if card.is_card:
+                    card = card._replace(front=markdown(card.front), back=markdown(card.back))
 
-        # create field column
-        logger.debug("Creating fields column")
-        df.loc[df["is_card"], "fields"] = df.apply(
-            lambda x: {"Front": x.front, "Back": x.back}, axis=1
-        )
+                notes.append(group, card)
 
-        # add tags and deck info to cards
-        logger.debug("Adding tags and deck info")
-        df["tags"] = np.empty((len(df.index), 0)).tolist()
-        df.tags.apply(lambda x: x.extend(nset.tags))
-        df["deckName"] = nset.deckName
+            # add media
+            logger.debug("Scraping images from file lines")
+            nset.media = im_list.copy()
+            im_list.clear()
 
-        # # save cards df
-        nset.df = df
+        # save cards store
+        nset.notes = notes
 
         # return instantiated NoteSet
         logger.info("NoteSet instantiated")
         return nset
 
+    def copy(self, keep_ids: bool = True):
+        """Method returning a copy of the NoteSet sharing the parsed and rendered cards, e.g. to sync the same file to
+        another anki instance. With keep_ids=False the cards of the copy have no id."""
+
+        nset = type(self)()
+        nset.file_path = self.file_path
+        nset.deckName = self.deckName
+        nset.tags = self.tags
+        nset.media = list(self.media)
+        nset.notes = self.notes.copy(keep_ids=keep_ids)
+
+        return nset
+
     def check_deck(self) -> None:
         """Method to check that the NoteSet deck exists in the server and create it if it does not."""
 
         logger.debug("Checking deck")
-        if not deckModule.deck_exists(self.deckName):
-            deckModule.create_deck(self.deckName)
+        deckModule.ensure_decks([self.deckName])
 
-    @staticmethod
-    def add_notes(df: pd.DataFrame) -> list:
-        """Method to add notes to anki"""
+    def add_notes(self, rows: list[int]) -> tuple[dict[int, int], dict[int, str]]:
+        """Method to add notes to anki. Returns the dictionaries {row: id} of the added notes and {row: error} of the
+        notes that could not be added."""
 
         # creating list of cards to add
         logger.debug("Creating list of cards to upload")
-        df = df[["deckName", "modelName", "fields", "tags"]].copy()
-        df_l = df.to_dict(orient="index")
-        df_l = list(df_l.values())
+        notes = self.notes.notes(rows)
 
         # uploading cards
         logger.debug("Uploading cards to anki server")
-        result = request_action("addNotes", notes=df_l)["result"]
-
-        return result
+        return split_add_results(rows, add_notes(notes))
 
-    def check_notes(self) -> None:
+    def check_notes(self, snapshot: RemoteSnapshot | None = None) -> None:
         """Method to perform general checks on the database for different kind of notes that could build up to errors:
         - deleted notes
-        - duplicate notes
-        - wrong deck notes"""
+        - wrong deck notes
+        Errors of new notes (e.g. duplicates) are handled by upload_new_notes, from the errors returned by anki.
+        The state of existing notes is read from snapshot (fetched if not given), which is kept for
+        update_existing_notes."""
 
         logger.info("Checking notes")
 
-        # # # checks on new notes =====
-        # check on new notes first as duplicate notes might have to be updated, while deleted notes only need to be
-        # uploaded to anki again
-        logger.debug("Checking new notes")
-
-        # copy original dataframe
-        df = self.df.copy()
-
-        # filter dataframe to only keep cards that don't have an id
-        df = df.loc[(df["is_card"] == True) & (df["id"].isna())]
-
-        # find and repair error notes
-        logger.debug("Find and repair errors in new notes")
-        df, e_df = self.repair_errors(df)
-
-        # if some notes could not be added, remove them from the df and write an error log
-        if len(e_df) != 0:
-            logging.warning("\nSome of the new notes could not be added to the deck.")
-            self.write_to_error_log(e_df)
-            df = df.loc[~df.index.isin(e_df.index)]
-
-        # update df with duplicate notes info (id, etc.)
-        self.df.update(df)
-        # remove error notes from the noteset df
-        # TODO replace deleting notes with maybe setting is_card to False in order not to upload them and return errors
-        self.df = self.df.loc[~self.df.index.isin(e_df.index)]
-
-        # # # checks on existing notes =====
         # check on existing notes to find notes that have been deleted from the server but still have an id in the
         # file
         logger.debug("Checking existing notes")
 
-        # copy original dataframe
-        df = self.df.copy()
+        # select cards that already have an id
+        rows = self.notes.existing_cards()
 
-        # filter dataframe to only keep cards that already have an id
-        df = df.loc[(df["is_card"] == True) & (~df["id"].isna())]
+        if not rows:
+            self.snapshot = RemoteSnapshot()
+            return
 
-        # gather ids of existing notes
-        df_ids = df["id"].map(int)
-        df_ids = df_ids.to_list()
-
-        # query the database
-        logger.debug("Querying anki for notes info")
-        queried_notes = request_action("notesInfo", notes=df_ids)["result"]
-        queried_notes = [note if len(note) != 0 else None for note in queried_notes]
-
-        logger.debug("Finding and repairing deleted notes")
-        # separate deleted notes
-        df, deleted_notes = self.find_deleted_notes(df, queried_notes)
+        # query the database once for everything about the existing notes
+        if snapshot is None:
+            logger.debug("Querying anki for notes info")
+            snapshot = RemoteSnapshot.fetch(self.notes.get_ids(rows))
+        self.snapshot = snapshot
 
-        # repair deleted notes if there are any
-        if not deleted_notes.empty:
-            deleted_notes = self.repair_deleted_notes(deleted_notes)
-            self.df.loc[deleted_notes.index] = deleted_notes
+        # separate and repair deleted notes
+        rows = self.check_deleted_notes(rows, snapshot)
 
         # check and adjust deck for the existing notes
         logger.debug("Adjust deck of already existing cards")
-        self.adjust_notes_deck(df)
+        self.adjust_notes_deck(rows)
 
-    def update_existing_notes(self) -> None:
-        """Method to update already existing notes to the anki server"""
+    def update_existing_notes(self, snapshot: RemoteSnapshot | None = None) -> None:
+        """Method to update already existing notes to the anki server. The remote state is read from snapshot, or
+        from the one taken by check_notes (fetched if neither is available)."""
 
         logger.info("Updating existing notes")
 
-        # copy original dataframe
-        df = self.df.copy()
-
-        # filter dataframe to only keep cards that already have an id
-        df = df.loc[(df["is_card"] == True) & (~df["id"].isna())]
+        # select cards that already have an id
+        rows = self.notes.existing_cards()
 
-        if not df.empty:
-            # gather ids of existing notes
-            df_ids = df["id"].map(int)
-            df_ids = df_ids.to_list()
+        if rows:
+            snapshot = snapshot or self.snapshot
+            if snapshot is None:
+                logger.debug("Querying anki for existing notes")
+                snapshot = RemoteSnapshot.fetch(self.notes.get_ids(rows))
 
-            # query the database
-            logger.debug("Querying anki for existing notes")
-            queried_notes = request_action("notesInfo", notes=df_ids)["result"]
-            queried_notes = [note if len(note) != 0 else None for note in queried_notes]
-
-            # divide existing notes in various dfs
+            # compute the changed fields and tags of the existing notes
             logger.debug("Finding notes that have to be updated")
-            updatable_notes, non_updatable_notes = self.find_updatable_notes(
-                df, queried_notes
-            )
-
-            # create list of notes from df
-            logger.debug("Creating list of updatable notes")
-            nl = updatable_notes[
-                ["deckName", "modelName", "fields", "tags", "id"]
-            ].copy()
-            nl.id = nl.id.map(int)
-            nl = nl.to_dict(orient="index")
-            nl = list(nl.values())
+            plan = self.plan_updates(rows, snapshot)
 
             # update notes
             logger.debug("Updating notes")
-            for note in nl:
-                request_action("updateNote", note=note)
+            plan.send()
 
     def upload_new_notes(self) -> None:
-        """Method to upload new notes to the anki server"""
+        """Method to upload new notes to the anki server. The outcome of every note (ADDED, DUPLICATE when it was
+        matched to an existing note, or the error returned by anki) is recorded in outcomes, as {row: outcome}."""
 
         logger.info("Uploading new notes")
+        self.outcomes = {}
 
-        # copy original dataframe
-        df = self.df.copy()
-
-        # filter dataframe to only keep cards that don't have an id
-        df = df.loc[(df["is_card"] == True) & (df["id"].isna())]
+        # select cards that don't have an id
+        rows = self.notes.new_cards()
 
-        # if the df is empty, it means that no more cards have to be added to anki
-        if not df.empty:
+        # if there are no rows, it means that no more cards have to be added to anki
+        if rows:
             # adding cards to the anki server
             logger.debug("Adding cards to server")
-            df_ids = self.add_notes(df)
+            ids, errors = self.add_notes(rows)
 
-            # add ids to the
+            # add ids to the cards' text
             logger.debug("Inserting ids into the cards' text")
-            df["id"] = df_ids
-            df["text"] = df.apply(parseModule.insert_card_id, axis=1)
-
-            self.df.update(df)
-
-    def repair_errors(self, df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
-        """Method to find and repair possible errors that may arise when uploading cards to Anki."""
-
-        # copy df
-        df = df.copy()
-
-        # find out which notes may produce an error
-        logger.debug("Finding error notes")
-        e_df = self.find_error_notes(df)
+            for i, id in ids.items():
+                self.notes.set_id(i, id)
+                self.outcomes[i] = ADDED
+
+            # only the notes that failed go through the repair logic
+            if errors:
+                logger.debug("Repairing error notes")
+                remaining = self.repair_errors(errors)
+                repaired = [i for i in errors if i not in remaining]
+                self.outcomes.update(dict.fromkeys(repaired, DUPLICATE))
+
+                # repaired notes already exist: add them to the snapshot, so that they are moved and updated
+                if repaired:
+                    self.snapshot = (self.snapshot or RemoteSnapshot()).load(self.notes.get_ids(repaired))
+                    self.adjust_notes_deck(repaired)
+
+                # if some notes could not be added, stop treating them as cards and write an error log
+                if remaining:
+                    self.discard_error_notes(remaining)
+                    self.outcomes.update(remaining)
+
+    def repair_errors(self, errors: dict[int, str]) -> dict[int, str]:
+        """Method to repair possible errors that may arise when uploading cards to Anki.
+        Takes and returns a dictionary {row: error}, the returned one containing the notes that could not be
+        repaired."""
 
         # repair any duplicated notes
         logger.debug("Repairing duplicate notes")
-        dup_df = self.repair_duplicate_notes(e_df)
+        repaired = self.repair_duplicate_notes(errors)
 
-        # update repaired notes in the df
-        df.update(dup_df)
+        # drop repaired notes from the errors
+        return {i: error for i, error in errors.items() if i not in repaired}
 
-        # drop repaired notes from the error df
-        # kinda complex to do an anti-join tbh
-        e_df = e_df.loc[~e_df.index.isin(dup_df.index)]
+    def discard_error_notes(self, errors: dict[int, str]) -> None:
+        """Method to write the notes that could not be added to the error log and stop treating them as cards"""
 
-        return df, e_df
+        logger.warning("Some of the new notes could not be added to the deck.")
+        self.write_to_error_log({i: dict(self.notes.record(i), error=error) for i, error in errors.items()})
+        self.notes.exclude(list(errors))
 
-    @staticmethod
-    def find_error_notes(e_df: pd.DataFrame) -> pd.DataFrame:
-        """Method to check that all the new notes can be added to the deck."""
-
-        # copy df
-        e_df = e_df.copy()
-
-        # create query for the anki server
-        logger.debug("Creating anki query")
-        e_ddf = e_df[["deckName", "modelName", "fields", "tags"]].copy()
-        e_list = e_ddf.to_dict(orient="index")
-        e_list = list(e_list.values())
-
-        # launch queries and gather results
-        logger.debug("Querying anki for possible errors in the cards")
-        e_list = request_action("canAddNotesWithErrorDetail", notes=e_list)["result"]
-
-        logger.debug("Extracting error cards")
-        e_df["error"] = [el.get("error") for el in e_list]
-        e_df.dropna(subset=["error"], inplace=True)
-
-        return e_df
-
-    @staticmethod
-    def repair_duplicate_notes(e_df: pd.DataFrame) -> pd.DataFrame:
-        """Method to repair eventual duplicate notes"""
+    def repair_duplicate_notes(self, errors: dict[int, str], resolver: DuplicateResolver | None = None) -> list[int]:
+        """Method to repair eventual duplicate notes, retrieving the id of the note they duplicate.
+        Returns the rows that were repaired."""
 
         # filter error notes keeping the duplicate ones
         logger.debug("Filtering duplicate notes from other errors")
-        dup_df = e_df.loc[
-            e_df["error"] == "cannot create note because it is a duplicate"
-        ].copy()
+        dup_rows = [i for i, error in errors.items() if error == DUPLICATE_ERROR]
 
-        # return the empty dataframe if no duplicate notes were found
-        if dup_df.empty:
-            return dup_df
-
-        # gather front of the cards and use them as queries to retrieve card ids from anki
-        logger.debug("Creating anki query")
-        dup_front = dup_df["front"].to_list()
-
-        # launch query and gather results
+        # resolve the ids with batched, escaped searches
         logger.debug("Querying anki for the missing ids")
-        dup_ids = [
-            request_action("findNotes", query=el)["result"][0] for el in dup_front
-        ]
+        resolver = DuplicateResolver() if resolver is None else resolver
+        dup_ids = resolver.resolve(self.notes.notes(dup_rows), claimed=self.notes.get_ids(self.notes.cards()))
 
-        # insert card id in the id column and add it/sub it in the text column
+        # insert card id in the text of the resolved notes
         logger.debug("Inserting ids into the cards' text")
-        dup_df["id"] = dup_ids
-        dup_df["text"] = dup_df.apply(parseModule.insert_card_id, axis=1)
-
-        # return the dataframe with the repaired cards
-        return dup_df.drop(["error"], axis=1)
+        repaired = []
+        for i, id in zip(dup_rows, dup_ids):
+            if id is not None:
+                self.notes.set_id(i, id)
+                repaired.append(i)
 
-    @staticmethod
-    def find_deleted_notes(df: pd.DataFrame, queried_notes: list) -> tuple[pd.DataFrame, pd.DataFrame]:
-        """Method to check that all the notes with an id actually exist in the anki server"""
+        # return the repaired rows
+        return repaired
 
-        # copy dataframe
-        df = df.copy()
+    def find_deleted_notes(self, rows: list[int], snapshot: RemoteSnapshot) -> tuple[list[int], list[int]]:
+        """Method to check that all the notes with an id actually exist in the anki server.
+        Returns the rows of the existing notes and the rows of the deleted ones."""
 
         # filter deleted notes
         logger.debug("Filtering deleted notes")
-        
-        # use pandas isnull to find notes that have been deleted
-        qn = pd.Series(queried_notes, index=df.index)
-        deleted_notes = df[qn.isnull()].copy()
-        df = df[qn.notnull()].copy()
+        ids = self.notes.ids
+        existing = [i for i in rows if snapshot.exists(ids[i])]
+        deleted = [i for i in rows if not snapshot.exists(ids[i])]
 
-        return df, deleted_notes
+        return existing, deleted
 
-    @staticmethod
-    def repair_deleted_notes(deleted_notes: pd.DataFrame) -> pd.DataFrame:
-        """Method to repair deleted notes"""
+    def check_deleted_notes(self, rows: list[int], snapshot: RemoteSnapshot) -> list[int]:
+        """Method to find and repair the notes that have been deleted from anki. Returns the rows of the notes that
+        still exist."""
+
+        logger.debug("Finding and repairing deleted notes")
+        # separate deleted notes
+        rows, deleted_rows = self.find_deleted_notes(rows, snapshot)
+
+        # repair deleted notes if there are any
+        if deleted_rows:
+            self.repair_deleted_notes(deleted_rows)
 
-        # copy original dataframe
-        deleted_notes = deleted_notes.copy()
+        return rows
 
-        # assign the id value to NaN
-        deleted_notes.id = np.nan
+    def repair_deleted_notes(self, rows: list[int]) -> None:
+        """Method to repair deleted notes"""
 
         # delete id from card text
         logger.debug("Deleting ids from deleted cards")
-        deleted_notes.text = deleted_notes.apply(parseModule.insert_card_id, axis=1)
+        for i in rows:
+            self.notes.set_id(i, None)
 
-        return deleted_notes
+    def plan_updates(self, rows: list[int], snapshot: RemoteSnapshot, plan: UpdatePlan | None = None) -> UpdatePlan:
+        """Method to add the changed fields and tags of the given notes to an update plan (a new one if not given).
+        Notes missing from the snapshot (e.g. just uploaded) are considered up to date."""
 
-    @staticmethod
-    def find_updatable_notes(df: pd.DataFrame, queried_notes: list):
-        """Method to sort updatable and up-to-date notes"""
-
-        # copy dataframe
-        df = df.copy()
-
-        # create list with important query info
-        logger.debug("Building note fields from query result")
-        queried_fields = [
-            {
-                "Front": x["fields"]["Front"]["value"],
-                "Back": x["fields"]["Back"]["value"],
-            }
-            for x in queried_notes
-            if x is not None
-        ]
+        plan = UpdatePlan() if plan is None else plan
 
-        # transform queried_fields into a pandas Series with the same index as df
-        queried_fields = pd.Series(queried_fields, index=df.index)
+        logger.debug("Diffing local notes against the remote ones")
+        for i in rows:
+            id = self.notes.ids[i]
+            if snapshot.exists(id):
+                plan.add_note(id, self.notes.fields(i), self.notes.tags, snapshot.fields(id), snapshot.tags(id))
 
-        # create updatable / up to date notes dfs
-        logger.debug("Divide notes in up-to-date and updatable")
-        updatable_notes = df.loc[df.fields != queried_fields].copy()
-        up_to_date_notes = df.loc[df.fields == queried_fields].copy()
+        return plan
 
-        return updatable_notes, up_to_date_notes
+    def wrong_deck_cards(self, rows: list[int], snapshot: RemoteSnapshot) -> list[int]:
+        """Method returning the cards of the given notes that are not in the NoteSet deck"""
 
-    @staticmethod
-    def adjust_notes_deck(df: pd.DataFrame) -> None:
+        ids = self.notes.ids
+        return [
+            card for i in rows if snapshot.exists(ids[i]) for card in snapshot.wrong_deck_cards(ids[i], self.deckName)
+        ]
+
+    def adjust_notes_deck(self, rows: list[int]) -> None:
         """Check that the notes belong to the right deck in anki"""
 
-        # copy dataframe
-        df = df.copy()
+        # gather ids of cards that are in the wrong deck
+        logger.debug("Create list of cards in the wrong decks")
+        wrong_deck_ids = self.wrong_deck_cards(rows, self.snapshot)
+
+        if wrong_deck_ids:
+            # change notes' deck
+            logger.debug("Change cards deck")
+            request_action("changeDeck", cards=wrong_deck_ids, deck=self.deckName)
 
-        if not df.empty:
-            # retrieve ids and deckName
-            df_ids = df.id.to_list()
-            deck_name = df.deckName.iloc[0]
+    def pull_note(self, i: int, fields: dict[str, str]) -> None:
+        """Method to replace the text of a card with the fields of its anki note, converted back to markdown"""
 
-            # query the database to get a dictionary: {deck: [note ids]}
-            logger.debug("Querying anki for card decks")
-            deck_dict = request_action("getDecks", cards=df_ids)["result"]
+        notes = self.notes
+        front, back = html_to_markdown(fields.get("Front", "")), html_to_markdown(fields.get("Back", ""))
 
-            # gather ids of cards that are in the wrong deck
-            logger.debug("Create list of cards in the wrong decks")
-            wrong_deck_ids = []
-            # for every key in the dictionary that is different from the one defined in the noteSet deckName attribute,
-            # add the items of its list to the wrongDeck list
-            for key in list(deck_dict):
-                if key != deck_name:
-                    wrong_deck_ids.extend(deck_dict[key])
+        # inline cards stay inline unless the answer now spans several lines
+        inline = bool(notes.inline[i]) and "\n" not in back or notes.modelName[i] == "Basic (and reversed card)"
+        notes.text[i] = parseModule.format_card(front, back, notes.get_id(i), notes.modelName[i], inline)
+        notes.inline[i] = inline
 
-            # change notes' deck
-            logger.debug("Change cards deck")
-            request_action("changeDeck", cards=wrong_deck_ids, deck=deck_name)
+        # render the new markdown, collecting its images
+        with RENDER_LOCK:
+            im_list.clear()
+            markdown = rendererModule.get_markdown()
+            notes.front[i], notes.back[i] = markdown(front), markdown(back)
+            self.media.extend(file for file in im_list if file not in self.media)
+            im_list.clear()
 
     @staticmethod
-    def write_to_error_log(e_df: pd.DataFrame, file="error_log.txt") -> None:
+    def write_to_error_log(records: dict, file="error_log.txt") -> None:
         logger.warning("Writing error log...")
 
-        # write error log with the notes in the error df
+        # write error log with the error notes records
         with open(file, "a") as f:
-            f.writelines(f"\n{json.dumps(e_df.to_dict(orient='index'))}")
+            f.writelines(f"\n{json.dumps(records)}")
 
     def upload_media(self) -> None:
         """Method to upload media to anki server"""
 
         # upload every image to the media folder
-        for file in self.media:
-            request_action(
-                "storeMediaFile", filename=file["filename"], path=str(file["path"].absolute())
-            )
+        store_media({file["filename"]: file["path"] for file in self.media})
 
     def save_file(self) -> None:
         """Method to save the updated lines to the file"""
 
-        # create file lines list
-        lines = self.df.text.to_list()
-        lines = [line for group in lines for line in group]
-
         # write lines to file
         with open(self.file_path, mode="w", encoding="utf-8") as f:
-            f.writelines(lines)
+            f.writelines(self.notes.lines())
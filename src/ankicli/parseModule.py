@@ -1,27 +1,18 @@
 import copy
-import logging
+import functools
 import re
-import sys
+from typing import TYPE_CHECKING, NamedTuple
 
-import numpy as np
-import pandas as pd
-import yaml
+from ankicli import re_exprs
+from ankicli.logModule import get_logger
 
-from ankicli.re_exprs import precompiled
+if TYPE_CHECKING:
+    import pandas as pd
 
 """Module to handle parsing of text files"""
 
 # set up logger
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.WARNING)
-
-handler = logging.StreamHandler(stream=sys.stdout)
-handler.setLevel(logging.DEBUG)
-
-formatter = logging.Formatter("%(name)s::%(levelname)s - %(message)s")
-handler.setFormatter(formatter)
-
-logger.addHandler(handler)
+logger = get_logger(__name__)
 
 
 # define id formatting
@@ -29,6 +20,23 @@ id_format = "^{}\n"
 inline_id_format = "{} ^{}\n"
 
 
+class ParsedCard(NamedTuple):
+    """Plain record holding the information parsed from a single group of lines"""
+
+    front: str = ""
+    back: str = ""
+    id: int | None = None
+    inline: bool = False
+    modelName: str = "Basic"
+    is_card: bool = False
+
+
+@functools.cache
+def get_regex(name: str) -> re.Pattern:
+    """Returns the compiled version of one of the precompiled regular expressions, compiling it only once."""
+    return re.compile(re_exprs.precompiled[name])
+
+
 def get_lines(path):
     """Simple low-level function to read all lines from a file"""
 
@@ -42,7 +50,7 @@ def extract_properties(lines: list) -> tuple[list, list]:
     Returns a list containing the properties lines and another one containing the other file lines."""
 
     # compile the regex
-    properties_re = re.compile(precompiled["properties"])
+    properties_re = get_regex("properties")
 
     # get yaml frontmatter indices
     indexes = [i for i, j in enumerate(lines) if properties_re.search(j) is not None]
@@ -63,6 +71,8 @@ def get_properties_metadata(properties: list) -> dict:
     prop_string = "".join(properties[:-1])
 
     # read file metadata
+    import yaml
+
     d = yaml.safe_load(prop_string)
 
     return d
@@ -116,8 +126,8 @@ def group_lines(lines: list) -> list[list]:
     full_text = []
     text = []
 
-    inline_re = re.compile(precompiled["inline_card"])
-    empty_line_re = re.compile(precompiled["empty_line"])
+    inline_re = get_regex("inline_card")
+    empty_line_re = get_regex("empty_line")
 
     for line in lines:
         if inline_re.search(line) or empty_line_re.search(line):
@@ -135,18 +145,16 @@ def group_lines(lines: list) -> list[list]:
     return full_text
 
 
-def parse_card(lines: list, return_empty=False) -> pd.Series:
-    """Returns a pandas.Series object corresponding to a single card. The Series object has the following fields
-    (indexes): front, back, id, inline, modelName, is_card."""
+def read_card(lines: list) -> ParsedCard:
+    """Returns a ParsedCard record corresponding to a single card. The record has the following fields:
+    front, back, id, inline, modelName, is_card."""
 
-    question_re = re.compile(precompiled["question"])
-    answer_re = re.compile(precompiled["answer"])
-    id_re = re.compile(precompiled["id"])
-    empty_line_re = re.compile(precompiled["empty_line"])
-    inline_re = re.compile(precompiled["inline_card"])
-    inline_reverse_re = re.compile(precompiled["inline_reverse_card"])
-
-    index_names = ["front", "back", "id", "inline", "modelName", "is_card"]
+    question_re = get_regex("question")
+    answer_re = get_regex("answer")
+    id_re = get_regex("id")
+    empty_line_re = get_regex("empty_line")
+    inline_re = get_regex("inline_card")
+    inline_reverse_re = get_regex("inline_reverse_card")
 
     # create the base return values
     front = ""
@@ -156,9 +164,6 @@ def parse_card(lines: list, return_empty=False) -> pd.Series:
     model = "Basic"
     is_card = False
 
-    if return_empty:
-        return pd.Series([front, back, id, inline, model, is_card], index=index_names)
-
     for line in lines:
         # inline card parser
         if (r := inline_reverse_re.search(line)) is not None:
@@ -172,7 +177,7 @@ def parse_card(lines: list, return_empty=False) -> pd.Series:
             id = int(r.group("id")) if r.group("id") is not None else None
             inline = True
             is_card = True
-            return pd.Series([front, back, id, inline, model, is_card], index=index_names)
+            return ParsedCard(front, back, id, inline, model, is_card)
 
         # normal card parser
         if (r := question_re.search(line)) is not None:
@@ -187,21 +192,31 @@ def parse_card(lines: list, return_empty=False) -> pd.Series:
             id = int(r.group("id"))
         elif empty_line_re.search(line) is not None:
             if front is not None and back is not None:
-                return pd.Series([front, back, id, inline, model, is_card], index=index_names)
+                return ParsedCard(front, back, id, inline, model, is_card)
 
-    return pd.Series([front, back, id, inline, model, is_card], index=index_names)
+    return ParsedCard(front, back, id, inline, model, is_card)
+
+
+def parse_card(lines: list, return_empty=False) -> "pd.Series":
+    """Returns a pandas.Series object corresponding to a single card. The Series object has the following fields
+    (indexes): front, back, id, inline, modelName, is_card."""
+
+    import pandas as pd
+
+    card = ParsedCard() if return_empty else read_card(lines)
+    return pd.Series(list(card), index=list(ParsedCard._fields))
 
 
 def card_gen(lines, deck=None, tags=None):
     """Creates a generator object to iterate through the file lines and retrieve cards one by one, allowing the caller
     to modify the underlying lines list (for example by inserting the card id after uploading it)"""
 
-    question_re = re.compile(precompiled["question"])
-    answer_re = re.compile(precompiled["answer"])
-    id_re = re.compile(precompiled["id"])
-    empty_line_re = re.compile(precompiled["empty_line"])
-    inline_re = re.compile(precompiled["inline_card"])
-    inline_reverse_re = re.compile(precompiled["inline_reverse_card"])
+    question_re = get_regex("question")
+    answer_re = get_regex("answer")
+    id_re = get_regex("id")
+    empty_line_re = get_regex("empty_line")
+    inline_re = get_regex("inline_card")
+    inline_reverse_re = get_regex("inline_reverse_card")
 
     # create a standard dictionary to use as a template
     std_dict = {"Front": None, "Back": None, "id": None, "deckName": deck, "tags": tags}
@@ -245,32 +260,34 @@ def card_gen(lines, deck=None, tags=None):
         card_dict = copy.deepcopy(std_dict)
 
 
-def insert_card_id(series: pd.Series) -> list[str]:
-    """Function to insert or modify the card id in the text lines of the dataframe entry."""
-
-    # precompile id regex
-    endline_id_re = re.compile(precompiled["id"] + r"\n$")
+def replace_card_id(text: list[str], id: int | None, inline: bool) -> list[str]:
+    """Function to insert, modify or (when id is None) delete the card id in the text lines of a card.
+    Returns a new list, the original one is left untouched."""
 
     # create sub line
-    if np.isnan(series.id):
+    if id is None or id != id:
         sub = ""
     else:
-        sub = f"^{series.id}\n"
+        sub = f"^{id}\n"
 
-    # deepcopy text list to avoid modifying the original by mistake
-    lines = copy.deepcopy(series.text)
+    # copy text list to avoid modifying the original by mistake
+    lines = list(text)
 
-    # retrieve last line of text from the series
+    # retrieve last line of text
     line = lines.pop()
 
     # three cases:
     # - the regex returns a match in the text -> sub the match with the new id
     # - no match and the card is an inline type -> sub \n in line with id
     # - no match and no inline -> append new line with id
-    if endline_id_re.search(line):
-        line = endline_id_re.sub(f"{sub}", line)
-    elif series.inline is True:
-        line = re.sub("\n", f"{sub}", line)
+    if (r := get_regex("endline_id").search(line)) is not None:
+        line = line[: r.start()]
+        # when deleting the id of an inline card, keep the line ending
+        if sub == "" and line != "" and not line.endswith("\n"):
+            line = line.rstrip(" \t") + "\n"
+        line = line + sub
+    elif inline is True:
+        line = line.replace("\n", sub)
     else:
         line = line + f"{sub}"
 
@@ -281,6 +298,39 @@ def insert_card_id(series: pd.Series) -> list[str]:
     return lines
 
 
+def format_card(
+    front: str, back: str, id: int | None = None, model: str = "Basic", inline: bool | None = None
+) -> list[str]:
+    """Function returning the text lines of a card, in the format read by read_card: inline ('>front :: back') or block
+    ('>[!question]- front #card' followed by one '>' line per answer line). When inline is None, the inline format is
+    used if both sides fit on a single line. Reversed cards and questions only exist on a single line, so their line
+    breaks are replaced by spaces."""
+
+    reverse = model == "Basic (and reversed card)"
+    if reverse:
+        inline = True
+    elif inline is None:
+        inline = "\n" not in front and "\n" not in back
+
+    front = front.replace("\n", " ")
+
+    if inline:
+        separator = ":::" if reverse else "::"
+        lines = [f">{front} {separator} {back.replace(chr(10), ' ')}\n"]
+    else:
+        lines = [f">[!question]- {front} #card\n"] + [f">{line}\n" for line in back.split("\n")]
+
+    return replace_card_id(lines, id, inline) if id is not None else lines
+
+
+def insert_card_id(series: "pd.Series") -> list[str]:
+    """Function to insert or modify the card id in the text lines of the dataframe entry."""
+
+    # NaN ids (pandas missing values) are treated as missing
+    id = None if series.id is None or series.id != series.id else int(series.id)
+    return replace_card_id(series.text, id, bool(series.inline))
+
+
 def insert_card_id2(lines, index, id, inline=False) -> None:
     """Function to insert the card id in the lines of the file. Simple wrapper around .insert"""
 
@@ -0,0 +1,280 @@
+import contextlib
+import threading
+import time
+from pathlib import Path
+from queue import Empty, Full, Queue
+
+from ankicli.anki_api.requestModule import check_connection, chunks
+from ankicli.logModule import get_logger
+from ankicli.noteModule2 import NoteSet
+from ankicli.syncModule import VaultSync
+
+"""Module running the sync of a vault as a pipeline of stages, overlapping parsing and disk writes with network waits"""
+
+# set up logger
+logger = get_logger(__name__)
+
+# number of files synced together by the network stages
+BATCH_FILES = 20
+
+# number of batches waiting between two stages
+QUEUE_SIZE = 2
+
+# marker put in a queue after the last batch
+DONE = object()
+
+
+class PipelineStopped(Exception):
+    """Raised in the stages of a pipeline stopped because another stage failed"""
+
+
+class StageStats:
+    """Throughput counters of a pipeline stage: batches and files processed, time spent working, waiting for input
+    (the stages before are slower) and blocked on a full output queue (the stages after are slower)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.batches = 0
+        self.files = 0
+        self.busy = 0.0
+        self.idle = 0.0
+        self.blocked = 0.0
+
+    def as_dict(self) -> dict:
+        """Method returning the counters as a dictionary, with the throughput of the stage in files per second"""
+
+        return {
+            "batches": self.batches,
+            "files": self.files,
+            "busy": round(self.busy, 4),
+            "idle": round(self.idle, 4),
+            "blocked": round(self.blocked, 4),
+            "files_per_second": round(self.files / self.busy, 2) if self.busy else None,
+        }
+
+
+class SyncPipeline:
+    """Pipelined sync driver: the files of a vault flow in batches through the discovery, parse, diff, upload and
+    write-back stages, each running in its own thread and connected to the next one by a bounded queue.
+
+    Batch N+1 is parsed while the notes of batch N are checked or uploaded, and saved while later batches wait on
+    anki, so CPU and disk work overlap network waits. A full queue blocks the stage feeding it (backpressure), so at
+    most queue_size batches wait between two stages and memory does not grow with the vault. Every network stage
+    batches the requests of its batch_size files as VaultSync does for the whole vault.
+
+    Keyword arguments (state, write_ids, journal, queue, collection, pull_remote) have the VaultSync meaning. The
+    journal is cleared once every batch is saved. Cards moved between files of different batches are reported as
+    removed from their old file.
+
+    run returns the StageStats of every stage as a dictionary, so the bottleneck can be spotted: the slowest stage is
+    the busiest one, the stages before it are blocked and the stages after it are idle."""
+
+    def __init__(
+        self, directory, pattern="*.md", batch_size: int = BATCH_FILES, queue_size: int = QUEUE_SIZE, **kwargs
+    ):
+        self.directory = Path(directory)
+        if not self.directory.is_dir():
+            raise ValueError(f"Directory {directory} does not exist or is not a directory.")
+
+        self.pattern = pattern
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        # the options are checked before any stage starts
+        VaultSync([], **kwargs)
+        self.queue = kwargs.pop("queue", None)
+        self.options = kwargs
+        self.state = kwargs.get("state")
+        self.journal = kwargs.get("journal")
+
+        self.stats = {name: StageStats(name) for name in ("discovery", "parse", "diff", "upload", "write-back")}
+        self.stop = threading.Event()
+        self.errors = []
+
+        # the sync state is shared by the diff and write-back stages
+        self.state_lock = threading.Lock() if self.state is not None else contextlib.nullcontext()
+
+        self.nsets = []
+        self.removed_cards = {}
+        self.remote_edits = []
+        self.conflicts = []
+
+    # # # queues =====
+    def get(self, queue: Queue):
+        """Method returning the next item of a queue, waiting for it unless the pipeline is stopped"""
+
+        while not self.stop.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                continue
+
+        raise PipelineStopped()
+
+    def put(self, queue: Queue, item) -> None:
+        """Method to put an item in a queue, waiting for a free slot unless the pipeline is stopped"""
+
+        while not self.stop.is_set():
+            try:
+                return queue.put(item, timeout=0.1)
+            except Full:
+                continue
+
+        raise PipelineStopped()
+
+    # # # stages =====
+    def discover(self):
+        """Method yielding the files of the vault, in batches of batch_size paths"""
+        yield from chunks(sorted(self.directory.glob(self.pattern)), self.batch_size)
+
+    @staticmethod
+    def parse(paths: list[Path]) -> list[NoteSet]:
+        """Method to parse and render a batch of files"""
+        return [NoteSet.from_file(path) for path in paths]
+
+    def diff(self, nsets: list[NoteSet]) -> VaultSync:
+        """Method to compare a batch of files with anki: ids are restored, decks created and existing notes checked"""
+
+        sync = VaultSync(nsets, **self.options)
+
+        with self.state_lock:
+            if self.journal is not None:
+                self.journal.replay(nsets)
+            if self.state is not None:
+                sync.load_state()
+
+            sync.check_decks()
+            sync.check_notes()
+
+        return sync
+
+    @staticmethod
+    def upload(sync: VaultSync) -> VaultSync:
+        """Method to send the new notes, the updates and the media of a batch to anki"""
+
+        sync.upload_new_notes()
+        sync.update_existing_notes()
+        sync.upload_media()
+
+        if sync.state is not None:
+            sync.refresh_mod_times()
+
+        return sync
+
+    def write_back(self, sync: VaultSync) -> None:
+        """Method to save the files of a batch and record them in the sync state"""
+
+        with self.state_lock:
+            sync.save_files(clear_journal=False)
+
+        for path, ids in sync.removed_cards.items():
+            self.removed_cards.setdefault(path, []).extend(ids)
+        self.remote_edits.extend(sync.remote_edits)
+        self.conflicts.extend(sync.conflicts)
+
+    def source(self, outbox: Queue) -> None:
+        """Method running the discovery stage, feeding the batches of paths to the first queue"""
+
+        stats = self.stats["discovery"]
+        try:
+            start = time.perf_counter()
+            for paths in self.discover():
+                stats.busy += time.perf_counter() - start
+
+                start = time.perf_counter()
+                self.put(outbox, paths)
+                stats.blocked += time.perf_counter() - start
+
+                stats.batches += 1
+                stats.files += len(paths)
+                start = time.perf_counter()
+
+            self.put(outbox, DONE)
+        except Exception as e:
+            self.fail("discovery", e)
+
+    def worker(self, name: str, func, inbox: Queue, outbox: Queue | None) -> None:
+        """Method running a stage: items are taken from inbox, processed with func and their result put in outbox"""
+
+        stats = self.stats[name]
+        try:
+            while True:
+                start = time.perf_counter()
+                item = self.get(inbox)
+                stats.idle += time.perf_counter() - start
+
+                if item is DONE:
+                    if outbox is not None:
+                        self.put(outbox, DONE)
+                    return
+
+                start = time.perf_counter()
+                result = func(item)
+                stats.busy += time.perf_counter() - start
+                stats.batches += 1
+                stats.files += len(item.nsets if isinstance(item, VaultSync) else item)
+
+                if outbox is not None:
+                    start = time.perf_counter()
+                    self.put(outbox, result)
+                    stats.blocked += time.perf_counter() - start
+        except Exception as e:
+            self.fail(name, e)
+
+    def fail(self, name: str, error: Exception) -> None:
+        """Method to stop every stage after an error in one of them"""
+
+        if not isinstance(error, PipelineStopped):
+            logger.error(f"Stage {name} of the sync pipeline failed: {error!r}")
+            self.errors.append(error)
+        self.stop.set()
+
+    # # # run =====
+    def run(self, prune: bool = False) -> dict[str, dict]:
+        """Method to sync the vault through the pipeline. If prune is True, the notes of the vault decks that are not in
+        the vault anymore are deleted from anki at the end. Returns the counters of every stage."""
+
+        # without anki, the whole vault is queued as VaultSync does
+        if self.queue is not None:
+            if not check_connection():
+                VaultSync.from_directory(self.directory, self.pattern, queue=self.queue, **self.options).run()
+                return {}
+            self.queue.flush(self.journal, media_data=self.options.get("media_data"))
+
+        parse, diff, upload = (self.parse_and_keep if prune else self.parse), self.diff, self.upload
+        stages = [("parse", parse), ("diff", diff), ("upload", upload), ("write-back", self.write_back)]
+        queues = [Queue(maxsize=self.queue_size) for _ in stages]
+
+        threads = [threading.Thread(target=self.source, args=(queues[0],), name="discovery")]
+        for n, (name, func) in enumerate(stages):
+            outbox = queues[n + 1] if n + 1 < len(queues) else None
+            threads.append(threading.Thread(target=self.worker, args=(name, func, queues[n], outbox), name=name))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+        # every id is now saved
+        if self.journal is not None:
+            self.journal.clear()
+
+        if prune:
+            VaultSync(self.nsets, **self.options).prune()
+
+        stats = {name: stage.as_dict() for name, stage in self.stats.items()}
+        for name, counters in stats.items():
+            logger.info(f"Pipeline stage {name}: {counters}")
+
+        bottleneck = max(self.stats.values(), key=lambda stage: stage.busy)
+        print(f"Synced {self.stats['write-back'].files} files, the slowest stage was {bottleneck.name}.")
+        return stats
+
+    def parse_and_keep(self, paths: list[Path]) -> list[NoteSet]:
+        """Method to parse a batch of files, keeping the NoteSets for the prune step"""
+
+        nsets = self.parse(paths)
+        self.nsets.extend(nsets)
+        return nsets
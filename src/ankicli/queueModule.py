@@ -0,0 +1,164 @@
+import json
+import os
+from pathlib import Path
+
+from ankicli.anki_api import deckModule, requestModule
+from ankicli.anki_api.mediaModule import store_media
+from ankicli.anki_api.searchModule import DUPLICATE_ERROR, DuplicateResolver
+from ankicli.anki_api.snapshotModule import RemoteSnapshot
+from ankicli.diffModule import UpdatePlan
+from ankicli.logModule import get_logger
+from ankicli.noteModule2 import add_notes
+from ankicli.stateModule import file_key
+
+"""Module handling the on-disk queue of the actions prepared while anki is not reachable"""
+
+# set up logger
+logger = get_logger(__name__)
+
+
+class OfflineQueue:
+    """Compacted on-disk queue of the changes to apply to anki, for syncs prepared while anki is closed.
+
+    The queue holds the rendered state of the notes rather than a log of actions, so that the changes are coalesced per
+    note: existing notes are keyed by id, new notes by file and card ordinal, and queueing a file again replaces its
+    previous entries. Media are keyed by filename. The whole queue is rewritten (atomically) on every change.
+
+    flush applies the queue with batched requests: one snapshot of the existing notes, one multi of minimal updates and
+    deck moves, one multi of addNote actions for the new notes and one multi of storeMediaFile actions. The ids of the
+    new notes are written to an IdJournal, if given, to be restored into the files at the next sync."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.notes = {}
+        self.media = {}
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self.notes) + len(self.media)
+
+    def load(self) -> None:
+        """Method to read the queue from disk"""
+
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.notes = data["notes"]
+            self.media = data["media"]
+
+    def save(self) -> None:
+        """Method to write the queue to disk, replacing the previous one only once the new one is complete"""
+
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, mode="w", encoding="utf-8") as f:
+            json.dump({"notes": self.notes, "media": self.media}, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        """Method to empty the queue"""
+
+        self.notes = {}
+        self.media = {}
+        self.path.unlink(missing_ok=True)
+
+    def enqueue(self, nsets) -> None:
+        """Method to queue the current state of the cards and media of the given NoteSets"""
+
+        for nset in nsets:
+            notes = nset.notes
+            path = file_key(nset.file_path)
+
+            # the new cards of a file are replaced as a whole, as their ordinals may have changed
+            self.notes = {key: entry for key, entry in self.notes.items() if entry["id"] or entry["file"] != path}
+
+            for i, ordinal in notes.ordinals().items():
+                id = notes.get_id(i)
+                key = str(id) if id is not None else f"{path}#{ordinal}"
+                self.notes[key] = {
+                    "id": id,
+                    "file": path,
+                    "ordinal": ordinal,
+                    "fingerprint": notes.fingerprint(i),
+                    "note": notes.note(i),
+                }
+
+            for file in nset.media:
+                self.media[file["filename"]] = str(file["path"].absolute())
+
+        self.save()
+        logger.info(f"{len(self.notes)} notes and {len(self.media)} media files queued")
+
+    def flush(self, journal=None, media_data: bool | None = None) -> dict | None:
+        """Method to apply the queue to anki and empty it. Returns the number of notes added, updated, moved and of
+        media stored, or None if anki is not reachable (the queue is kept). media_data chooses the form of the media
+        uploads (see mediaModule.store_media)."""
+
+        if not self.notes and not self.media:
+            return {"added": 0, "updated": 0, "moved": 0, "media": 0}
+        if not requestModule.check_connection():
+            return None
+
+        logger.info("Flushing the offline queue")
+        entries = list(self.notes.values())
+        deckModule.ensure_decks({entry["note"]["deckName"] for entry in entries})
+
+        # # # existing notes =====
+        existing = [entry for entry in entries if entry["id"]]
+        snapshot = RemoteSnapshot.fetch([entry["id"] for entry in existing])
+
+        plan = UpdatePlan()
+        moves = {}
+        for entry in existing:
+            id, note = entry["id"], entry["note"]
+            if snapshot.exists(id):
+                plan.add_note(id, note["fields"], note["tags"], snapshot.fields(id), snapshot.tags(id))
+                cards = snapshot.wrong_deck_cards(id, note["deckName"])
+                if cards:
+                    moves.setdefault(note["deckName"], []).extend(cards)
+
+        actions = plan.actions() + [
+            requestModule.make_action("changeDeck", cards=cards, deck=deck) for deck, cards in moves.items()
+        ]
+        if actions:
+            requestModule.request_multi(actions)
+
+        # # # new notes =====
+        # notes deleted from anki since they were queued are added again
+        new = [entry for entry in entries if not entry["id"] or not snapshot.exists(entry["id"])]
+        results = add_notes([entry["note"] for entry in new]) if new else []
+
+        ids = [result["result"] if result["error"] is None else None for result in results]
+        duplicates = [n for n, result in enumerate(results) if result["error"] == DUPLICATE_ERROR]
+        claimed = {entry["id"] for entry in entries if entry["id"]} | {id for id in ids if id is not None}
+        resolved = DuplicateResolver().resolve([new[n]["note"] for n in duplicates], claimed=claimed)
+        for n, id in zip(duplicates, resolved):
+            ids[n] = id
+
+        for entry, result, id in zip(new, results, ids):
+            if id is None:
+                logger.warning(f"Queued note could not be added: {result['error']}")
+
+        if journal is not None:
+            journal.write(
+                {"file": entry["file"], "ordinal": entry["ordinal"], "fingerprint": entry["fingerprint"], "id": id}
+                for entry, id in zip(new, ids)
+                if id is not None
+            )
+
+        # # # media =====
+        if self.media:
+            store_media(self.media, data=media_data)
+
+        counts = {
+            "added": sum(id is not None for id in ids),
+            "updated": len(set(plan.fields).union(*plan.added_tags.values(), *plan.removed_tags.values())),
+            "moved": sum(len(cards) for cards in moves.values()),
+            "media": len(self.media),
+        }
+
+        self.clear()
+        logger.info(f"Offline queue flushed: {counts}")
+        return counts
@@ -1,36 +1,56 @@
-import yaml
+import functools
+from pathlib import Path
 
-with open("src/ankicli/config/parse_config.yaml", "r") as f:
-    configs = yaml.safe_load(f)
+"""Module building the regular expressions used for parsing, from the patterns defined in the parse config.
+The config is only read the first time the expressions are accessed (through re_exprs.precompiled)."""
 
-
-q = configs.get("question_identifiers")
-a = configs.get("answer_identifiers")
-i = configs.get("inline_identifiers")
+config_path = Path(__file__).parent / "config" / "parse_config.yaml"
 
 id_re = r"(((?P<nid><!--ID: )|(?P<sid>\^))(?P<id>\d+)(?(nid)-->|))"
 
-q_s = q.get("start", "")
-q_e = q.get("end", "")
-q_re = rf"^({q_s}[ \t]*)(?P<question_text>.*?)([ \t]*{q_e})[ \t\n]*?$"
-
-a_s = a.get("start", "")
-a_e = a.get("end", "")
-a_re = rf"^({a_s}[ \t]*)(?P<answer_text>.*?)([ \t]*{a_e})[ \t\n]*?$"
-
-i_s = i.get("start", "")
-i_e = i.get("end", "")
-i_b = i.get("basic", "::")
-i_r = i.get("reversed", ":::")
-i_b_re = rf"^({i_s}[ \t]*)(?P<question_text>.*?)([ \t]*{i_b}[ \t]*)(?P<answer_text>.*?)[ \t]*{id_re}?\n?$"
-i_r_re = rf"^({i_s}[ \t]*)(?P<question_text>.*?)([ \t]*{i_r}[ \t]*)(?P<answer_text>.*?)[ \t]*{id_re}?\n?$"
-
-precompiled = dict(
-    properties="^---$|^...$",
-    question=q_re,
-    answer=a_re,
-    id=id_re,
-    empty_line=r"^(\s+)?\n",
-    inline_card=i_b_re,
-    inline_reverse_card=i_r_re,
-)
+
+@functools.cache
+def load_precompiled() -> dict:
+    """Function to read the parse config and build the dictionary of regular expressions"""
+
+    import yaml
+
+    with open(config_path, "r") as f:
+        configs = yaml.safe_load(f)
+
+    q = configs.get("question_identifiers")
+    a = configs.get("answer_identifiers")
+    i = configs.get("inline_identifiers")
+
+    q_s = q.get("start", "")
+    q_e = q.get("end", "")
+    q_re = rf"^({q_s}[ \t]*)(?P<question_text>.*?)([ \t]*{q_e})[ \t\n]*?$"
+
+    a_s = a.get("start", "")
+    a_e = a.get("end", "")
+    a_re = rf"^({a_s}[ \t]*)(?P<answer_text>.*?)([ \t]*{a_e})[ \t\n]*?$"
+
+    i_s = i.get("start", "")
+    i_e = i.get("end", "")
+    i_b = i.get("basic", "::")
+    i_r = i.get("reversed", ":::")
+    i_b_re = rf"^({i_s}[ \t]*)(?P<question_text>.*?)([ \t]*{i_b}[ \t]*)(?P<answer_text>.*?)[ \t]*{id_re}?\n?$"
+    i_r_re = rf"^({i_s}[ \t]*)(?P<question_text>.*?)([ \t]*{i_r}[ \t]*)(?P<answer_text>.*?)[ \t]*{id_re}?\n?$"
+
+    return dict(
+        properties="^---$|^...$",
+        question=q_re,
+        answer=a_re,
+        id=id_re,
+        endline_id=id_re + r"\n$",
+        empty_line=r"^(\s+)?\n",
+        inline_card=i_b_re,
+        inline_reverse_card=i_r_re,
+    )
+
+
+def __getattr__(name):
+    # lazily build the expressions the first time they are accessed
+    if name == "precompiled":
+        return load_precompiled()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,131 @@
+import re
+from html.parser import HTMLParser
+
+"""Module to convert the html of anki fields back to the markdown understood by the renderer"""
+
+# inline tags and the markdown delimiters replacing them
+INLINE_TAGS = {"strong": "**", "b": "**", "em": "*", "i": "*", "mark": "==", "code": "`", "s": "~~", "del": "~~"}
+BLOCK_TAGS = {"p", "div", "ul", "ol", "li", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "hr"}
+
+EXTRA_NEWLINES = re.compile(r"\n{3,}")
+
+
+class MarkdownConverter(HTMLParser):
+    """html parser writing the markdown equivalent of the html it is fed.
+
+    It handles the html produced by the renderer (paragraphs, emphasis, mark, code, links, lists, headings, images as
+    ![[filename]] and mathjax as $...$ / $$...$$) as well as the html written by the anki editor (div, br, b, i and
+    \\(...\\) / \\[...\\] mathjax)."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.lists = []
+        self.links = []
+        self.math = None
+        self.math_div = False
+        self.block_stack = []
+        self.last_tag = None
+
+    def newline(self, n: int = 1) -> None:
+        """Method to end the current line, leaving n line breaks after the text written so far"""
+
+        text = "".join(self.parts).rstrip(" ")
+        if text:
+            self.parts = [text.rstrip("\n") + "\n" * n]
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+
+        # a div starts a new line, unless it only wraps block mathjax
+        if self.last_tag == "div" and tag != "anki-mathjax":
+            self.newline()
+
+        if tag == "anki-mathjax":
+            # the renderer wraps block mathjax in a div
+            self.math_div = self.last_tag == "div"
+            self.math = "$$" if attrs.get("block") == "true" or self.math_div else "$"
+            self.parts.append(self.math)
+        elif tag in INLINE_TAGS:
+            self.parts.append(INLINE_TAGS[tag])
+        elif tag == "a":
+            self.links.append(attrs.get("href", ""))
+            self.parts.append("[")
+        elif tag == "img":
+            self.parts.append(f"![[{attrs.get('src', '')}]]")
+        elif tag == "br":
+            self.parts.append("\n")
+        elif tag in ("ul", "ol"):
+            self.newline()
+            self.lists.append([tag, 0])
+        elif tag == "li":
+            self.newline()
+            kind = self.lists[-1] if self.lists else ["ul", 0]
+            kind[1] += 1
+            indent = "  " * (len(self.lists) - 1)
+            self.parts.append(f"{indent}- " if kind[0] == "ul" else f"{indent}{kind[1]}. ")
+        elif tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self.newline(2)
+            self.parts.append("#" * int(tag[1]) + " ")
+        elif tag == "hr":
+            self.newline(2)
+            self.parts.append("---")
+            self.newline(2)
+
+        if tag in BLOCK_TAGS and tag not in ("li", "hr"):
+            self.block_stack.append(tag)
+
+        self.last_tag = tag
+
+    def handle_endtag(self, tag):
+        if tag == "anki-mathjax":
+            self.parts.append(self.math or "$")
+            self.math = None
+        elif tag in INLINE_TAGS:
+            self.parts.append(INLINE_TAGS[tag])
+        elif tag == "a":
+            self.parts.append(f"]({self.links.pop() if self.links else ''})")
+        elif tag in ("ul", "ol"):
+            if self.lists:
+                self.lists.pop()
+            self.newline(1 if self.lists else 2)
+        elif tag in ("p", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote"):
+            self.newline(2)
+        elif tag == "div":
+            if self.math_div:
+                self.math_div = False
+            else:
+                self.newline()
+
+        if self.block_stack and self.block_stack[-1] == tag:
+            self.block_stack.pop()
+
+        self.last_tag = None
+
+    def handle_data(self, data):
+        # whitespace between block tags is not part of the text
+        if data.strip() or "\n" not in data:
+            if self.last_tag == "div":
+                self.newline()
+            self.parts.append(data)
+            self.last_tag = None
+
+    def markdown(self) -> str:
+        """Method returning the markdown written so far"""
+
+        text = "".join(self.parts)
+        return EXTRA_NEWLINES.sub("\n\n", text).strip()
+
+
+def html_to_markdown(html: str) -> str:
+    """Function to convert the html of an anki field to markdown"""
+
+    # mathjax written by the anki editor
+    html = re.sub(r"\\\((.+?)\\\)", r"<anki-mathjax>\1</anki-mathjax>", html, flags=re.S)
+    html = re.sub(r"\\\[(.+?)\\\]", r'<anki-mathjax block="true">\1</anki-mathjax>', html, flags=re.S)
+
+    converter = MarkdownConverter()
+    converter.feed(html)
+    converter.close()
+
+    return converter.markdown()
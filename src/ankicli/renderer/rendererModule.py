@@ -1,8 +1,27 @@
-import mistune
-from mistune.plugins.formatting import mark
+import functools
 
-from ankicli.renderer.img_plugin import img
-from ankicli.renderer.mathjax_plugin import mathjax
+"""Module building the mistune markdown renderer. The renderer (and mistune itself) is only created the first time it
+is needed, through get_markdown."""
 
-renderer = mistune.HTMLRenderer()
-markdown = mistune.Markdown(renderer, plugins=[mark, mathjax, img])
+
+@functools.cache
+def get_markdown():
+    """Function returning the shared markdown renderer, creating it on first use"""
+
+    import mistune
+    from mistune.plugins.formatting import mark
+
+    from ankicli.renderer.img_plugin import img
+    from ankicli.renderer.mathjax_plugin import mathjax
+
+    renderer = mistune.HTMLRenderer()
+    return mistune.Markdown(renderer, plugins=[mark, mathjax, img])
+
+
+def __getattr__(name):
+    # keep 'rendererModule.markdown' and 'rendererModule.renderer' available as before
+    if name == "markdown":
+        return get_markdown()
+    if name == "renderer":
+        return get_markdown().renderer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,216 @@
+import sqlite3
+import time
+from pathlib import Path
+
+from ankicli.logModule import get_logger
+
+"""Module handling the local sync-state database, mapping anki note ids to files, cards and content fingerprints"""
+
+# set up logger
+logger = get_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    note_id INTEGER PRIMARY KEY,
+    file_path TEXT NOT NULL,
+    ordinal INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    deck TEXT NOT NULL,
+    last_sync REAL NOT NULL,
+    tags TEXT,
+    mod INTEGER
+);
+CREATE INDEX IF NOT EXISTS notes_fingerprint ON notes (fingerprint);
+CREATE INDEX IF NOT EXISTS notes_file ON notes (file_path, ordinal);
+"""
+
+# columns added after the first version of the schema
+MIGRATIONS = {"tags": "ALTER TABLE notes ADD COLUMN tags TEXT", "mod": "ALTER TABLE notes ADD COLUMN mod INTEGER"}
+
+
+def file_key(path) -> str:
+    """Function returning the key used to store a file path (absolute, so that it does not depend on the cwd)"""
+    return Path(path).resolve().as_posix()
+
+
+def tags_key(tags) -> str:
+    """Function returning the key used to store a set of tags (anki tags are case-insensitive)"""
+    return " ".join(sorted({tag.casefold() for tag in tags}))
+
+
+def is_modified(record: dict | None, notes, i: int) -> bool:
+    """Function to check whether a row of a NoteStore changed (content, deck or tags) since it was recorded"""
+
+    return (
+        record is None
+        or record["fingerprint"] != notes.fingerprint(i)
+        or record["deck"] != notes.deckName
+        or record["tags"] != tags_key(notes.tags)
+    )
+
+
+class SyncState:
+    """On-disk (sqlite) record of the last sync: for every note id, the file and card ordinal it comes from, a
+    fingerprint of its content, its deck and tags, its modification time in anki and the time of the last sync.
+
+    The state allows O(1) lookups by id (primary key), fingerprint and file (indexed), finding duplicate cards across
+    files and cards deleted from a file. It can also hold the ids of the cards instead of the markdown files (sidecar
+    mode, see assign_ids)."""
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        # the state can be shared by threads that serialize their access to it (see SyncPipeline)
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.row_factory = sqlite3.Row
+        self.con.executescript(SCHEMA)
+        self.migrate()
+
+    def migrate(self) -> None:
+        """Method to add the columns missing from a database created by an older version"""
+
+        columns = {row["name"] for row in self.con.execute("PRAGMA table_info(notes)")}
+        with self.con:
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    self.con.execute(statement)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self.con.close()
+
+    # # # lookups =====
+    def get(self, note_id: int) -> dict | None:
+        """Method returning the record of a note, None if the note is unknown"""
+
+        row = self.con.execute("SELECT * FROM notes WHERE note_id = ?", (note_id,)).fetchone()
+        return None if row is None else dict(row)
+
+    def records(self, note_ids) -> dict[int, dict]:
+        """Method returning the records of the given notes (unknown notes are left out), as {note id: record}"""
+
+        note_ids = list(note_ids)
+        records = {}
+        for start in range(0, len(note_ids), 500):
+            chunk = note_ids[start : start + 500]
+            rows = self.con.execute(f"SELECT * FROM notes WHERE note_id IN ({','.join('?' * len(chunk))})", chunk)
+            records.update((row["note_id"], dict(row)) for row in rows)
+
+        return records
+
+    def by_fingerprint(self, fingerprint: str) -> list[dict]:
+        """Method returning the records of the notes with the given content fingerprint"""
+
+        rows = self.con.execute("SELECT * FROM notes WHERE fingerprint = ?", (fingerprint,))
+        return [dict(row) for row in rows]
+
+    def file_notes(self, path) -> list[dict]:
+        """Method returning the records of the notes of a file, ordered by card ordinal"""
+
+        rows = self.con.execute("SELECT * FROM notes WHERE file_path = ? ORDER BY ordinal", (file_key(path),))
+        return [dict(row) for row in rows]
+
+    def duplicates(self) -> dict[str, list[dict]]:
+        """Method returning the notes sharing the same content fingerprint, as {fingerprint: [records]}"""
+
+        rows = self.con.execute(
+            "SELECT * FROM notes WHERE fingerprint IN "
+            "(SELECT fingerprint FROM notes GROUP BY fingerprint HAVING COUNT(*) > 1) "
+            "ORDER BY fingerprint, file_path, ordinal"
+        )
+
+        duplicates = {}
+        for row in rows:
+            duplicates.setdefault(row["fingerprint"], []).append(dict(row))
+
+        return duplicates
+
+    def fingerprint_index(self) -> dict[str, list[int]]:
+        """Method returning the identity index of every recorded note, as {fingerprint: [note ids]}"""
+
+        index = {}
+        for fingerprint, note_id in self.con.execute("SELECT fingerprint, note_id FROM notes ORDER BY note_id"):
+            index.setdefault(fingerprint, []).append(note_id)
+
+        return index
+
+    def deleted_cards(self, nset) -> list[int]:
+        """Method returning the ids recorded for the file of a NoteSet that are not in the file anymore"""
+
+        present = set(nset.notes.get_ids(nset.notes.cards()))
+        return [record["note_id"] for record in self.file_notes(nset.file_path) if record["note_id"] not in present]
+
+    # # # updates =====
+    def record(self, nset, sync_time: float | None = None, mods: dict[int, int] | None = None) -> None:
+        """Method to record the current state of a NoteSet, replacing the previous records of its file. mods holds the
+        modification times of the notes in anki, as {note id: mod}."""
+
+        notes = nset.notes
+        sync_time = time.time() if sync_time is None else sync_time
+        path = file_key(nset.file_path)
+        tags = tags_key(notes.tags)
+        mods = {} if mods is None else mods
+
+        rows = [
+            (notes.ids[i], path, ordinal, notes.fingerprint(i), notes.deckName, sync_time, tags, mods.get(notes.ids[i]))
+            for i, ordinal in notes.ordinals().items()
+            if notes.get_id(i) is not None
+        ]
+
+        with self.con:
+            self.con.execute("DELETE FROM notes WHERE file_path = ?", (path,))
+            self.con.executemany(
+                "INSERT OR REPLACE INTO notes (note_id, file_path, ordinal, fingerprint, deck, last_sync, tags, mod) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def forget(self, note_ids) -> None:
+        """Method to remove notes from the state"""
+
+        with self.con:
+            self.con.executemany("DELETE FROM notes WHERE note_id = ?", [(id,) for id in note_ids])
+
+    # # # sidecar mode =====
+    def assign_ids(self, nset) -> list[int]:
+        """Method to give their recorded id to the cards of a NoteSet that don't have one in the file (sidecar mode).
+        Cards are matched by content fingerprint first, then by position in the file (edited cards).
+        Returns the rows that received an id."""
+
+        notes = nset.notes
+        records = self.file_notes(nset.file_path)
+        by_fingerprint = {}
+        for record in records:
+            by_fingerprint.setdefault(record["fingerprint"], []).append(record["note_id"])
+        by_ordinal = {record["ordinal"]: record["note_id"] for record in records}
+
+        # ids already used in the file can't be assigned again
+        used = set(notes.get_ids(notes.cards()))
+        ordinals = notes.ordinals()
+        new_rows = notes.new_cards()
+        assigned = {}
+
+        # exact content matches
+        for i in new_rows:
+            for id in by_fingerprint.get(notes.fingerprint(i), []):
+                if id not in used:
+                    assigned[i] = id
+                    used.add(id)
+                    break
+
+        # cards edited in place keep the id recorded at their position
+        for i in new_rows:
+            id = by_ordinal.get(ordinals[i])
+            if i not in assigned and id is not None and id not in used:
+                assigned[i] = id
+                used.add(id)
+
+        for i, id in assigned.items():
+            notes.set_id(i, id)
+
+        logger.debug(f"Assigned {len(assigned)} ids from the sync state to {nset.file_path}")
+        return list(assigned)
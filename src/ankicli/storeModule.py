@@ -0,0 +1,162 @@
+import hashlib
+from array import array
+
+from ankicli import parseModule
+
+"""Module defining a compact columnar store for the cards of a single file"""
+
+# ids are stored in a signed 64 bit array: anki ids are positive timestamps, so 0 marks a missing id
+NO_ID = 0
+
+
+class NoteStore:
+    """Columnar container holding every text block of a file (cards and plain text alike).
+
+    Each row is a group of lines as returned by parseModule.group_lines. Columns are plain lists / arrays, ids are
+    nullable integers (NO_ID stands for a missing id), deck and tags are shared by every row of the file.
+    Row selections are returned as lists of row positions, so no data is copied when filtering."""
+
+    __slots__ = ("text", "front", "back", "ids", "inline", "modelName", "is_card", "deckName", "tags")
+
+    def __init__(self, deckName: str | None = None, tags=()):
+        self.text = []
+        self.front = []
+        self.back = []
+        self.ids = array("q")
+        self.inline = bytearray()
+        self.modelName = []
+        self.is_card = bytearray()
+        self.deckName = deckName
+        self.tags = tuple(tags)
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def append(self, text: list[str], card: parseModule.ParsedCard) -> int:
+        """Method to append a row to the store. Returns the position of the new row."""
+
+        self.text.append(text)
+        self.front.append(card.front)
+        self.back.append(card.back)
+        self.ids.append(NO_ID if card.id is None else card.id)
+        self.inline.append(card.inline)
+        self.modelName.append(card.modelName)
+        self.is_card.append(card.is_card)
+
+        return len(self.text) - 1
+
+    def copy(self, keep_ids: bool = True) -> "NoteStore":
+        """Method returning a copy of the store whose columns can be modified independently. The rows themselves (text
+        lines, rendered fields) are shared, as they are replaced rather than modified. With keep_ids=False every row of
+        the copy is without id, but the text lines are left as they are."""
+
+        store = NoteStore(self.deckName, self.tags)
+        store.text = list(self.text)
+        store.front = list(self.front)
+        store.back = list(self.back)
+        store.ids = array("q", self.ids) if keep_ids else array("q", bytes(8 * len(self.ids)))
+        store.inline = bytearray(self.inline)
+        store.modelName = list(self.modelName)
+        store.is_card = bytearray(self.is_card)
+
+        return store
+
+    # # # row selections =====
+    def cards(self) -> list[int]:
+        """Method returning the positions of the rows that are cards"""
+        return [i for i, c in enumerate(self.is_card) if c]
+
+    def new_cards(self) -> list[int]:
+        """Method returning the positions of the cards that don't have an id"""
+        ids = self.ids
+        return [i for i, c in enumerate(self.is_card) if c and ids[i] == NO_ID]
+
+    def existing_cards(self) -> list[int]:
+        """Method returning the positions of the cards that already have an id"""
+        ids = self.ids
+        return [i for i, c in enumerate(self.is_card) if c and ids[i] != NO_ID]
+
+    # # # accessors =====
+    def get_id(self, i: int) -> int | None:
+        """Method returning the id of a row, None if it is missing"""
+        id = self.ids[i]
+        return None if id == NO_ID else id
+
+    def get_ids(self, rows: list[int]) -> list[int]:
+        """Method returning the ids of the given rows (rows without an id are skipped)"""
+        ids = self.ids
+        return [ids[i] for i in rows if ids[i] != NO_ID]
+
+    def set_id(self, i: int, id: int | None) -> None:
+        """Method to set (or delete, if id is None) the id of a row, updating its text lines accordingly"""
+
+        self.ids[i] = NO_ID if id is None else id
+        self.text[i] = parseModule.replace_card_id(self.text[i], id, bool(self.inline[i]))
+
+    def exclude(self, rows: list[int]) -> None:
+        """Method to stop treating the given rows as cards. Their text is kept, so they are still saved to file."""
+
+        for i in rows:
+            self.is_card[i] = False
+
+    def fields(self, i: int) -> dict:
+        """Method returning the anki fields of a row"""
+        return {"Front": self.front[i], "Back": self.back[i]}
+
+    def note(self, i: int, with_id: bool = False) -> dict:
+        """Method returning a row as an ankiConnect note"""
+
+        note = {
+            "deckName": self.deckName,
+            "modelName": self.modelName[i],
+            "fields": self.fields(i),
+            "tags": list(self.tags),
+        }
+
+        if with_id:
+            note["id"] = self.ids[i]
+
+        return note
+
+    def notes(self, rows: list[int], with_id: bool = False) -> list[dict]:
+        """Method returning the given rows as a list of ankiConnect notes"""
+        return [self.note(i, with_id) for i in rows]
+
+    def fingerprint(self, i: int) -> str:
+        """Method returning a fingerprint of the content of a row (model and fields)"""
+
+        content = "\x1f".join((self.modelName[i], self.front[i], self.back[i]))
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def ordinals(self) -> dict[int, int]:
+        """Method returning a dictionary {row: ordinal}, the ordinal being the position of the card among the cards of
+        the file"""
+        return {i: n for n, i in enumerate(self.cards())}
+
+    def record(self, i: int) -> dict:
+        """Method returning all the information about a row as a dictionary"""
+
+        return {
+            "text": self.text[i],
+            "front": self.front[i],
+            "back": self.back[i],
+            "id": self.get_id(i),
+            "inline": bool(self.inline[i]),
+            "modelName": self.modelName[i],
+            "is_card": bool(self.is_card[i]),
+            "deckName": self.deckName,
+            "tags": list(self.tags),
+        }
+
+    def lines(self):
+        """Method returning an iterator over the text lines of every row, in order"""
+        return (line for group in self.text for line in group)
+
+    def to_dataframe(self):
+        """Method to export the store as a pandas.DataFrame, mainly for inspection and debugging"""
+
+        import pandas as pd
+
+        df = pd.DataFrame([self.record(i) for i in range(len(self))])
+        df["id"] = df["id"].astype("Int64")
+        return df
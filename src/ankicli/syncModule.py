@@ -0,0 +1,579 @@
+import contextlib
+from pathlib import Path
+
+from ankicli.anki_api import deckModule
+from ankicli.anki_api.collectionModule import CollectionReader
+from ankicli.anki_api.mediaModule import store_media
+from ankicli.anki_api.searchModule import DUPLICATE_ERROR, DuplicateResolver, deck_query
+from ankicli.anki_api.snapshotModule import RemoteSnapshot, fetch_mod_times
+from ankicli.diffModule import UpdatePlan
+from ankicli.anki_api.requestModule import (
+    CHUNK_SIZE,
+    Deadline,
+    RequestTimeout,
+    check_connection,
+    chunks,
+    make_action,
+    request_multi,
+)
+from ankicli.journalModule import IdJournal
+from ankicli.logModule import get_logger
+from ankicli.noteModule2 import ADDED, DUPLICATE, NoteSet, add_notes, split_add_results
+from ankicli.queueModule import OfflineQueue
+from ankicli.stateModule import SyncState, is_modified
+
+"""Module to synchronize a whole vault at once, batching the network work of every file"""
+
+# set up logger
+logger = get_logger(__name__)
+
+
+def group_by_noteset(pairs: list, values: list) -> dict:
+    """Function to route values back to the NoteSet owning them. pairs is a list of (NoteSet, row) tuples aligned with
+    values; returns a dictionary {NoteSet: ([rows], [values])}."""
+
+    grouped = {}
+    for (nset, i), value in zip(pairs, values):
+        rows, vals = grouped.setdefault(nset, ([], []))
+        rows.append(i)
+        vals.append(value)
+
+    return grouped
+
+
+def rows_by_noteset(pairs: list) -> dict:
+    """Function grouping a list of (NoteSet, row) tuples by NoteSet; returns a dictionary {NoteSet: [rows]}"""
+
+    grouped = {}
+    for nset, i in pairs:
+        grouped.setdefault(nset, []).append(i)
+
+    return grouped
+
+
+class VaultSync:
+    """Orchestrator running every sync phase once for all the files of a vault.
+
+    Files are parsed first, then each network phase (deck check, notes check, upload, update, media) sends a single
+    (chunked) batch of requests for the whole vault, and the results are routed back to the owning NoteSet.
+
+    If a SyncState is given, the state of every file is recorded after the sync, with the modification time of every
+    note in anki. The next syncs then only fetch the modification times of the existing notes, and download the notes
+    changed on either side since. Notes edited in anki are reported (and overwritten by the markdown), or pulled back
+    into the markdown with pull_remote=True; notes edited on both sides are reported as conflicts, the markdown wins.
+    Cards moved to another deck in anki without a note edit are not detected in this mode.
+    With write_ids=False the ids are only kept in the state (sidecar mode) and the markdown files are never rewritten.
+
+    If an IdJournal is given, the ids of the new notes are journaled as soon as anki returns them and restored at the
+    next run if the sync is interrupted before the files are saved.
+
+    If an OfflineQueue is given and anki is not reachable, the vault is queued instead of synced; the queue is flushed
+    at the next run that finds anki open (with a journal, the ids of the queued new notes then reach the files).
+
+    If a CollectionReader is given, the state of the existing notes is read from the local anki collection instead of
+    being requested to ankiConnect; every write still goes through ankiConnect.
+
+    The media are sent by path to a local anki and as base64 data to a remote one (see mediaModule); media_data forces
+    either form, e.g. media_data=True for an anki reached through an ssh tunnel."""
+
+    def __init__(
+        self,
+        nsets: list[NoteSet],
+        state: SyncState | None = None,
+        write_ids: bool = True,
+        journal: IdJournal | None = None,
+        queue: OfflineQueue | None = None,
+        collection: CollectionReader | None = None,
+        pull_remote: bool = False,
+        media_data: bool | None = None,
+    ):
+        if state is None and not write_ids:
+            raise ValueError("A SyncState is needed to keep the ids out of the markdown files.")
+        if pull_remote and not write_ids:
+            # the pulled edits would only reach the state, and the next sync would send the old markdown back
+            raise ValueError("The edits made in anki can't be pulled when the markdown files are not written.")
+
+        self.nsets = nsets
+        self.state = state
+        self.write_ids = write_ids
+        self.journal = journal
+        self.queue = queue
+        self.collection = collection
+        self.pull_remote = pull_remote
+        self.media_data = media_data
+        self.snapshot = None
+        self.removed_cards = {}
+        self.mod_times = {}
+        self.written = set()
+        self.remote_edits = []
+        self.conflicts = []
+        self.stage = None
+        self.completed = []
+        self.saved = False
+
+    @classmethod
+    def from_directory(cls, directory, pattern="*.md", **kwargs):
+        """Method to instantiate a VaultSync object parsing every file matching pattern in directory. Keyword
+        arguments are passed to the constructor."""
+
+        directory = Path(directory)
+
+        if not directory.exists() or not directory.is_dir():
+            raise ValueError(f"Directory {directory} does not exist or is not a directory.")
+
+        logger.info(f"Parsing vault: {directory}")
+        return cls([NoteSet.from_file(file) for file in sorted(directory.glob(pattern))], **kwargs)
+
+    def run(self, prune: bool = False, deadline: float | None = None) -> bool:
+        """Method to run the whole sync. If prune is True, the notes of the vault decks that are not in the vault
+        anymore are deleted from anki at the end.
+
+        deadline is the time (in seconds) given to the whole sync: every stage and request only gets the time left.
+        If it runs out, or if anki stops answering, the sync stops cleanly (see stop). Returns False if the sync was
+        stopped before the end, or queued because anki is not reachable."""
+
+        with Deadline(deadline) if deadline is not None else contextlib.nullcontext() as limit:
+            try:
+                return self.run_stages(prune, limit)
+            except RequestTimeout as e:
+                self.stop(e)
+                return False
+
+    def run_stages(self, prune: bool = False, deadline: Deadline | None = None) -> bool:
+        """Method running the sync stages in order, checking the deadline (if any) before each of them. Returns False if
+        the vault was queued instead of synced."""
+
+        # apply the changes queued while anki was not reachable
+        connected = self.queue is None or check_connection()
+        if connected and self.queue is not None:
+            self.queue.flush(self.journal, media_data=self.media_data)
+
+        if self.journal is not None:
+            self.journal.replay(self.nsets)
+
+        if self.state is not None:
+            self.load_state()
+
+        if not connected:
+            self.queue.enqueue(self.nsets)
+            logger.warning(f"Anki is not reachable: the sync was queued to {self.queue.path}")
+            return False
+
+        stages = [
+            ("deck check", self.check_decks),
+            ("note check", self.check_notes),
+            ("upload", self.upload_new_notes),
+            ("update", self.update_existing_notes),
+            ("media upload", self.upload_media),
+        ]
+        if self.state is not None:
+            stages.append(("modification times", self.refresh_mod_times))
+
+        for name, stage in stages:
+            self.stage = name
+            if deadline is not None:
+                deadline.check("sync")
+                logger.debug(f"Stage {self.stage}: {deadline.remaining():.1f} seconds left")
+
+            stage()
+            self.completed.append(self.stage)
+
+        self.stage = "save"
+        self.save_files()
+
+        if prune:
+            self.stage = "prune"
+            self.prune()
+
+        return True
+
+    def stop(self, error: Exception) -> None:
+        """Method to end a sync interrupted by a timeout. The files are saved, so that the ids of the notes added so far
+        are not lost; they are recorded in the sync state without modification times, so every note is checked again
+        at the next sync. A report of the progress made is printed."""
+
+        logger.warning(f"Sync stopped during the {self.stage} stage: {error}")
+
+        if not self.saved:
+            self.save_files(partial=True)
+
+        progress = self.progress()
+        print(
+            f"The sync was stopped during the {self.stage} stage ({error}). Completed stages: "
+            f"{', '.join(self.completed) or 'none'}. {progress['added']} notes added and {progress['updated']} notes "
+            "updated so far; the files were saved, run the sync again to finish it."
+        )
+
+    def progress(self) -> dict:
+        """Method returning the progress of the sync: completed stages, current stage, notes added and updated"""
+
+        added = {nset.notes.ids[i] for nset in self.nsets for i, outcome in nset.outcomes.items() if outcome == ADDED}
+        return {
+            "completed": list(self.completed),
+            "stage": self.stage,
+            "added": len(added),
+            "updated": len(self.written - added),
+        }
+
+    def load_state(self) -> None:
+        """Method to read the sync state: in sidecar mode, cards get their ids from it; cards without an id whose
+        content was recorded under another file are recognized as moved (see match_moved_cards); cards that were
+        removed from their file since the last sync are collected in removed_cards."""
+
+        if not self.write_ids:
+            for nset in self.nsets:
+                self.state.assign_ids(nset)
+
+        self.match_moved_cards()
+
+        vault_ids = self.vault_ids()
+        for nset in self.nsets:
+            removed = [id for id in self.state.deleted_cards(nset) if id not in vault_ids]
+            if removed:
+                logger.info(f"{len(removed)} cards were removed from {nset.file_path}")
+                self.removed_cards[nset.file_path] = removed
+
+    def match_moved_cards(self) -> list[tuple[NoteSet, int]]:
+        """Method to give back their id to the cards that lost it while being moved across the vault (e.g. to a file
+        with another deck). Cards without an id are looked up by content fingerprint in the identity index of the sync
+        state; ids still used somewhere in the vault are not reassigned. The deck of the matched notes is then fixed by
+        check_notes, with one changeDeck per target deck, instead of adding the notes again.
+        Returns the matched (NoteSet, row) pairs."""
+
+        pairs = self.new_cards()
+        if not pairs:
+            return []
+
+        index = self.state.fingerprint_index()
+        used = self.vault_ids()
+
+        matched = []
+        for nset, i in pairs:
+            for id in index.get(nset.notes.fingerprint(i), ()):
+                if id not in used:
+                    nset.notes.set_id(i, id)
+                    used.add(id)
+                    matched.append((nset, i))
+                    break
+
+        if matched:
+            logger.info(f"{len(matched)} moved cards found in the sync state")
+
+        return matched
+
+    def vault_ids(self) -> set[int]:
+        """Method returning the ids of every card of the vault"""
+        return {id for nset in self.nsets for id in nset.notes.get_ids(nset.notes.cards())}
+
+    def new_cards(self) -> list[tuple[NoteSet, int]]:
+        """Method returning (NoteSet, row) pairs for every card of the vault that doesn't have an id"""
+        return [(nset, i) for nset in self.nsets for i in nset.notes.new_cards()]
+
+    def existing_cards(self) -> list[tuple[NoteSet, int]]:
+        """Method returning (NoteSet, row) pairs for every card of the vault that already has an id"""
+        return [(nset, i) for nset in self.nsets for i in nset.notes.existing_cards()]
+
+    def fetch_snapshot(self, ids) -> RemoteSnapshot:
+        """Method returning a snapshot of the given notes, read from the local collection if one was given, requested to
+        anki otherwise"""
+
+        if self.collection is not None:
+            return self.collection.snapshot(ids)
+        return RemoteSnapshot.fetch(ids)
+
+    def fetch_mod_times(self, ids) -> dict[int, int]:
+        """Method returning the modification times of the given notes, read from the local collection if one was
+        given, requested to anki otherwise"""
+
+        if self.collection is not None:
+            return self.collection.mod_times(ids)
+        return fetch_mod_times(ids)
+
+    def changed_cards(self, pairs: list[tuple[NoteSet, int]]) -> tuple[list, list]:
+        """Method to find the existing cards changed since the last sync, in the markdown (content, deck or tags) or in
+        anki (modification time). Returns the changed (NoteSet, row) pairs and the (NoteSet, row, changed locally)
+        tuples of the notes edited in anki."""
+
+        ids = [nset.notes.ids[i] for nset, i in pairs]
+        mods = self.fetch_mod_times(ids)
+        self.mod_times.update(mods)
+        records = self.state.records(ids)
+
+        changed, edited = [], []
+        for (nset, i), id in zip(pairs, ids):
+            record = records.get(id)
+            local = is_modified(record, nset.notes, i)
+            remote = id not in mods or record is None or record["mod"] != mods[id]
+
+            if local or remote:
+                changed.append((nset, i))
+            if remote and id in mods and record is not None and record["mod"] is not None:
+                edited.append((nset, i, local))
+
+        logger.info(f"{len(changed)} of {len(pairs)} existing notes changed since the last sync")
+        return changed, edited
+
+    def handle_remote_edits(self, edited: list[tuple[NoteSet, int, bool]]) -> None:
+        """Method to report the notes edited in anki since the last sync, or to pull them back into the markdown"""
+
+        for nset, i, local in edited:
+            id = nset.notes.ids[i]
+            if not self.snapshot.exists(id):
+                continue
+
+            if local:
+                self.conflicts.append((nset.file_path, id))
+            elif self.pull_remote:
+                nset.pull_note(i, self.snapshot.fields(id))
+            else:
+                self.remote_edits.append((nset.file_path, id))
+
+        if self.conflicts:
+            print(f"{len(self.conflicts)} notes were edited both in anki and in the vault, the vault version is kept.")
+        if self.remote_edits:
+            print(f"{len(self.remote_edits)} notes edited in anki are overwritten by the vault version.")
+
+    def refresh_mod_times(self) -> None:
+        """Method to read the modification times of the notes written during the sync, to record them in the state"""
+
+        written = [id for id in self.written if id]
+        if written:
+            self.mod_times.update(fetch_mod_times(written))
+
+    def check_decks(self) -> None:
+        """Method to check that the decks of every file exist, creating the missing ones"""
+
+        logger.debug("Checking decks")
+        created = deckModule.ensure_decks({nset.deckName for nset in self.nsets})
+
+        if created:
+            logger.debug(f"Created decks: {created}")
+
+    def check_notes(self) -> None:
+        """Method to perform the NoteSet.check_notes checks (deleted notes, wrong deck notes) for the whole vault"""
+
+        logger.info("Checking notes")
+
+        # # # checks on existing notes =====
+        pairs = self.existing_cards()
+
+        if not pairs:
+            self.snapshot = RemoteSnapshot()
+            return
+
+        # with a sync state, only the notes changed on either side since the last sync are downloaded
+        edited = []
+        if self.state is not None:
+            pairs, edited = self.changed_cards(pairs)
+
+        # query the database once for everything about the existing notes of the vault
+        logger.debug("Querying anki for notes info")
+        self.snapshot = self.fetch_snapshot([nset.notes.ids[i] for nset, i in pairs])
+
+        # separate and repair deleted notes, then gather the cards in the wrong deck grouped by target deck
+        moves = {}
+        for nset, rows in rows_by_noteset(pairs).items():
+            rows = nset.check_deleted_notes(rows, self.snapshot)
+            cards = nset.wrong_deck_cards(rows, self.snapshot)
+
+            if cards:
+                moves.setdefault(nset.deckName, []).extend(cards)
+
+        self.adjust_notes_deck(moves)
+
+        if edited:
+            self.handle_remote_edits(edited)
+
+    @staticmethod
+    def adjust_notes_deck(moves: dict[str, list[int]]) -> None:
+        """Method to move cards to the deck they belong to. Takes a dictionary {target deck: [card ids]} and sends
+        one changeDeck action per target deck, in a single request."""
+
+        if moves:
+            logger.debug("Change cards deck")
+            request_multi([make_action("changeDeck", cards=cards, deck=deck) for deck, cards in moves.items()])
+
+    def upload_new_notes(self) -> None:
+        """Method to upload the new notes of the whole vault, one addNote action per note in a single (chunked) multi
+        request. Only the notes that failed go through the repair logic: duplicates of the whole vault are resolved at
+        once, the other errors are discarded. The outcome of every note is recorded in the outcomes of its NoteSet."""
+
+        logger.info("Uploading new notes")
+        pairs = self.new_cards()
+
+        for nset in self.nsets:
+            nset.outcomes = {}
+
+        if not pairs:
+            return
+
+        # notes are added one chunk at a time, so that the ids of every chunk can be journaled as they come back
+        errors = {}
+        for chunk in chunks(pairs, CHUNK_SIZE):
+            logger.debug("Adding cards to server")
+            results = add_notes([nset.notes.note(i) for nset, i in chunk])
+
+            logger.debug("Inserting ids into the cards' text")
+            for nset, (rows, results) in group_by_noteset(chunk, results).items():
+                ids, errs = split_add_results(rows, results)
+                errors.setdefault(nset, {}).update(errs)
+                for i, id in ids.items():
+                    nset.notes.set_id(i, id)
+                    nset.outcomes[i] = ADDED
+                    self.written.add(id)
+
+                if self.journal is not None:
+                    self.journal.append(nset, list(ids))
+
+        # a deck deleted in anki since the decks were downloaded is created again at the next sync
+        if any(str(e).startswith(deckModule.DECK_NOT_FOUND) for errs in errors.values() for e in errs.values()):
+            logger.warning("Some decks were not found in anki, they will be created again at the next sync")
+            deckModule.registry.invalidate()
+
+        # resolve the duplicates of the whole vault at once
+        logger.debug("Repairing duplicate notes")
+        duplicates = [(nset, i) for nset, errs in errors.items() for i, e in errs.items() if e == DUPLICATE_ERROR]
+        ids = DuplicateResolver().resolve([nset.notes.note(i) for nset, i in duplicates], claimed=self.vault_ids())
+
+        repaired = []
+        for (nset, i), id in zip(duplicates, ids):
+            if id is not None:
+                nset.notes.set_id(i, id)
+                nset.outcomes[i] = DUPLICATE
+                self.written.add(id)
+                repaired.append((nset, i))
+                del errors[nset][i]
+
+        if self.journal is not None:
+            for nset, rows in rows_by_noteset(repaired).items():
+                self.journal.append(nset, rows)
+
+        # repaired notes already exist: add them to the snapshot, so that they are moved and updated
+        if repaired:
+            snapshot = self.fetch_snapshot([nset.notes.ids[i] for nset, i in repaired])
+            self.snapshot = (self.snapshot or RemoteSnapshot()).merge(snapshot)
+
+            moves = {}
+            for nset, rows in rows_by_noteset(repaired).items():
+                cards = nset.wrong_deck_cards(rows, self.snapshot)
+                if cards:
+                    moves.setdefault(nset.deckName, []).extend(cards)
+
+            self.adjust_notes_deck(moves)
+
+        # the remaining notes could not be added
+        for nset, errs in errors.items():
+            if errs:
+                nset.discard_error_notes(errs)
+                nset.outcomes.update(errs)
+
+    def outcomes(self) -> dict:
+        """Method returning the outcome of the upload of every new note of the vault, as {file path: {row: outcome}}"""
+        return {nset.file_path: nset.outcomes for nset in self.nsets if nset.outcomes}
+
+    def update_existing_notes(self) -> None:
+        """Method to update the existing notes of the whole vault"""
+
+        logger.info("Updating existing notes")
+        pairs = self.existing_cards()
+
+        if not pairs:
+            return
+
+        # reuse the snapshot taken by check_notes
+        if self.snapshot is None:
+            logger.debug("Querying anki for existing notes")
+            self.snapshot = self.fetch_snapshot([nset.notes.ids[i] for nset, i in pairs])
+
+        logger.debug("Finding notes that have to be updated")
+        plan = UpdatePlan()
+        for nset, rows in rows_by_noteset(pairs).items():
+            nset.plan_updates(rows, self.snapshot, plan)
+
+        if plan:
+            logger.debug("Updating notes")
+            plan.send()
+            self.written.update(plan.fields, *plan.added_tags.values(), *plan.removed_tags.values())
+
+    def upload_media(self) -> None:
+        """Method to upload the media of the whole vault, every file only once"""
+
+        media = {}
+        for nset in self.nsets:
+            for file in nset.media:
+                media.setdefault(file["filename"], file["path"])
+
+        if media:
+            logger.debug("Uploading media")
+            store_media(media, data=self.media_data)
+
+    def save_files(self, clear_journal: bool = True, partial: bool = False) -> None:
+        """Method to save the updated lines of every file (unless in sidecar mode) and record them in the sync state.
+        With clear_journal=False the journal is kept, e.g. while other files are still being synced. With partial=True
+        (interrupted sync) the modification times are not recorded, so that every note is checked again."""
+
+        for nset in self.nsets:
+            if self.write_ids:
+                nset.save_file()
+            if self.state is not None:
+                self.state.record(nset, mods=None if partial else self.mod_times)
+
+        # every id is now saved, the journal is not needed anymore
+        if self.journal is not None and clear_journal:
+            self.journal.clear()
+
+        self.saved = True
+
+    # # # prune =====
+    def find_orphan_notes(self) -> dict[str, list[int]]:
+        """Method returning the notes of the vault decks that are not in any file of the vault, as a dictionary
+        {deck: [note ids]}. Every deck is searched once (subdecks excluded, as they might not be managed by the vault),
+        all the searches being sent in a single request."""
+
+        decks = sorted({nset.deckName for nset in self.nsets})
+        if not decks:
+            return {}
+
+        logger.debug("Querying anki for the notes of the vault decks")
+        results = request_multi([make_action("findNotes", query=deck_query(deck, subdecks=False)) for deck in decks])
+
+        vault_ids = self.vault_ids()
+
+        orphans = {}
+        for deck, result in zip(decks, results):
+            if result["error"] is not None:
+                raise Exception(f"Search of deck '{deck}' unsuccessful. Exception raised: {result['error']}")
+
+            ids = sorted(set(result["result"]) - vault_ids)
+            if ids:
+                orphans[deck] = ids
+
+        return orphans
+
+    def prune(self, dry_run: bool = False, chunk_size: int = 1000) -> dict[str, list[int]]:
+        """Method to delete from anki the notes of the vault decks that are not in the vault anymore. Deletions are
+        sent in chunks of chunk_size notes. With dry_run=True the notes are only listed.
+        Returns the orphan notes as a dictionary {deck: [note ids]}.
+
+        Should be run after the sync, so that every card of the vault has its id."""
+
+        logger.info("Pruning notes removed from the vault")
+        orphans = self.find_orphan_notes()
+        ids = [id for deck_ids in orphans.values() for id in deck_ids]
+
+        if dry_run:
+            for deck, deck_ids in orphans.items():
+                print(f"Deck '{deck}': {len(deck_ids)} notes would be deleted: {deck_ids}")
+            print(f"{len(ids)} notes would be deleted.")
+            return orphans
+
+        if ids:
+            logger.debug(f"Deleting {len(ids)} notes")
+            results = request_multi([make_action("deleteNotes", notes=chunk) for chunk in chunks(ids, chunk_size)])
+
+            errors = [result["error"] for result in results if result["error"] is not None]
+            if errors:
+                raise Exception(f"Deletion of notes unsuccessful. Exceptions raised: {errors}")
+
+        print(f"{len(ids)} notes deleted.")
+        return orphans
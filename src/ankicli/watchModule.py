@@ -0,0 +1,246 @@
+import hashlib
+import threading
+import time
+from pathlib import Path
+
+from ankicli.anki_api import deckModule
+from ankicli.logModule import get_logger
+from ankicli.noteModule2 import NoteSet
+from ankicli.stateModule import SyncState
+from ankicli.syncModule import VaultSync
+
+"""Module watching a vault and syncing the files changed since the last sync, a few moments after they are saved"""
+
+# set up logger
+logger = get_logger(__name__)
+
+# seconds between two scans of the vault
+POLL_INTERVAL = 0.05
+
+# seconds without a new change before a burst of saves is synced, and longest wait for a vault that keeps changing
+DEBOUNCE = 0.2
+MAX_WAIT = 1.0
+
+
+def digest(data: bytes) -> str:
+    """Function returning the digest of the content of a file"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class VaultWatcher:
+    """Watch mode: the vault is scanned every interval seconds and the files whose content changed are synced together
+    once no file changed for debounce seconds (or max_wait seconds after the first change, if saves keep coming).
+
+    Only the changed files are parsed and synced, with a VaultSync per round, and only their changed cards are sent:
+    the rounds share a SyncState (an in-memory one if none is given), so every card recorded unchanged is skipped. The
+    process stays alive between rounds, so the read cache of ankiConnect and the markdown renderer stay warm; the decks
+    are downloaded again every round, as they may be deleted in anki meanwhile.
+
+    Files are compared by content digest, and the digest of a synced file is taken from the lines the sync saved, so
+    the writes of the sync itself (the ids added to the files) do not trigger another round, while an edit made during
+    the sync does. The files that failed to sync are retried with the next round, the unreadable ones (e.g. locked by
+    an editor) as soon as they can be read. Deleted files are reported; their notes stay in anki until a sync with
+    prune.
+
+    Keyword arguments (write_ids, journal, queue, collection, pull_remote, media_data) are passed to every VaultSync."""
+
+    def __init__(
+        self,
+        directory,
+        pattern="*.md",
+        interval: float = POLL_INTERVAL,
+        debounce: float = DEBOUNCE,
+        max_wait: float = MAX_WAIT,
+        **kwargs,
+    ):
+        self.directory = Path(directory)
+        if not self.directory.is_dir():
+            raise ValueError(f"Directory {directory} does not exist or is not a directory.")
+
+        self.pattern = pattern
+        self.interval = interval
+        self.debounce = debounce
+        self.max_wait = max_wait
+
+        if kwargs.get("state") is None:
+            kwargs["state"] = SyncState()
+        self.options = kwargs
+
+        # (mtime, size) and content digest of every file, as of the last sync
+        self.signatures = {}
+        self.digests = {}
+        self.failed = set()
+
+        self.stopped = threading.Event()
+        self.rounds = 0
+
+    # # # scan =====
+    def scan(self) -> dict[Path, tuple[int, int]]:
+        """Method returning the (modification time, size) of every file of the vault"""
+
+        signatures = {}
+        for path in sorted(self.directory.glob(self.pattern)):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            signatures[path] = (stat.st_mtime_ns, stat.st_size)
+
+        return signatures
+
+    def diff(self, signatures: dict[Path, tuple[int, int]]) -> tuple[list[Path], list[Path]]:
+        """Method comparing a scan with the last synced state of the vault. Returns the files whose content changed
+        (the files touched without a change are not) and the deleted files."""
+
+        changed = []
+        for path, signature in signatures.items():
+            if self.signatures.get(path) != signature:
+                try:
+                    content = digest(path.read_bytes())
+                except FileNotFoundError:
+                    continue
+                except OSError:
+                    # unreadable for now (permissions, lock of an editor): synced once it can be read
+                    if path not in self.failed:
+                        changed.append(path)
+                    continue
+                if content != self.digests.get(path):
+                    changed.append(path)
+                else:
+                    self.signatures[path] = signature
+
+        deleted = [path for path in self.digests if path not in signatures]
+        return changed, deleted
+
+    def wait_for_changes(self, timeout: float | None = None) -> tuple[list[Path], list[Path]] | None:
+        """Method scanning the vault until files change, then until the burst of saves is over (see debounce).
+        Returns the changed and deleted files, None after timeout seconds without a change or if the watcher is
+        stopped."""
+
+        start = time.monotonic()
+        first_change = None
+        last_scan, quiet_since = None, start
+
+        while not self.stopped.is_set():
+            signatures = self.scan()
+            now = time.monotonic()
+            if signatures != last_scan:
+                last_scan, quiet_since = signatures, now
+
+            changed, deleted = self.diff(signatures)
+            if changed or deleted:
+                first_change = now if first_change is None else first_change
+                if now - quiet_since >= self.debounce or now - first_change >= self.max_wait:
+                    return changed, deleted
+            elif timeout is not None and now - start >= timeout:
+                return None
+
+            self.stopped.wait(self.interval)
+
+        return None
+
+    # # # sync =====
+    def sync(self, paths: list[Path]) -> VaultSync | None:
+        """Method to sync the given files. The digests of the synced files are those of the content saved by the sync,
+        so that its own writes are not seen as changes."""
+
+        contents, parsed = {}, {}
+        for path in paths:
+            try:
+                contents[path] = path.read_bytes()
+                parsed[path] = NoteSet.from_file(path)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                if path not in contents:
+                    # unreadable for now (permissions, lock of an editor): tried again at the next scan
+                    logger.warning(f"File {path} could not be read: {e!r}")
+                    self.failed.add(path)
+                    continue
+
+                # the files that can't be parsed are only tried again once they change
+                logger.error(f"File {path} could not be parsed: {e!r}")
+                self.digests[path] = digest(contents[path])
+                self.failed.discard(path)
+
+        if not parsed:
+            return None
+
+        # the decks may have been changed in anki since the last round
+        deckModule.registry.invalidate()
+
+        vault_sync = VaultSync(list(parsed.values()), **self.options)
+        try:
+            completed = vault_sync.run()
+        except Exception as e:
+            logger.error(f"Sync of {len(parsed)} files failed: {e!r}")
+            completed = False
+
+        for path, nset in parsed.items():
+            if completed and vault_sync.write_ids:
+                self.digests[path] = digest("".join(nset.notes.lines()).encode("utf-8"))
+            else:
+                self.digests[path] = digest(contents[path])
+
+            if completed:
+                self.failed.discard(path)
+            else:
+                self.failed.add(path)
+
+        # the signatures of the synced files are left as they were: the next scan compares their content with the
+        # digests, which tells the writes of the sync from the edits made meanwhile
+        return vault_sync
+
+    def forget(self, paths: list[Path]) -> None:
+        """Method to stop tracking deleted files"""
+
+        for path in paths:
+            self.signatures.pop(path, None)
+            self.digests.pop(path, None)
+            self.failed.discard(path)
+            print(f"{path.name} was deleted; its notes stay in anki until a sync with prune.")
+
+    def round(self, timeout: float | None = None) -> VaultSync | None:
+        """Method waiting for the next burst of changes and syncing it. Returns the VaultSync of the round, None if
+        nothing changed within timeout seconds."""
+
+        changes = self.wait_for_changes(timeout)
+        if changes is None:
+            return None
+
+        changed, deleted = changes
+        self.forget(deleted)
+        if not changed:
+            return None
+
+        # the files that failed to sync are retried with the changed ones
+        changed = sorted(set(changed) | self.failed)
+
+        start = time.perf_counter()
+        vault_sync = self.sync(changed)
+        self.rounds += 1
+        print(f"Synced {len(changed)} changed files in {time.perf_counter() - start:.2f} seconds.")
+        return vault_sync
+
+    def watch(self, timeout: float | None = None) -> None:
+        """Method to sync the whole vault, then every change until the watcher is stopped (see stop), interrupted
+        (Ctrl+C) or timeout seconds have passed"""
+
+        start = time.monotonic()
+        self.sync(list(self.scan()))
+        print(f"Watching {self.directory} for changes...")
+
+        try:
+            while not self.stopped.is_set():
+                remaining = None if timeout is None else timeout - (time.monotonic() - start)
+                if remaining is not None and remaining <= 0:
+                    break
+                self.round(timeout=remaining)
+        except KeyboardInterrupt:
+            pass
+
+        print(f"Stopped watching {self.directory} after {self.rounds} syncs.")
+
+    def stop(self) -> None:
+        """Method to stop the watcher (e.g. from another thread)"""
+        self.stopped.set()
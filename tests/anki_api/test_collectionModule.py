@@ -0,0 +1,56 @@
+import sqlite3
+import zipfile
+
+import pytest
+from ankicli.anki_api.collectionModule import CollectionReader
+from ankicli.apkgModule import export_apkg
+from ankicli.noteModule2 import NoteSet
+from benchmarks.vault_generator import VaultConfig
+
+
+@pytest.fixture
+def vault_config():
+    return VaultConfig(files=2, cards_per_file=5)
+
+
+@pytest.fixture
+def collection(vault, tmp_path):
+    # a collection generated with the apkg exporter, with an id given to every card
+    directory, config, paths = vault
+    nsets = [NoteSet.from_file(path) for path in paths]
+    for n, (nset, i) in enumerate((nset, i) for nset in nsets for i in nset.notes.cards()):
+        nset.notes.set_id(i, 1000 + n)
+
+    with zipfile.ZipFile(export_apkg(nsets, tmp_path / "vault.apkg")) as zf:
+        zf.extract("collection.anki2", tmp_path)
+
+    return tmp_path / "collection.anki2", nsets
+
+
+@pytest.mark.parametrize("copy", [False, True])
+def test_snapshot(collection, copy):
+    path, nsets = collection
+
+    with CollectionReader(path, copy=copy) as reader:
+        nset = nsets[0]
+        ids = nset.notes.get_ids(nset.notes.cards())
+        snapshot = reader.snapshot(ids + [1])
+
+    assert not snapshot.exists(1)
+    for i in nset.notes.cards():
+        id = nset.notes.get_id(i)
+        assert snapshot.fields(id) == nset.notes.fields(i)
+        assert snapshot.tags(id) == list(nset.tags)
+        assert snapshot.model(id) == nset.notes.modelName[i]
+        assert snapshot.decks(id) == {nset.deckName}
+        assert snapshot.wrong_deck_cards(id, nset.deckName) == []
+
+
+def test_read_only(collection):
+    path, nsets = collection
+
+    with CollectionReader(path) as reader:
+        assert len(reader.note_ids()) == sum(len(nset.notes.cards()) for nset in nsets)
+        assert set(reader.mod_times([1000, 1001])) == {1000, 1001}
+        with pytest.raises(sqlite3.OperationalError):
+            reader.con.execute("DELETE FROM notes")
@@ -0,0 +1,45 @@
+from ankicli.anki_api import deckModule
+from ankicli.anki_api.deckModule import DeckRegistry, deck_hierarchy
+
+
+def test_deck_hierarchy():
+    assert deck_hierarchy("A") == ["A"]
+    assert deck_hierarchy("A::B::C") == ["A", "A::B", "A::B::C"]
+
+
+def test_registry_loads_once(fake_anki):
+    registry = DeckRegistry()
+
+    assert registry.exists("Default")
+    assert not registry.exists("Missing")
+    assert registry.deck_id("Default") == 1
+    assert fake_anki.calls["deckNamesAndIds"] == 1
+
+
+def test_ensure_creates_parents_in_one_request(fake_anki):
+    registry = DeckRegistry()
+    fake_anki.act_createDeck("A")
+
+    created = registry.ensure(["A::B::C", "A::B::D", "Default", "E"])
+
+    assert created == ["E", "A::B", "A::B::C", "A::B::D"]
+    assert fake_anki.calls["multi"] == 1
+    assert all(registry.deck_id(deck) == fake_anki.decks[deck] for deck in created)
+
+    # everything exists now, nothing else is sent
+    fake_anki.calls.clear()
+    assert registry.ensure(["A::B::C"]) == []
+    assert sum(fake_anki.calls.values()) == 0
+
+
+def test_create_and_delete_update_registry(fake_anki):
+    deckModule.create_deck("X::Y")
+    assert deckModule.deck_exists("X") and deckModule.deck_exists("X::Y")
+
+    deckModule.delete_deck("X", force=True)
+    assert not deckModule.deck_exists("X")
+    assert not deckModule.deck_exists("X::Y")
+
+    # a single download of the deck list for the whole session
+    assert fake_anki.calls["deckNamesAndIds"] == 1
+    assert fake_anki.calls["deckNames"] == 0
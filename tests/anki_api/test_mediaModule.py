@@ -0,0 +1,116 @@
+import base64
+import json
+import os
+
+import pytest
+from ankicli.anki_api.mediaModule import MediaBody, MediaUploader, encoded_size, is_local, store_media
+from ankicli.anki_api.requestModule import Deadline, current_deadline, current_url, use_endpoint
+from benchmarks.fake_anki import FakeAnkiServer
+
+
+@pytest.fixture
+def media(tmp_path):
+    # three small files and two large ones
+    sizes = {"a.png": 10, "b.png": 200, "c.png": 301, "big.pdf": 5000, "bigger.pdf": 7001}
+    files = {}
+    for name, size in sizes.items():
+        files[name] = tmp_path / name
+        files[name].write_bytes(os.urandom(size))
+    return files
+
+
+def test_encoded_size():
+    for size in range(10):
+        assert encoded_size(size) == len(base64.b64encode(b"x" * size))
+
+
+def test_is_local():
+    assert is_local("http://127.0.0.1:8765")
+    assert is_local("http://localhost:8765")
+    assert not is_local("http://192.168.1.20:8765")
+
+
+def test_media_body(tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(os.urandom(1000))
+
+    body = MediaBody('we"ird.bin', path, chunk_size=96)
+    parts = []
+    while part := body.read(50):
+        parts.append(part)
+        # only a chunk of the file is held at a time
+        assert len(body.buffer) <= encoded_size(96)
+
+    data = b"".join(parts)
+    assert len(data) == len(body)
+    request = json.loads(data)
+    assert request["action"] == "storeMediaFile"
+    assert request["params"]["filename"] == 'we"ird.bin'
+    assert base64.b64decode(request["params"]["data"]) == path.read_bytes()
+
+
+def test_media_body_chunk_size(tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(b"")
+
+    with pytest.raises(ValueError):
+        MediaBody("file.bin", path, chunk_size=100)
+    assert json.loads(MediaBody("file.bin", path).read())["params"]["data"] == ""
+
+
+def test_groups(media):
+    groups, large = MediaUploader(small_file=1000, multi_bytes=400).groups(media)
+
+    assert groups == [["a.png", "b.png"], ["c.png"]]
+    assert large == ["big.pdf", "bigger.pdf"]
+
+
+def test_store_media_data(media, fake_anki):
+    assert store_media(media, data=True, small_file=1000, multi_bytes=400) == []
+
+    # the small files are sent together, the large ones streamed one by one
+    assert fake_anki.calls["multi"] == 2
+    assert fake_anki.calls["storeMediaFile"] == len(media)
+    for name, path in media.items():
+        assert base64.b64decode(fake_anki.media[name]) == path.read_bytes()
+
+
+def test_store_media_path(media, fake_anki):
+    # a local anki reads the files by path
+    assert store_media(media) == []
+
+    assert fake_anki.calls["multi"] == 1
+    assert fake_anki.media == {name: str(path.absolute()) for name, path in media.items()}
+
+
+def test_store_media_failures(media, fake_anki, monkeypatch):
+    store = fake_anki.act_storeMediaFile
+
+    def refuse(filename, **kwargs):
+        if filename.endswith(".pdf") or filename == "a.png":
+            raise Exception("media folder not writable")
+        return store(filename, **kwargs)
+
+    monkeypatch.setattr(fake_anki, "act_storeMediaFile", refuse)
+
+    failed = store_media(media, data=True, small_file=1000)
+    assert sorted(failed) == ["a.png", "big.pdf", "bigger.pdf"]
+    assert set(fake_anki.media) == {"b.png", "c.png"}
+
+
+def test_store_media_context(media, fake_anki, monkeypatch):
+    # the workers send the files to the server of the calling thread, within its deadline
+    seen = []
+    send_large = MediaUploader.send_large
+    monkeypatch.setattr(
+        MediaUploader,
+        "send_large",
+        staticmethod(lambda name, path: seen.append((current_url(), current_deadline())) or send_large(name, path)),
+    )
+
+    with FakeAnkiServer() as server, use_endpoint(server.url), Deadline(30) as deadline:
+        assert store_media(media, data=True, small_file=1000) == []
+
+    assert seen == [(server.url, deadline)] * 2
+    assert set(server.anki.media) == set(media)
+    assert not fake_anki.media
@@ -1,21 +1,45 @@
+import threading
+import time
 from unittest.mock import patch
 
 import pytest
+import requests
 from ankicli.anki_api.requestModule import (
+    BULK,
+    CONNECT_TIMEOUT,
+    INTERACTIVE,
+    MEDIA,
+    READ_TIMEOUT,
+    Deadline,
+    DeadlineExceeded,
+    RequestCache,
+    RequestScheduler,
+    RequestTimeout,
+    cache,
     check_connection,
+    connection_checks,
     check_result,
+    current_url,
     create_request,
     ensure_connectivity,
     invoke_request,
+    make_action,
     request_action,
+    request_multi,
+    request_priority,
+    request_timeout,
+    use_endpoint,
 )
+from benchmarks.fake_anki import FakeAnkiServer
 
 
 # Mock the environment variable for testing
 @pytest.fixture(autouse=True)
 def setup_environment():
+    cache.clear()
     with patch.dict("os.environ", {"AnkiConnection": "0"}):
         yield
+    cache.clear()
 
 
 def test_check_connection_success(requests_mock):
@@ -34,6 +58,18 @@ def test_check_connection_failure(requests_mock):
     assert check_connection() is False
 
 
+def test_check_connection_timeout(requests_mock, monkeypatch):
+    # a blocked anki is reported as a timeout, not as a refused connection
+    monkeypatch.setenv("AnkiConnection", "0")
+    requests_mock.get("http://127.0.0.1:8765", exc=requests.exceptions.ReadTimeout)
+
+    with pytest.raises(RequestTimeout):
+        check_connection()
+    with Deadline(0), pytest.raises(DeadlineExceeded):
+        check_connection()
+    assert requests_mock.call_count == 1
+
+
 def test_ensure_connectivity_decorator():
     @ensure_connectivity
     def dummy_function():
@@ -165,3 +201,165 @@ def test_request_action_server_error(requests_mock):
 
     assert response["error"] is not None
     assert isinstance(response["error"], Exception)
+
+
+def test_read_actions_are_cached(requests_mock):
+    mock = requests_mock.get("http://127.0.0.1:8765", json={"result": ["Default"], "error": None})
+
+    with patch("ankicli.anki_api.requestModule.check_connection", return_value=True):
+        first = request_action("deckNames")
+        first["result"].append("modified by the caller")
+        second = request_action("deckNames")
+
+        # a write drops the related reads
+        request_action("createDeck", deck="New")
+        request_action("deckNames")
+
+    assert second == {"result": ["Default"], "error": None}
+    assert [r.json()["action"] for r in mock.request_history] == ["deckNames", "createDeck", "deckNames"]
+    assert cache.stats()["actions"]["deckNames"] == {"hits": 1, "misses": 2}
+
+
+def test_cache_keys_and_invalidation():
+    cache = RequestCache()
+    cache.put("url", "findNotes", {"query": "a"}, [1])
+    cache.put("url", "modelNames", {}, ["Basic"])
+
+    assert cache.get("url", "findNotes", {"query": "b"}) is None
+    assert cache.get("url", "findNotes", {"query": "a"}) == [1]
+
+    # note writes don't affect the models, unknown actions clear everything
+    cache.invalidate("addNote")
+    assert cache.get("url", "findNotes", {"query": "a"}) is None
+    assert cache.get("url", "modelNames", {}) == ["Basic"]
+    cache.invalidate("someNewAction")
+    assert cache.get("url", "modelNames", {}) is None
+
+    # expired results are not reused
+    expired = RequestCache(ttl=0)
+    expired.put("url", "modelNames", {}, ["Basic"])
+    assert expired.get("url", "modelNames", {}) is None
+
+
+def test_multi_sends_only_cache_misses(requests_mock):
+    cache.put("http://127.0.0.1:8765", "findNotes", {"query": "a"}, [1])
+    mock = requests_mock.get(
+        "http://127.0.0.1:8765", json={"result": [{"result": [2], "error": None}], "error": None}
+    )
+
+    with patch("ankicli.anki_api.requestModule.check_connection", return_value=True):
+        results = request_multi([make_action("findNotes", query="a"), make_action("findNotes", query="b")])
+
+    assert results == [{"result": [1], "error": None}, {"result": [2], "error": None}]
+    assert [a["params"] for a in mock.last_request.json()["params"]["actions"]] == [{"query": "b"}]
+    assert cache.get("http://127.0.0.1:8765", "findNotes", {"query": "b"}) == [2]
+
+
+def test_request_timeouts():
+    # bulk actions wait longer than the other ones
+    assert request_timeout("deckNames") == (CONNECT_TIMEOUT, READ_TIMEOUT)
+    assert request_timeout("multi")[1] > READ_TIMEOUT
+
+    # an active deadline cuts the timeouts to the time left
+    with Deadline(1):
+        connect, read = request_timeout("multi")
+        assert connect <= 1 and read <= 1
+
+    with Deadline(0):
+        with pytest.raises(DeadlineExceeded):
+            request_timeout("deckNames")
+
+
+def test_invoke_request_timeout(requests_mock):
+    requests_mock.get("http://127.0.0.1:8765", exc=requests.exceptions.ReadTimeout)
+
+    with pytest.raises(RequestTimeout, match="deckNames"):
+        invoke_request("http://127.0.0.1:8765", "deckNames", 6)
+
+
+def test_request_priority():
+    assert request_priority("deckNamesAndIds") == INTERACTIVE
+    assert request_priority("notesInfo") == BULK
+    assert request_priority("storeMediaFile") == MEDIA
+
+    # multi requests are classified by their actions
+    assert request_priority("multi", {"actions": [make_action("createDeck", deck="A")]}) == INTERACTIVE
+    assert request_priority("multi", {"actions": [make_action("addNote", note={})] * 50}) == BULK
+    assert request_priority("multi", {"actions": [make_action("storeMediaFile", filename="a.png")]}) == MEDIA
+
+
+def test_scheduler_serves_by_priority():
+    scheduler = RequestScheduler(max_in_flight=1)
+    served = []
+
+    def request(priority):
+        scheduler.acquire(priority)
+        served.append(priority)
+        scheduler.release()
+
+    # the only slot is taken while requests of every priority queue up
+    scheduler.acquire(INTERACTIVE)
+    threads = [threading.Thread(target=request, args=(priority,)) for priority in (MEDIA, BULK, INTERACTIVE)]
+    for n, thread in enumerate(threads):
+        thread.start()
+        while scheduler.stats()["depth"] < n + 1:
+            time.sleep(0.001)
+
+    scheduler.release()
+    for thread in threads:
+        thread.join()
+
+    assert served == [INTERACTIVE, BULK, MEDIA]
+    assert scheduler.stats()["max_depth"] == 3
+    assert scheduler.stats()["priorities"]["media"]["requests"] == 1
+
+
+def test_scheduler_rate_limit():
+    scheduler = RequestScheduler(rate=50, burst=1)
+
+    start = time.monotonic()
+    for _ in range(4):
+        with scheduler.slot("deckNames"):
+            pass
+
+    # the first request uses the burst, the other ones wait for a token each
+    assert time.monotonic() - start >= 3 / 50 * 0.9
+    assert scheduler.stats()["priorities"]["interactive"]["wait"] > 0
+
+
+def test_scheduler_wait_respects_deadline():
+    scheduler = RequestScheduler(max_in_flight=1)
+    scheduler.acquire()
+
+    with Deadline(0.05), pytest.raises(DeadlineExceeded):
+        scheduler.acquire(BULK)
+
+    assert scheduler.stats()["depth"] == 0
+
+
+def test_use_endpoint():
+    urls = []
+
+    with use_endpoint("http://127.0.0.1:8766"):
+        # the endpoint only applies to the current thread
+        thread = threading.Thread(target=lambda: urls.append(current_url()))
+        thread.start()
+        thread.join()
+        urls.append(current_url())
+
+    assert urls == ["http://127.0.0.1:8765", "http://127.0.0.1:8766"]
+    assert current_url() == "http://127.0.0.1:8765"
+
+
+def test_explicit_url_checks_its_server(monkeypatch):
+    with FakeAnkiServer() as server:
+        # the default server is down, the target one answers
+        monkeypatch.setenv("AnkiConnection", "0")
+        assert request_action("deckNames", url=server.url)["result"] == ["Default"]
+        down = server.url
+
+    # the default server passed its check, the target one is down
+    monkeypatch.setenv("AnkiConnection", str(time.time()))
+    connection_checks.pop(down, None)
+    assert request_action("deckNames", url=down) is None
+
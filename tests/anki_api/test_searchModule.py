@@ -0,0 +1,99 @@
+from ankicli.anki_api import requestModule
+from ankicli.anki_api.searchModule import (
+    DuplicateResolver,
+    deck_query,
+    escape_search,
+    field_checksum,
+    field_query,
+    strip_html,
+)
+
+
+def note(front, deck="Default", model="Basic"):
+    return {"deckName": deck, "modelName": model, "fields": {"Front": front, "Back": "b"}, "tags": []}
+
+
+def test_escape_search():
+    assert escape_search('a "b" c') == 'a \\"b\\" c'
+    assert escape_search("x_y*z\\") == "x\\_y\\*z\\\\"
+    assert escape_search("deck:(a) -b") == "deck:(a) -b"
+
+
+def test_field_query():
+    assert field_query("Front", "<p>a_b</p>") == '"Front:<p>a\\_b</p>"'
+    assert field_query("Front", "a", model="Basic", deck="D") == '"deck:D" "note:Basic" "Front:a"'
+
+
+def test_deck_query():
+    assert deck_query("A::B_c") == '"deck:A::B\\_c"'
+    assert deck_query("A", subdecks=False) == '"deck:A" -"deck:A::*"'
+
+
+def test_strip_html_and_checksum():
+    assert strip_html('<p>What is <b>this</b> &amp; <img src="x.png"></p>\n') == "What is this &  x.png"
+    assert field_checksum("<p>a</p>\n") == field_checksum("a")
+    assert field_checksum("a") != field_checksum("b")
+
+
+def test_resolve_exact(fake_anki):
+    ids = [fake_anki._add(note(f"<p>q_{i} * \"quoted\"</p>\n")) for i in range(5)]
+
+    resolved = DuplicateResolver().resolve([note(f"<p>q_{i} * \"quoted\"</p>\n") for i in range(5)])
+
+    assert resolved == ids
+    # all the searches are sent in a single request, no fallback needed
+    assert fake_anki.calls["multi"] == 1
+    assert fake_anki.calls["notesInfo"] == 0
+
+
+def test_resolve_fallback_index(fake_anki):
+    # same text, different html: the exact search misses, the checksum index finds it
+    id = fake_anki._add(note("<div>question</div>"))
+
+    assert DuplicateResolver().resolve([note("<p>question</p>\n")]) == [id]
+    assert fake_anki.calls["notesInfo"] == 1
+
+
+def test_resolve_ambiguous(fake_anki):
+    fake_anki._add(note("<p>same</p>"))
+    fake_anki.notes[fake_anki._add(note("other"))]["fields"]["Front"] = "<div>same</div>"
+
+    # two candidates: no id is picked blindly
+    assert DuplicateResolver().resolve([note("same")]) == [None]
+
+
+def test_resolve_builds_index_once(fake_anki):
+    fake_anki._add(note("<div>one</div>"))
+    fake_anki._add(note("<div>two</div>"))
+
+    resolver = DuplicateResolver()
+    resolver.resolve([note("one"), note("two")])
+
+    assert fake_anki.calls["findNotes"] == 3  # two exact searches and one model listing
+
+
+def test_resolve_fallback_other_deck(fake_anki):
+    # like anki, the duplicates of a note are searched in every deck
+    fake_anki.act_createDeck("Other")
+    id = fake_anki._add(note("<div>question</div>", deck="Other"))
+
+    assert DuplicateResolver().resolve([note("<p>question</p>\n")]) == [id]
+
+
+def test_resolve_claimed_ids(fake_anki):
+    id = fake_anki._add(note("<p>shared</p>"))
+
+    # a note is given to a single card, the other ones are left unresolved
+    assert DuplicateResolver().resolve([note("<p>shared</p>"), note("<p>shared</p>")]) == [id, None]
+    assert DuplicateResolver().resolve([note("<p>shared</p>")], claimed={id}) == [None]
+
+
+def test_resolve_without_connection(monkeypatch):
+    # anki can't be reached: nothing is resolved, and the index is built again on next use
+    monkeypatch.setattr(requestModule, "request_multi", lambda actions: [None] * len(actions))
+    monkeypatch.setattr(requestModule, "request_action", lambda *args, **kwargs: None)
+
+    resolver = DuplicateResolver()
+    assert resolver.resolve([note("question")]) == [None]
+    assert resolver.index == {}
+
@@ -0,0 +1,39 @@
+from ankicli.anki_api.snapshotModule import RemoteSnapshot
+
+
+def add_note(anki, front, deck="Default", tags=("t",)):
+    return anki._add({"deckName": deck, "modelName": "Basic", "fields": {"Front": front, "Back": "b"}, "tags": tags})
+
+
+def test_fetch(fake_anki):
+    a = add_note(fake_anki, "a")
+    b = add_note(fake_anki, "b", tags=("x", "y"))
+    fake_anki.act_createDeck("Other")
+    fake_anki.act_changeDeck(fake_anki.notes[b]["cards"], "Other")
+
+    snapshot = RemoteSnapshot.fetch([a, b, 42])
+
+    assert snapshot.exists(a) and snapshot.exists(b)
+    assert not snapshot.exists(42) and 42 in snapshot
+    assert snapshot.fields(a) == {"Front": "a", "Back": "b"}
+    assert snapshot.tags(b) == ["x", "y"]
+    assert snapshot.model(a) == "Basic"
+    assert snapshot.decks(b) == {"Other"}
+    assert snapshot.wrong_deck_cards(a, "Default") == []
+    assert snapshot.wrong_deck_cards(b, "Default") == fake_anki.notes[b]["cards"]
+
+
+def test_fetch_is_one_pass(fake_anki):
+    ids = [add_note(fake_anki, str(i)) for i in range(10)]
+
+    RemoteSnapshot.fetch(ids, chunk_size=4)
+
+    assert fake_anki.calls["notesInfo"] == 3
+    assert fake_anki.calls["getDecks"] == 3
+
+
+def test_fetch_empty(fake_anki):
+    snapshot = RemoteSnapshot.fetch([])
+
+    assert snapshot.notes == {}
+    assert sum(fake_anki.calls.values()) == 0
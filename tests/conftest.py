@@ -0,0 +1,36 @@
+import os
+from unittest.mock import patch
+
+import pytest
+from ankicli.anki_api import deckModule, requestModule
+from ankicli.renderer.img_plugin import im_list
+from benchmarks.fake_anki import FakeAnkiServer
+from benchmarks.vault_generator import VaultConfig, generate_vault
+
+
+@pytest.fixture
+def fake_anki():
+    # run a fake ankiConnect server on the default port, forcing a fresh connection check and fresh session caches
+    # (deck registry and read cache)
+    deckModule.registry.invalidate()
+    requestModule.cache.clear()
+    with patch.dict(os.environ, {"AnkiConnection": "0"}), FakeAnkiServer(port=8765) as server:
+        yield server.anki
+    deckModule.registry.invalidate()
+    requestModule.cache.clear()
+
+
+@pytest.fixture
+def vault_config():
+    # shape of the generated vault, overridden by the test modules that need another one
+    return VaultConfig(files=4, cards_per_file=10, image_density=0.3, images=2)
+
+
+@pytest.fixture
+def vault(tmp_path, monkeypatch, vault_config):
+    paths = generate_vault(tmp_path / "vault", vault_config)
+
+    # images are looked up relative to the working directory
+    monkeypatch.chdir(tmp_path / "vault")
+    yield tmp_path / "vault", vault_config, paths
+    im_list.clear()
@@ -0,0 +1,75 @@
+import json
+import sqlite3
+import zipfile
+
+import pytest
+from ankicli.apkgModule import MODELS, export_apkg
+from ankicli.anki_api.searchModule import field_checksum
+from ankicli.journalModule import IdJournal
+from ankicli.noteModule2 import NoteSet
+from benchmarks.vault_generator import VaultConfig
+
+
+@pytest.fixture
+def vault_config():
+    return VaultConfig(files=3, cards_per_file=10, image_density=0.5, images=2)
+
+
+def read_collection(package, tmp_path):
+    with zipfile.ZipFile(package) as zf:
+        zf.extract("collection.anki2", tmp_path)
+        media = json.loads(zf.read("media"))
+        names = set(zf.namelist())
+    return sqlite3.connect(tmp_path / "collection.anki2"), media, names
+
+
+def test_export(vault, tmp_path):
+    directory, config, paths = vault
+    nsets = [NoteSet.from_file(path) for path in paths]
+    journal = IdJournal(tmp_path / "journal.jsonl")
+
+    # small batches, to exercise the streaming
+    package = export_apkg(iter(nsets), tmp_path / "vault.apkg", batch_size=4, journal=journal)
+    con, media, names = read_collection(package, tmp_path)
+
+    assert con.execute("SELECT COUNT(*) FROM notes").fetchone()[0] == config.files * config.cards_per_file
+    n_cards = sum(len(MODELS[nset.notes.modelName[i]][1]) for nset in nsets for i in nset.notes.cards())
+    assert con.execute("SELECT COUNT(*) FROM cards").fetchone()[0] == n_cards
+
+    # decks (with their parents) and models are described in the col table
+    models, decks = (json.loads(v) for v in con.execute("SELECT models, decks FROM col").fetchone())
+    deck_names = {deck["name"] for deck in decks.values()}
+    assert {nset.deckName for nset in nsets} | {"Default", "Benchmark"} == deck_names
+    used_models = {nset.notes.modelName[i] for nset in nsets for i in nset.notes.cards()}
+    assert {model["name"] for model in models.values()} == used_models
+
+    # fields, tags and duplicate checksum of a note
+    nset = nsets[0]
+    row = nset.notes.cards()[0]
+    flds, tags, csum = con.execute("SELECT flds, tags, csum FROM notes ORDER BY id LIMIT 1").fetchone()
+    assert flds == "\x1f".join(nset.notes.fields(row).values())
+    assert tags == f" {' '.join(nset.tags)} "
+    assert csum == field_checksum(nset.notes.front[row])
+
+    # media are stored with numeric names
+    assert set(media.values()) == {f["filename"] for nset in nsets for f in nset.media}
+    assert set(media) <= names
+
+    # the ids given to the notes are journaled, to reach the files after the import
+    parsed = [NoteSet.from_file(path) for path in paths]
+    assert journal.replay(parsed) == config.files * config.cards_per_file
+    ids = {id for (id,) in con.execute("SELECT id FROM notes")}
+    assert {id for nset in parsed for id in nset.notes.get_ids(nset.notes.cards())} == ids
+
+
+def test_failed_export_writes_nothing(vault, tmp_path):
+    directory, config, paths = vault
+
+    def nsets():
+        yield NoteSet.from_file(paths[0])
+        raise RuntimeError("parsing failed")
+
+    with pytest.raises(RuntimeError):
+        export_apkg(nsets(), tmp_path / "vault.apkg")
+
+    assert not (tmp_path / "vault.apkg").exists()
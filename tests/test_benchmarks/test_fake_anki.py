@@ -0,0 +1,27 @@
+import pytest
+from benchmarks.fake_anki import FakeAnki
+
+
+def add(anki, deck, front):
+    anki.act_createDeck(deck)
+    return anki.act_addNote({"deckName": deck, "modelName": "Basic", "fields": {"Front": front, "Back": "b"}})
+
+
+def test_delete_decks():
+    anki = FakeAnki()
+    a = add(anki, "A", "a")
+    sub = add(anki, "A::Sub", "sub")
+    b = add(anki, "B", "b")
+    kept = add(anki, "C", "c")
+    prefix = add(anki, "AB", "ab")
+
+    # every deck is deleted with its subdecks and their notes
+    anki.act_deleteDecks(["A", "B"], cardsToo=True)
+
+    assert set(anki.decks) == {"Default", "C", "AB"}
+    assert set(anki.notes) == {kept, prefix}
+    assert not {a, sub, b} & {card["note"] for card in anki.cards.values()}
+
+    with pytest.raises(Exception):
+        anki.act_deleteDecks(["C"], cardsToo=False)
+    assert kept in anki.notes
@@ -0,0 +1,55 @@
+import pytest
+from ankicli import parseModule
+from ankicli.noteModule2 import NoteSet
+from ankicli.renderer.img_plugin import im_list
+from benchmarks.bench import sync_vault
+from benchmarks.vault_generator import VaultConfig, generate_vault
+
+
+@pytest.fixture
+def vault(tmp_path, monkeypatch):
+    config = VaultConfig(files=3, cards_per_file=10, mathjax_density=0.5, image_density=0.5, images=2)
+    paths = generate_vault(tmp_path / "vault", config)
+
+    # images are looked up relative to the working directory
+    monkeypatch.chdir(tmp_path / "vault")
+    yield config, paths
+    im_list.clear()
+
+
+def test_generate_vault(vault):
+    config, paths = vault
+
+    assert len(paths) == config.files
+    assert len(list(paths[0].parent.glob("*.png"))) == config.images
+
+    for path in paths:
+        nset = NoteSet.from_file(path)
+        assert nset.deckName.startswith("Benchmark::Deck")
+        assert len(nset.notes.cards()) == config.cards_per_file
+
+
+def test_generate_vault_inline_ratio(tmp_path):
+    config = VaultConfig(files=1, cards_per_file=10, inline_ratio=1.0, images=0)
+    path = generate_vault(tmp_path, config)[0]
+
+    lines = parseModule.get_lines(path)
+    _, lines = parseModule.extract_properties(lines)
+    cards = [parseModule.parse_card(g) for g in parseModule.group_lines(lines)]
+
+    assert all(card["inline"] for card in cards if card["is_card"])
+
+
+def test_sync_against_fake_anki(vault, fake_anki):
+    config, paths = vault
+
+    sync_vault(paths)
+    assert len(fake_anki.notes) == config.files * config.cards_per_file
+
+    # every card now has an id, a second run must not upload anything
+    sync_vault(paths)
+    assert fake_anki.calls["addNote"] == config.files * config.cards_per_file
+
+    for path in paths:
+        nset = NoteSet.from_file(path)
+        assert nset.notes.new_cards() == []
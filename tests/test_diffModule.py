@@ -0,0 +1,37 @@
+from ankicli.diffModule import UpdatePlan, diff_fields, diff_tags
+
+
+def test_diff_fields():
+    local = {"Front": "a", "Back": "b"}
+
+    assert diff_fields(local, {"Front": "a", "Back": "b"}) == {}
+    assert diff_fields(local, {"Front": "a", "Back": "c"}) == {"Back": "b"}
+    assert diff_fields(local, {}) == local
+
+
+def test_diff_tags():
+    assert diff_tags(["a", "b"], ["a", "b"]) == ((), ())
+    assert diff_tags(["a", "c"], ["a", "b"]) == (("c",), ("b",))
+    # tags are case-insensitive in anki
+    assert diff_tags(["Tag"], ["tag"]) == ((), ())
+
+
+def test_plan_groups_tags():
+    plan = UpdatePlan()
+    fields = {"Front": "f", "Back": "b"}
+
+    assert not plan.add_note(1, fields, ["a"], fields, ["a"])
+    assert plan.add_note(2, fields, ["new"], fields, ["old"])
+    assert plan.add_note(3, fields, ["new"], fields, ["old"])
+    assert plan.add_note(4, fields, ["new"], {"Front": "f", "Back": "x"}, ["new"])
+
+    assert len(plan) == 3
+    assert plan.actions() == [
+        {"action": "updateNoteFields", "version": 6, "params": {"note": {"id": 4, "fields": {"Back": "b"}}}},
+        {"action": "removeTags", "version": 6, "params": {"notes": [2, 3], "tags": "old"}},
+        {"action": "addTags", "version": 6, "params": {"notes": [2, 3], "tags": "new"}},
+    ]
+
+
+def test_empty_plan_sends_nothing():
+    assert UpdatePlan().send() == []
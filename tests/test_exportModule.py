@@ -0,0 +1,74 @@
+import math
+
+import pytest
+from ankicli.exportModule import deck_file_name, export_deck, export_decks, split_file_name
+from ankicli.noteModule2 import NoteSet
+from ankicli.syncModule import VaultSync
+from benchmarks.vault_generator import VaultConfig
+
+
+@pytest.fixture
+def vault_config():
+    return VaultConfig(files=3, cards_per_file=10, image_density=0.3, images=2)
+
+
+@pytest.fixture
+def synced_vault(vault, fake_anki):
+    directory, config, paths = vault
+    VaultSync([NoteSet.from_file(path) for path in paths]).run()
+    return paths
+
+
+def test_export_decks(synced_vault, fake_anki, tmp_path):
+    decks = sorted({NoteSet.from_file(path).deckName for path in synced_vault})
+
+    fake_anki.calls.clear()
+    paths = export_decks(decks, tmp_path / "export", chunk_size=4)
+
+    assert fake_anki.calls["multi"] == 1
+    assert fake_anki.calls["notesInfo"] == sum(math.ceil(10 / 4) for _ in decks)
+
+    # the exported files are parsed back to the notes of anki, with their ids and common tags
+    for deck, path in paths.items():
+        nset = NoteSet.from_file(path)
+        assert nset.deckName == deck
+        assert "benchmark" in nset.tags
+        assert len(nset.notes.cards()) == 10
+        for i in nset.notes.cards():
+            assert fake_anki.notes[nset.notes.get_id(i)]["fields"] == nset.notes.fields(i)
+
+
+def test_export_skips_empty_questions(fake_anki, tmp_path):
+    fake_anki.act_createDeck("Legacy::Deck")
+    note = {"deckName": "Legacy::Deck", "modelName": "Basic", "fields": {"Front": "q", "Back": "<b>a</b>"}}
+    fake_anki.act_addNote(note)
+    empty = fake_anki.act_addNote(dict(note, fields={"Front": "x", "Back": ""}))
+    fake_anki.notes[empty]["fields"]["Front"] = "<br>"
+
+    path = tmp_path / deck_file_name("Legacy::Deck")
+    assert export_deck("Legacy::Deck", path) == 1
+    assert "q :: **a**" in path.read_text(encoding="utf-8")
+    assert not list(tmp_path.glob("*.body"))
+
+
+def test_export_keeps_note_tags(synced_vault, fake_anki, tmp_path):
+    nset = NoteSet.from_file(synced_vault[0])
+    tagged = nset.notes.get_id(nset.notes.cards()[0])
+    fake_anki.act_addTags([tagged], "extra")
+
+    path = tmp_path / "export" / deck_file_name(nset.deckName)
+    path.parent.mkdir()
+    assert export_deck(nset.deckName, path) == 10
+
+    # the note with an extra tag goes to its own file, with every tag of the note
+    split = NoteSet.from_file(split_file_name(path, ("benchmark", "extra", "file0")))
+    assert split.notes.get_ids(split.notes.cards()) == [tagged]
+    assert set(split.tags) == {"benchmark", "extra", "file0"}
+    assert "extra" not in NoteSet.from_file(path).tags
+    assert len(NoteSet.from_file(path).notes.cards()) == 9
+
+    # syncing the export back removes no tag
+    fake_anki.calls.clear()
+    VaultSync.from_directory(path.parent).run()
+    assert fake_anki.calls["removeTags"] == 0
+    assert "extra" in fake_anki.notes[tagged]["tags"]
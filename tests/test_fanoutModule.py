@@ -0,0 +1,59 @@
+import pytest
+from ankicli.anki_api import deckModule, requestModule
+from ankicli.fanoutModule import Endpoint, FanOutSync
+from ankicli.noteModule2 import NoteSet
+from ankicli.stateModule import SyncState
+from benchmarks.fake_anki import FakeAnkiServer
+from benchmarks.vault_generator import VaultConfig
+
+
+@pytest.fixture
+def vault_config():
+    return VaultConfig(files=3, cards_per_file=5, image_density=0.3, images=2)
+
+
+@pytest.fixture
+def second_anki():
+    with FakeAnkiServer() as server:
+        yield server
+    deckModule.registry.invalidate()
+    requestModule.cache.clear()
+
+
+def test_fan_out_sync(vault, fake_anki, second_anki, monkeypatch):
+    directory, config, paths = vault
+    parse = NoteSet.from_file
+    parsed = []
+    monkeypatch.setattr(NoteSet, "from_file", lambda path: parsed.append(path) or parse(path))
+
+    with SyncState() as state:
+        endpoints = [Endpoint(write_ids=True), Endpoint(second_anki.url, state=state)]
+        results = FanOutSync.from_directory(directory, endpoints).run()
+        assert results == {requestModule.link: True, second_anki.url: True}
+
+        # the files are parsed once, and every anki gets every note
+        assert len(parsed) == config.files
+        assert len(fake_anki.notes) == len(second_anki.anki.notes) == config.files * config.cards_per_file
+
+        # the files hold the ids of the first anki, the state those of the second one
+        for path in paths:
+            nset = parse(path)
+            for i in nset.notes.cards():
+                id = nset.notes.get_id(i)
+                assert fake_anki.notes[id]["fields"] == nset.notes.fields(i)
+                (record,) = state.by_fingerprint(nset.notes.fingerprint(i))
+                assert second_anki.anki.notes[record["note_id"]]["fields"] == nset.notes.fields(i)
+
+        # a second run finds every note on both sides
+        fake_anki.calls.clear()
+        second_anki.anki.calls.clear()
+        FanOutSync.from_directory(directory, endpoints).run()
+        assert fake_anki.calls["addNote"] == second_anki.anki.calls["addNote"] == 0
+
+
+def test_endpoints_are_checked():
+    with pytest.raises(ValueError, match="SyncState"):
+        Endpoint("http://127.0.0.1:8766")
+
+    with pytest.raises(ValueError, match="Only one endpoint"):
+        FanOutSync([], [Endpoint(write_ids=True), Endpoint("http://127.0.0.1:8766", write_ids=True)])
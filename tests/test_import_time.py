@@ -0,0 +1,30 @@
+import json
+import subprocess
+import sys
+
+# modules that importing the package entry point must not load (they are imported on first use)
+HEAVY_MODULES = ["pandas", "numpy", "mistune", "yaml", "requests"]
+
+SCRIPT = f"""
+import json, sys
+import ankicli.noteModule2
+print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))
+"""
+
+
+def test_no_heavy_imports():
+    # checked in a fresh interpreter, the import time itself is measured by the benchmark suite (benchmarks/bench.py)
+    result = subprocess.run([sys.executable, "-c", SCRIPT], capture_output=True, text=True, check=True)
+    assert json.loads(result.stdout) == []
+
+
+def test_single_log_handler():
+    import logging
+
+    from ankicli.logModule import get_logger
+
+    get_logger("ankicli.a")
+    get_logger("ankicli.b")
+
+    handlers = [h for h in logging.getLogger("ankicli").handlers if getattr(h, "ankicli_handler", False)]
+    assert len(handlers) == 1
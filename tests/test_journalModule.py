@@ -0,0 +1,45 @@
+from ankicli.journalModule import IdJournal
+from ankicli.parseModule import ParsedCard
+from ankicli.storeModule import NoteStore
+
+
+class FakeNoteSet:
+    def __init__(self, path, cards):
+        self.file_path = path
+        self.notes = NoteStore("Deck")
+        for front, id in cards:
+            self.notes.append([f">{front} :: back\n"], ParsedCard(front, "back", id, True, "Basic", True))
+
+
+def test_append_and_replay(tmp_path):
+    journal = IdJournal(tmp_path / "journal.jsonl")
+    journal.append(FakeNoteSet(tmp_path / "a.md", [("q1", 1), ("q2", None), ("q3", 3)]), [0, 1, 2])
+    assert len(journal) == 2
+
+    # q3 moved before q1, q4 inserted
+    nset = FakeNoteSet(tmp_path / "a.md", [("q3", None), ("q1", None), ("q4", None)])
+    assert journal.replay([nset]) == 2
+    assert [nset.notes.get_id(i) for i in range(3)] == [3, 1, None]
+
+
+def test_replay_skips_changed_and_used(tmp_path):
+    journal = IdJournal(tmp_path / "journal.jsonl")
+    journal.append(FakeNoteSet(tmp_path / "a.md", [("q1", 1), ("q2", 2)]), [0, 1])
+
+    # q1 was edited, q2 already has its id
+    nset = FakeNoteSet(tmp_path / "a.md", [("q1 edited", None), ("q2", 2)])
+    assert journal.replay([nset]) == 0
+    assert nset.notes.get_id(0) is None
+
+
+def test_incomplete_entry_and_clear(tmp_path):
+    journal = IdJournal(tmp_path / "journal.jsonl")
+    journal.append(FakeNoteSet(tmp_path / "a.md", [("q1", 1)]), [0])
+    with open(journal.path, "a") as f:
+        f.write('{"file": "a.md", "ordi')
+
+    assert [entry["id"] for entry in journal.entries()] == [1]
+
+    journal.clear()
+    assert journal.entries() == []
+    journal.clear()
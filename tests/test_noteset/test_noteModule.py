@@ -1,6 +1,5 @@
-import numpy as np
-import pandas as pd
 from ankicli.noteModule2 import NoteSet
+from ankicli.storeModule import NoteStore
 
 
 def test_from_file():
@@ -13,25 +12,23 @@ def test_from_file():
     assert noteset.deckName == "Test Deck"
     assert noteset.tags == ["test", "example"]
     assert noteset.file_path == path
-    assert isinstance(noteset.df, pd.DataFrame)
+    assert isinstance(noteset.notes, NoteStore)
 
-    print(noteset.df.columns)
-
-    # Assert number of rows in the DataFrame
-    assert len(noteset.df) == 14  # Number of sections/cards in test file
+    # Assert number of rows in the store
+    assert len(noteset.notes) == 14  # Number of sections/cards in test file
 
     # Check the content of the parsed cards
 
     # Card 1
-    card1 = noteset.df.iloc[4]  # Properties are at index 0
+    card1 = noteset.notes.record(4)  # Properties are at index 0
     assert card1["front"] == "<p>What is the capital of France?</p>\n"
     assert card1["back"] == "<p>Paris</p>\n"
-    assert np.isnan(card1["id"])
+    assert card1["id"] is None
     assert bool(card1["is_card"]) is True
     assert card1["modelName"] == "Basic"
 
     # Card 2
-    card2 = noteset.df.iloc[6]
+    card2 = noteset.notes.record(6)
     assert card2["front"] == "<p>What is the capital of Italy?</p>\n"
     assert card2["back"] == "<p>Rome</p>\n"
     assert card2["id"] == 1234
@@ -39,23 +36,23 @@ def test_from_file():
     assert card2["modelName"] == "Basic"
 
     # Card 3 (inline)
-    card3 = noteset.df.iloc[11]
+    card3 = noteset.notes.record(11)
     assert card3["front"] == "<p>What is the capital of Portugal?</p>\n"
     assert card3["back"] == "<p>Lisbon</p>\n"
-    assert np.isnan(card3["id"])
+    assert card3["id"] is None
     assert bool(card3["is_card"]) is True
     assert card3["modelName"] == "Basic"
 
     # Card 4 (inline)
-    card4 = noteset.df.iloc[12]
+    card4 = noteset.notes.record(12)
     assert card4["front"] == "<p>What is the capital of Spain?</p>\n"
     assert card4["back"] == "<p>Madrid</p>\n"
-    assert np.isnan(card4["id"])
+    assert card4["id"] is None
     assert bool(card4["is_card"]) is True
     assert card4["modelName"] == "Basic (and reversed card)"
 
     # Card 5 (inline)
-    card5 = noteset.df.iloc[13]
+    card5 = noteset.notes.record(13)
     assert card5["front"] == "<p>What is the capital of Germany?</p>\n"
     assert card5["back"] == "<p>Berlin</p>\n"
     assert card5["id"] == 5678
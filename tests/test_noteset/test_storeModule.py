@@ -0,0 +1,84 @@
+from ankicli.noteModule2 import NoteSet
+from ankicli.parseModule import ParsedCard
+from ankicli.storeModule import NO_ID, NoteStore
+
+
+def test_selections():
+    notes = NoteSet.from_file("./cards.md").notes
+
+    assert notes.cards() == [4, 6, 11, 12, 13]
+    assert notes.new_cards() == [4, 11, 12]
+    assert notes.existing_cards() == [6, 13]
+    assert notes.get_ids(notes.cards()) == [1234, 5678]
+
+
+def test_shared_tags():
+    notes = NoteStore("Deck", ["a", "b"])
+
+    assert notes.tags == ("a", "b")
+    assert notes.note(notes.append([">q :: a\n"], ParsedCard("q", "a", None, True, "Basic", True)))["tags"] == [
+        "a",
+        "b",
+    ]
+
+
+def test_set_id_inline():
+    notes = NoteStore("Deck")
+    i = notes.append([">q :: a\n"], ParsedCard("q", "a", None, True, "Basic", True))
+
+    notes.set_id(i, 42)
+    assert notes.get_id(i) == 42
+    assert notes.text[i] == [">q :: a^42\n"]
+
+    notes.set_id(i, 43)
+    assert notes.text[i] == [">q :: a^43\n"]
+
+    notes.set_id(i, None)
+    assert notes.ids[i] == NO_ID
+    assert notes.get_id(i) is None
+    assert notes.text[i] == [">q :: a\n"]
+
+
+def test_set_id_block():
+    notes = NoteStore("Deck")
+    text = [">[!question]- q #card\n", ">a\n", "\n"]
+    i = notes.append(text, ParsedCard("q", "a", None, False, "Basic", True))
+
+    notes.set_id(i, 42)
+    assert notes.text[i] == [">[!question]- q #card\n", ">a\n", "\n^42\n"]
+
+    # original text lines are never modified in place
+    assert text == [">[!question]- q #card\n", ">a\n", "\n"]
+
+
+def test_exclude_keeps_text():
+    nset = NoteSet.from_file("./cards.md")
+    lines = list(nset.notes.lines())
+
+    nset.notes.exclude([4])
+
+    assert 4 not in nset.notes.cards()
+    assert list(nset.notes.lines()) == lines
+
+
+def test_notes_payload():
+    notes = NoteSet.from_file("./cards.md").notes
+
+    assert notes.notes([6], with_id=True) == [
+        {
+            "deckName": "Test Deck",
+            "modelName": "Basic",
+            "fields": {"Front": "<p>What is the capital of Italy?</p>\n", "Back": "<p>Rome</p>\n"},
+            "tags": ["test", "example"],
+            "id": 1234,
+        }
+    ]
+
+
+def test_to_dataframe():
+    notes = NoteSet.from_file("./cards.md").notes
+    df = notes.to_dataframe()
+
+    assert len(df) == len(notes)
+    assert str(df["id"].dtype) == "Int64"
+    assert df["id"].iloc[6] == 1234
@@ -3,6 +3,7 @@ import pytest
 
 from ankicli.parseModule import (
     extract_properties,
+    format_card,
     get_deck,
     get_lines,
     get_properties_metadata,
@@ -10,6 +11,7 @@ from ankicli.parseModule import (
     group_lines,
     insert_card_id,
     parse_card,
+    read_card,
 )
 
 
@@ -393,3 +395,21 @@ def test_insert_id_in_math():
 # - normal card with id
 # - inline card without id
 # - normal card without id
+
+
+@pytest.mark.parametrize(
+    "front, back, model, inline",
+    [
+        ("question", "answer", "Basic", True),
+        ("question", "first line\nsecond line", "Basic", False),
+        ("question", "answer", "Basic (and reversed card)", True),
+    ],
+)
+def test_format_card(front, back, model, inline):
+    # Test if format_card writes lines that read_card parses back, with their id
+    lines = format_card(front, back, id=1234, model=model)
+    lines = "".join(lines).splitlines(keepends=True)
+    card = read_card(lines)
+
+    assert (card.front, card.back, card.modelName, card.inline) == (front, back, model, inline)
+    assert int(card.id) == 1234
@@ -0,0 +1,69 @@
+import pytest
+from ankicli.journalModule import IdJournal
+from ankicli.noteModule2 import NoteSet
+from ankicli.pipelineModule import SyncPipeline
+from ankicli.stateModule import SyncState
+from benchmarks.vault_generator import VaultConfig
+
+
+@pytest.fixture
+def vault_config():
+    return VaultConfig(files=6, cards_per_file=5, image_density=0.3, images=2)
+
+
+def test_pipeline_sync(vault, fake_anki, tmp_path):
+    directory, config, paths = vault
+    journal = IdJournal(tmp_path / "journal.jsonl")
+
+    stats = SyncPipeline(directory, batch_size=2, queue_size=1, journal=journal).run()
+
+    # every card is uploaded and its id saved to its file
+    assert len(fake_anki.notes) == config.files * config.cards_per_file
+    for path in paths:
+        nset = NoteSet.from_file(path)
+        assert nset.notes.new_cards() == []
+        for i in nset.notes.cards():
+            assert fake_anki.notes[nset.notes.get_id(i)]["fields"] == nset.notes.fields(i)
+
+    # every stage saw every batch, and the batches were uploaded separately
+    assert set(stats) == {"discovery", "parse", "diff", "upload", "write-back"}
+    assert all(counters["batches"] == 3 and counters["files"] == config.files for counters in stats.values())
+    assert fake_anki.calls["deckNamesAndIds"] == 1
+    assert not journal.path.exists()
+
+
+def test_pipeline_with_state(vault, fake_anki):
+    directory, config, paths = vault
+
+    with SyncState() as state:
+        SyncPipeline(directory, batch_size=4, state=state).run()
+
+        fake_anki.calls.clear()
+        SyncPipeline(directory, batch_size=4, state=state).run()
+
+        # nothing changed since the first run
+        assert fake_anki.calls["addNote"] == 0
+        assert fake_anki.calls["notesInfo"] == 0
+        assert fake_anki.calls["notesModTime"] == 2
+
+
+def test_pipeline_stops_on_error(vault, fake_anki, monkeypatch):
+    directory, config, paths = vault
+
+    def crash(self):
+        raise RuntimeError("upload failed")
+
+    monkeypatch.setattr("ankicli.syncModule.VaultSync.upload_new_notes", crash)
+
+    with pytest.raises(RuntimeError, match="upload failed"):
+        SyncPipeline(directory, batch_size=1, queue_size=1).run()
+
+    # no file was saved
+    assert all(NoteSet.from_file(path).notes.existing_cards() == [] for path in paths)
+
+
+def test_pipeline_checks_options(vault):
+    directory, config, paths = vault
+
+    with SyncState() as state, pytest.raises(ValueError):
+        SyncPipeline(directory, state=state, write_ids=False, pull_remote=True)
@@ -0,0 +1,66 @@
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+from ankicli.journalModule import IdJournal
+from ankicli.parseModule import ParsedCard
+from ankicli.queueModule import OfflineQueue
+from ankicli.storeModule import NoteStore
+
+
+class FakeNoteSet:
+    def __init__(self, path, cards, deck="Deck", media=()):
+        self.file_path = path
+        self.media = [{"filename": Path(m).name, "path": Path(m)} for m in media]
+        self.notes = NoteStore(deck, ["tag"])
+        for front, id in cards:
+            self.notes.append([f">{front} :: back\n"], ParsedCard(front, "back", id, True, "Basic", True))
+
+
+def test_enqueue_coalesces(tmp_path):
+    queue = OfflineQueue(tmp_path / "queue.json")
+    queue.enqueue([FakeNoteSet(tmp_path / "a.md", [("q1", None), ("q2", None), ("q3", 7)], media=["x.png"])])
+    queue.enqueue([FakeNoteSet(tmp_path / "a.md", [("q1 edited", None), ("q3 edited", 7)], media=["x.png"])])
+
+    # new cards of the file are replaced as a whole, existing ones are coalesced by id
+    assert len(queue.notes) == 2
+    assert queue.notes["7"]["note"]["fields"]["Front"] == "q3 edited"
+    assert len(queue.media) == 1
+
+    # the queue is persisted
+    assert OfflineQueue(tmp_path / "queue.json").notes == queue.notes
+
+
+def test_flush_offline_keeps_queue(tmp_path):
+    queue = OfflineQueue(tmp_path / "queue.json")
+    queue.enqueue([FakeNoteSet(tmp_path / "a.md", [("q1", None)])])
+
+    with patch.dict(os.environ, {"AnkiConnection": "0"}):
+        assert queue.flush() is None
+
+    assert len(OfflineQueue(tmp_path / "queue.json")) == 1
+
+
+def test_flush(tmp_path, fake_anki):
+    fake_anki.act_createDeck("Other")
+    existing = fake_anki.act_addNote(
+        {"deckName": "Other", "modelName": "Basic", "fields": {"Front": "q3", "Back": "b"}}
+    )
+
+    queue = OfflineQueue(tmp_path / "queue.json")
+    journal = IdJournal(tmp_path / "journal.jsonl")
+    nset = FakeNoteSet(tmp_path / "a.md", [("q1", None), ("q2", None), ("q3", existing)], media=["x.png"])
+    queue.enqueue([nset])
+
+    fake_anki.calls.clear()
+    counts = queue.flush(journal)
+
+    assert counts == {"added": 2, "updated": 1, "moved": 1, "media": 1}
+    assert fake_anki.calls["addNote"] == 2
+    assert fake_anki.calls["notesInfo"] == 1
+    assert fake_anki.notes[existing]["fields"]["Back"] == "back"
+    assert len(queue) == 0 and not queue.path.exists()
+
+    # the ids of the new notes reach the file through the journal
+    nset = FakeNoteSet(tmp_path / "a.md", [("q1", None), ("q2", None), ("q3", existing)])
+    assert journal.replay([nset]) == 2
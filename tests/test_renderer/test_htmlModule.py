@@ -0,0 +1,40 @@
+import pytest
+
+from ankicli.renderer import rendererModule
+from ankicli.renderer.htmlModule import html_to_markdown
+from ankicli.renderer.img_plugin import im_list
+
+## Tests for the html to markdown conversion
+
+
+@pytest.mark.parametrize(
+    "md_text",
+    [
+        "plain text",
+        "some **bold**, *italic*, ==marked== and `code` text",
+        "a [link](https://example.com) in a sentence",
+        "- first\n- second\n- third",
+        "1. first\n2. second",
+        "# Title\n\nfirst paragraph\n\nsecond paragraph",
+        "inline math $E=mc^2$ in a sentence",
+        "$$\\int_0^1 x\\,dx$$",
+        "![[image1.png]]",
+    ],
+)
+def test_renderer_round_trip(md_text):
+    # html written by the renderer converts back to the markdown it came from
+    html_output = rendererModule.get_markdown()(md_text)
+    im_list.clear()
+
+    assert html_to_markdown(html_output) == md_text
+
+
+def test_anki_editor_html():
+    # html written by the anki editor
+    html_input = "first line<br>second <b>bold</b> line<div>a \\(x^2\\) div</div><div>\\[y\\]</div>"
+
+    assert html_to_markdown(html_input) == "first line\nsecond **bold** line\na $x^2$ div\n$$y$$"
+
+
+def test_entities_are_unescaped():
+    assert html_to_markdown("a &lt; b &amp;&amp; c&nbsp;d") == "a < b && c\xa0d"
@@ -0,0 +1,125 @@
+import sqlite3
+
+import pytest
+from ankicli.parseModule import ParsedCard
+from ankicli.stateModule import SyncState, file_key, is_modified
+from ankicli.storeModule import NoteStore
+
+
+class FakeNoteSet:
+    def __init__(self, path, cards, deck="Deck", tags=()):
+        self.file_path = path
+        self.notes = NoteStore(deck, tags)
+        for front, id in cards:
+            self.notes.append([f">{front} :: back\n"], ParsedCard(front, "back", id, True, "Basic", True))
+
+
+@pytest.fixture
+def state():
+    with SyncState() as state:
+        yield state
+
+
+def test_record_and_lookups(state, tmp_path):
+    nset = FakeNoteSet(tmp_path / "a.md", [("q1", 1), ("q2", 2), ("q3", None)])
+    state.record(nset, sync_time=10.0, mods={2: 7})
+
+    record = state.get(2)
+    assert record == {
+        "note_id": 2,
+        "file_path": file_key(tmp_path / "a.md"),
+        "ordinal": 1,
+        "fingerprint": nset.notes.fingerprint(1),
+        "deck": "Deck",
+        "last_sync": 10.0,
+        "tags": "",
+        "mod": 7,
+    }
+    assert state.get(1)["mod"] is None
+    assert state.get(3) is None
+    assert [r["note_id"] for r in state.by_fingerprint(nset.notes.fingerprint(0))] == [1]
+    assert [r["note_id"] for r in state.file_notes(tmp_path / "a.md")] == [1, 2]
+
+
+def test_record_replaces_file(state, tmp_path):
+    state.record(FakeNoteSet(tmp_path / "a.md", [("q1", 1), ("q2", 2)]))
+    state.record(FakeNoteSet(tmp_path / "a.md", [("q2", 2)]))
+
+    assert state.get(1) is None
+    assert state.get(2)["ordinal"] == 0
+
+
+def test_deleted_cards(state, tmp_path):
+    state.record(FakeNoteSet(tmp_path / "a.md", [("q1", 1), ("q2", 2), ("q3", 3)]))
+
+    assert state.deleted_cards(FakeNoteSet(tmp_path / "a.md", [("q1", 1), ("q3", 3)])) == [2]
+
+
+def test_duplicates_across_files(state, tmp_path):
+    state.record(FakeNoteSet(tmp_path / "a.md", [("q1", 1), ("q2", 2)]))
+    state.record(FakeNoteSet(tmp_path / "b.md", [("q1", 3)]))
+
+    duplicates = state.duplicates()
+    assert len(duplicates) == 1
+    assert [r["note_id"] for r in duplicates.popitem()[1]] == [1, 3]
+
+
+def test_assign_ids(state, tmp_path):
+    state.record(FakeNoteSet(tmp_path / "a.md", [("q1", 1), ("q2", 2), ("q3", 3)]))
+
+    # q1 and q2 swapped, q3 edited in place, q4 new
+    nset = FakeNoteSet(tmp_path / "a.md", [("q2", None), ("q1", None), ("q3 edited", None), ("q4", None)])
+    assigned = state.assign_ids(nset)
+
+    assert assigned == [0, 1, 2]
+    assert [nset.notes.get_id(i) for i in range(4)] == [2, 1, 3, None]
+
+
+def test_persistence(tmp_path):
+    with SyncState(tmp_path / "state.db") as state:
+        state.record(FakeNoteSet(tmp_path / "a.md", [("q1", 1)]))
+
+    with SyncState(tmp_path / "state.db") as state:
+        assert state.get(1)["file_path"] == file_key(tmp_path / "a.md")
+
+
+def test_fingerprint_index(state, tmp_path):
+    a = FakeNoteSet(tmp_path / "a.md", [("q1", 1), ("q2", 2)])
+    state.record(a)
+    state.record(FakeNoteSet(tmp_path / "b.md", [("q1", 3)]))
+
+    index = state.fingerprint_index()
+    assert index[a.notes.fingerprint(0)] == [1, 3]
+    assert index[a.notes.fingerprint(1)] == [2]
+
+
+def test_records_and_is_modified(state, tmp_path):
+    nset = FakeNoteSet(tmp_path / "a.md", [("q1", 1), ("q2", 2)], tags=["B", "a"])
+    state.record(nset)
+
+    records = state.records([1, 2, 3])
+    assert set(records) == {1, 2}
+    assert records[1]["tags"] == "a b"
+    assert not is_modified(records[1], nset.notes, 0)
+    assert is_modified(None, nset.notes, 0)
+
+    assert is_modified(records[1], FakeNoteSet(tmp_path / "a.md", [("q1 edited", 1)], tags=["a", "b"]).notes, 0)
+    assert is_modified(records[1], FakeNoteSet(tmp_path / "a.md", [("q1", 1)], deck="Other", tags=["a", "b"]).notes, 0)
+    assert is_modified(records[1], FakeNoteSet(tmp_path / "a.md", [("q1", 1)], tags=["a"]).notes, 0)
+
+
+def test_migration(tmp_path):
+    # a database created before the tags and mod columns existed
+    con = sqlite3.connect(tmp_path / "state.db")
+    con.execute(
+        "CREATE TABLE notes (note_id INTEGER PRIMARY KEY, file_path TEXT NOT NULL, ordinal INTEGER NOT NULL, "
+        "fingerprint TEXT NOT NULL, deck TEXT NOT NULL, last_sync REAL NOT NULL)"
+    )
+    con.execute("INSERT INTO notes VALUES (1, 'a.md', 0, 'f', 'Deck', 1.0)")
+    con.commit()
+    con.close()
+
+    with SyncState(tmp_path / "state.db") as state:
+        assert state.get(1)["mod"] is None
+        state.record(FakeNoteSet(tmp_path / "b.md", [("q", 2)]), mods={2: 3})
+        assert state.get(2)["mod"] == 3
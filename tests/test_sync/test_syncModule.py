@@ -0,0 +1,528 @@
+import threading
+import time
+import zipfile
+
+import pytest
+
+from ankicli.anki_api import deckModule, requestModule
+from ankicli.anki_api.collectionModule import CollectionReader
+from ankicli.anki_api.searchModule import DUPLICATE_ERROR
+from ankicli.apkgModule import export_apkg
+from ankicli.journalModule import IdJournal
+from ankicli.noteModule2 import ADDED, DUPLICATE, NoteSet
+from ankicli.parseModule import replace_card_id
+from ankicli.queueModule import OfflineQueue
+from ankicli.stateModule import SyncState
+from ankicli.syncModule import VaultSync, group_by_noteset
+from benchmarks.fake_anki import FakeAnkiHandler, FakeAnkiServer
+
+
+def test_group_by_noteset():
+    a, b = object(), object()
+    grouped = group_by_noteset([(a, 1), (b, 2), (a, 3)], ["x", "y", "z"])
+
+    assert grouped == {a: ([1, 3], ["x", "z"]), b: ([2], ["y"])}
+
+
+def test_run_batches_requests(vault, fake_anki):
+    directory, config, paths = vault
+
+    VaultSync.from_directory(directory).run()
+
+    # every card has been uploaded and every network phase ran once for the whole vault
+    assert len(fake_anki.notes) == config.files * config.cards_per_file
+    assert fake_anki.calls["deckNamesAndIds"] == 1
+    assert fake_anki.calls["multi"] == 3  # deck creation, notes and media
+    assert fake_anki.calls["canAddNotesWithErrorDetail"] == 0
+    assert fake_anki.calls["addNote"] == config.files * config.cards_per_file
+    assert fake_anki.calls["storeMediaFile"] == len({f["filename"] for p in paths for f in NoteSet.from_file(p).media})
+
+    # ids are routed back to the owning files
+    for path in paths:
+        nset = NoteSet.from_file(path)
+        assert nset.notes.new_cards() == []
+        for i in nset.notes.cards():
+            assert fake_anki.notes[nset.notes.get_id(i)]["fields"] == nset.notes.fields(i)
+
+
+def test_second_run_updates_and_repairs(vault, fake_anki):
+    directory, config, paths = vault
+    VaultSync.from_directory(directory).run()
+
+    # edit a card, delete another one from anki and move a third one to another deck
+    vault_sync = VaultSync.from_directory(directory)
+    nset = vault_sync.nsets[0]
+    edited, deleted, moved = nset.notes.cards()[:3]
+    nset.notes.back[edited] = "<p>edited</p>\n"
+    fake_anki.act_deleteNotes([nset.notes.get_id(deleted)])
+    moved_card = fake_anki.notes[nset.notes.get_id(moved)]["cards"][0]
+    fake_anki.act_changeDeck([moved_card], "Elsewhere")
+
+    fake_anki.calls.clear()
+    vault_sync.run()
+
+    assert fake_anki.notes[nset.notes.get_id(edited)]["fields"]["Back"] == "<p>edited</p>\n"
+    assert nset.notes.get_id(deleted) in fake_anki.notes
+    assert fake_anki.cards[moved_card]["deckName"] == nset.deckName
+    assert fake_anki.calls["updateNoteFields"] == 1
+    assert fake_anki.calls["updateNote"] == 0
+    assert fake_anki.calls["addNote"] == 1
+
+    # a single snapshot of the existing notes is shared by the checks and the update
+    assert fake_anki.calls["notesInfo"] == 1
+    assert fake_anki.calls["getDecks"] == 1
+
+
+def test_tag_change_is_grouped(vault, fake_anki):
+    directory, config, paths = vault
+    VaultSync.from_directory(directory).run()
+
+    # rename a tag in every file
+    for path in paths:
+        path.write_text(path.read_text(encoding="utf-8").replace("[benchmark,", "[renamed,"), encoding="utf-8")
+
+    fake_anki.calls.clear()
+    VaultSync.from_directory(directory).run()
+
+    assert all("renamed" in note["tags"] and "benchmark" not in note["tags"] for note in fake_anki.notes.values())
+    assert fake_anki.calls["updateNoteFields"] == 0
+    # one addTags for the shared tag, one removeTags for the old one
+    assert fake_anki.calls["addTags"] == 1
+    assert fake_anki.calls["removeTags"] == 1
+
+
+def test_lost_ids_are_resolved_in_batch(vault, fake_anki):
+    directory, config, paths = vault
+    VaultSync.from_directory(directory).run()
+    original = {path: path.read_text(encoding="utf-8") for path in paths}
+
+    # lose every id line: all the cards are now rejected as duplicates
+    vault_sync = VaultSync.from_directory(directory)
+    for nset in vault_sync.nsets:
+        for i in nset.notes.cards():
+            nset.notes.set_id(i, None)
+
+    fake_anki.calls.clear()
+    vault_sync.run()
+
+    assert len(fake_anki.notes) == config.files * config.cards_per_file
+    assert fake_anki.calls["findNotes"] == config.files * config.cards_per_file
+    assert fake_anki.calls["multi"] <= 3  # the notes, the searches, the media
+    assert {path: path.read_text(encoding="utf-8") for path in paths} == original
+
+
+def test_sidecar_mode(vault, fake_anki, tmp_path):
+    directory, config, paths = vault
+    original = {path: path.read_text(encoding="utf-8") for path in paths}
+
+    with SyncState(tmp_path / "state.db") as state:
+        VaultSync.from_directory(directory, state=state, write_ids=False).run()
+        assert len(fake_anki.notes) == config.files * config.cards_per_file
+
+        # the files are never rewritten, the ids live in the sync state
+        assert {path: path.read_text(encoding="utf-8") for path in paths} == original
+
+        # a second run finds every id in the state: nothing is uploaded again
+        fake_anki.calls.clear()
+        VaultSync.from_directory(directory, state=state, write_ids=False).run()
+        assert fake_anki.calls["addNote"] == 0
+
+
+def test_removed_cards_are_reported(vault, fake_anki, tmp_path):
+    directory, config, paths = vault
+
+    with SyncState() as state:
+        VaultSync.from_directory(directory, state=state).run()
+
+        lines = paths[0].read_text(encoding="utf-8").splitlines(keepends=True)
+        removed = NoteSet.from_file(paths[0])
+        row = removed.notes.cards()[0]
+        paths[0].write_text("".join(l for l in lines if l not in removed.notes.text[row]), encoding="utf-8")
+
+        vault_sync = VaultSync.from_directory(directory, state=state)
+        vault_sync.run()
+
+        assert vault_sync.removed_cards == {paths[0]: [removed.notes.get_id(row)]}
+
+
+def test_prune_removed_cards(vault, fake_anki):
+    directory, config, paths = vault
+    VaultSync.from_directory(directory).run()
+
+    # remove a card from a file, and add notes that the vault does not manage
+    nset = NoteSet.from_file(paths[0])
+    row = nset.notes.cards()[0]
+    removed_id = nset.notes.get_id(row)
+    nset.notes.text[row] = []
+    nset.save_file()
+
+    unmanaged = []
+    for deck, front in ((nset.deckName + "::Sub", "s"), ("Other", "o")):
+        fake_anki.act_createDeck(deck)
+        unmanaged.append(
+            fake_anki.act_addNote({"deckName": deck, "modelName": "Basic", "fields": {"Front": front, "Back": "b"}})
+        )
+
+    vault_sync = VaultSync.from_directory(directory)
+    fake_anki.calls.clear()
+
+    # dry run only lists the orphans
+    assert vault_sync.prune(dry_run=True) == {nset.deckName: [removed_id]}
+    assert fake_anki.calls["deleteNotes"] == 0
+    assert removed_id in fake_anki.notes
+
+    # one search per deck, in a single request, then one chunked deletion
+    assert fake_anki.calls["findNotes"] == len({s.deckName for s in vault_sync.nsets})
+    assert fake_anki.calls["multi"] == 1
+
+    # the searches of the dry run are reused from the read cache
+    fake_anki.calls.clear()
+    vault_sync.prune()
+    assert fake_anki.calls["findNotes"] == 0
+    assert fake_anki.calls["deleteNotes"] == 1
+    assert fake_anki.calls["multi"] == 1
+
+    assert removed_id not in fake_anki.notes
+    assert all(id in fake_anki.notes for id in unmanaged)
+    assert len(fake_anki.notes) == config.files * config.cards_per_file - 1 + len(unmanaged)
+
+
+def test_moved_cards_keep_their_note(vault, fake_anki):
+    directory, config, paths = vault
+
+    with SyncState() as state:
+        VaultSync.from_directory(directory, state=state).run()
+
+        # move a card to a file with another deck, losing its id line on the way
+        source, target = NoteSet.from_file(paths[0]), NoteSet.from_file(paths[1])
+        row = source.notes.cards()[0]
+        moved_id = source.notes.get_id(row)
+        text = replace_card_id(source.notes.text[row], None, bool(source.notes.inline[row]))
+        source.notes.text[row] = []
+        source.save_file()
+        with open(paths[1], "a", encoding="utf-8") as f:
+            f.writelines(["\n", *text])
+
+        vault_sync = VaultSync.from_directory(directory, state=state)
+        fake_anki.calls.clear()
+        vault_sync.run()
+
+        assert fake_anki.calls["addNote"] == 0
+        assert fake_anki.calls["changeDeck"] == 1
+        assert vault_sync.removed_cards == {}
+
+        cards = fake_anki.notes[moved_id]["cards"]
+        assert {fake_anki.cards[card]["deckName"] for card in cards} == {target.deckName}
+        assert f"{moved_id}" in paths[1].read_text(encoding="utf-8")
+
+
+def test_card_in_two_files_keeps_one_note(vault, fake_anki):
+    directory, config, paths = vault
+
+    # the same question in two files of different decks
+    vault_sync = VaultSync.from_directory(directory)
+    first, second = vault_sync.nsets[:2]
+    a, b = first.notes.cards()[0], second.notes.cards()[0]
+    second.notes.front[b] = first.notes.front[a]
+    vault_sync.run()
+
+    # the note goes to the first card only: the second one is reported, not moved to its deck
+    id = first.notes.get_id(a)
+    assert vault_sync.outcomes()[second.file_path][b] == DUPLICATE_ERROR
+    assert id not in second.notes.get_ids(second.notes.cards())
+    assert {fake_anki.cards[c]["deckName"] for c in fake_anki.notes[id]["cards"]} == {first.deckName}
+    assert fake_anki.calls["changeDeck"] == 0
+
+
+def test_partial_failures_are_repaired(vault, fake_anki):
+    directory, config, paths = vault
+
+    vault_sync = VaultSync.from_directory(directory)
+    nset = vault_sync.nsets[0]
+    duplicate, empty = nset.notes.cards()[:2]
+
+    # a note anki already has (in another deck) and a note anki refuses
+    existing = fake_anki.act_addNote(dict(nset.notes.note(duplicate), deckName="Default"))
+    nset.notes.front[empty] = ""
+
+    fake_anki.calls.clear()
+    vault_sync.run()
+
+    # no pre-flight check, a single add per note and a search for the duplicate only
+    assert fake_anki.calls["canAddNotesWithErrorDetail"] == 0
+    assert fake_anki.calls["addNote"] == config.files * config.cards_per_file
+    assert fake_anki.calls["findNotes"] == 1
+
+    outcomes = vault_sync.outcomes()[nset.file_path]
+    assert outcomes[duplicate] == DUPLICATE
+    assert outcomes[empty] == "cannot create note because it is empty"
+    assert [o for o in outcomes.values()].count(ADDED) == config.cards_per_file - 2
+
+    # the duplicate got the id of the existing note and was moved to the right deck
+    assert nset.notes.get_id(duplicate) == existing
+    assert {fake_anki.cards[c]["deckName"] for c in fake_anki.notes[existing]["cards"]} == {nset.deckName}
+
+    # the failed note is not a card anymore and is not uploaded again
+    assert empty not in nset.notes.cards()
+    fake_anki.calls.clear()
+    vault_sync.run()
+    assert fake_anki.calls["addNote"] == 0
+
+
+def test_interrupted_sync_is_resumed(vault, fake_anki, tmp_path, monkeypatch):
+    directory, config, paths = vault
+    original = {path: path.read_text(encoding="utf-8") for path in paths}
+    journal = IdJournal(tmp_path / "journal.jsonl")
+
+    # the sync crashes before the files are saved
+    def crash(self):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as m:
+        m.setattr(NoteSet, "save_file", crash)
+        with pytest.raises(OSError):
+            VaultSync.from_directory(directory, journal=journal).run()
+
+    assert {path: path.read_text(encoding="utf-8") for path in paths} == original
+    assert len(journal) == config.files * config.cards_per_file
+
+    # the next run restores the ids from the journal: nothing is uploaded or searched again
+    fake_anki.calls.clear()
+    VaultSync.from_directory(directory, journal=journal).run()
+
+    assert fake_anki.calls["addNote"] == 0
+    assert fake_anki.calls["findNotes"] == 0
+    assert len(fake_anki.notes) == config.files * config.cards_per_file
+    assert all(NoteSet.from_file(path).notes.new_cards() == [] for path in paths)
+    assert not journal.path.exists()
+
+
+def test_offline_sync_is_queued(vault, tmp_path, monkeypatch):
+    directory, config, paths = vault
+    original = {path: path.read_text(encoding="utf-8") for path in paths}
+    queue = OfflineQueue(tmp_path / "queue.json")
+    journal = IdJournal(tmp_path / "journal.jsonl")
+
+    # anki is closed: the vault is queued and the files are left untouched
+    monkeypatch.setenv("AnkiConnection", "0")
+    assert VaultSync.from_directory(directory, journal=journal, queue=queue).run() is False
+
+    assert len(queue.notes) == config.files * config.cards_per_file
+    assert {path: path.read_text(encoding="utf-8") for path in paths} == original
+
+    # anki is open again: the queue is flushed in batches and the ids reach the files
+    with FakeAnkiServer(port=8765) as server:
+        deckModule.registry.invalidate()
+        assert VaultSync.from_directory(directory, journal=journal, queue=queue).run() is True
+        deckModule.registry.invalidate()
+        requestModule.cache.clear()
+
+    assert server.anki.calls["addNote"] == config.files * config.cards_per_file
+    assert len(server.anki.notes) == config.files * config.cards_per_file
+    assert all(NoteSet.from_file(path).notes.new_cards() == [] for path in paths)
+    assert not queue.path.exists()
+
+
+def test_snapshot_from_local_collection(vault, fake_anki, tmp_path):
+    directory, config, paths = vault
+    VaultSync.from_directory(directory).run()
+
+    # a local copy of the collection, matching the state of anki
+    package = export_apkg(VaultSync.from_directory(directory).nsets, tmp_path / "vault.apkg")
+    with zipfile.ZipFile(package) as zf:
+        zf.extract("collection.anki2", tmp_path)
+
+    vault_sync = VaultSync.from_directory(directory, collection=CollectionReader(tmp_path / "collection.anki2"))
+    nset = vault_sync.nsets[0]
+    edited = nset.notes.cards()[0]
+    nset.notes.back[edited] = "<p>edited</p>\n"
+
+    fake_anki.calls.clear()
+    vault_sync.run()
+    vault_sync.collection.close()
+
+    # existing notes are read from the collection, only the write goes to anki
+    assert fake_anki.calls["notesInfo"] == 0
+    assert fake_anki.calls["getDecks"] == 0
+    assert fake_anki.calls["updateNoteFields"] == 1
+    assert fake_anki.notes[nset.notes.get_id(edited)]["fields"]["Back"] == "<p>edited</p>\n"
+
+
+def edit_in_anki(fake_anki, id, back):
+    fake_anki.notes[id]["fields"]["Back"] = back
+    fake_anki.notes[id]["mod"] += 1
+
+
+def test_unchanged_notes_are_not_downloaded(vault, fake_anki):
+    directory, config, paths = vault
+
+    with SyncState() as state:
+        VaultSync.from_directory(directory, state=state).run()
+
+        fake_anki.calls.clear()
+        VaultSync.from_directory(directory, state=state).run()
+
+        # only the modification times are requested, nothing is downloaded or written
+        assert fake_anki.calls["notesModTime"] == 1
+        assert fake_anki.calls["notesInfo"] == 0
+        assert fake_anki.calls["updateNoteFields"] == 0
+
+        # a card edited in the vault is the only one downloaded
+        vault_sync = VaultSync.from_directory(directory, state=state)
+        nset = vault_sync.nsets[0]
+        edited = nset.notes.cards()[0]
+        nset.notes.back[edited] = "<p>edited</p>\n"
+
+        fake_anki.calls.clear()
+        vault_sync.run()
+
+        assert fake_anki.calls["notesInfo"] == 1
+        assert fake_anki.calls["updateNoteFields"] == 1
+        assert fake_anki.notes[nset.notes.get_id(edited)]["fields"]["Back"] == "<p>edited</p>\n"
+        assert state.get(nset.notes.get_id(edited))["mod"] == fake_anki.notes[nset.notes.get_id(edited)]["mod"]
+
+
+def test_remote_edits_are_reported(vault, fake_anki):
+    directory, config, paths = vault
+
+    with SyncState() as state:
+        VaultSync.from_directory(directory, state=state).run()
+
+        nset = NoteSet.from_file(paths[0])
+        id = nset.notes.get_id(nset.notes.cards()[0])
+        edit_in_anki(fake_anki, id, "<p>edited in anki</p>")
+
+        vault_sync = VaultSync.from_directory(directory, state=state)
+        vault_sync.run()
+
+        # the vault version wins
+        assert vault_sync.remote_edits == [(paths[0], id)]
+        assert fake_anki.notes[id]["fields"]["Back"] == nset.notes.back[nset.notes.cards()[0]]
+
+
+def test_remote_edits_are_pulled(vault, fake_anki):
+    directory, config, paths = vault
+
+    with SyncState() as state:
+        VaultSync.from_directory(directory, state=state).run()
+
+        nset = NoteSet.from_file(paths[0])
+        id = nset.notes.get_id(nset.notes.cards()[0])
+        edit_in_anki(fake_anki, id, "<p>edited <b>in anki</b></p>")
+
+        vault_sync = VaultSync.from_directory(directory, state=state, pull_remote=True)
+        vault_sync.run()
+
+        assert vault_sync.remote_edits == []
+        pulled = NoteSet.from_file(paths[0])
+        row = pulled.notes.cards()[0]
+        assert pulled.notes.get_id(row) == id
+        assert "edited **in anki**" in "".join(pulled.notes.text[row])
+        assert pulled.notes.back[row] == "<p>edited <strong>in anki</strong></p>\n"
+
+        # the pulled note is recorded as synced
+        fake_anki.calls.clear()
+        VaultSync.from_directory(directory, state=state, pull_remote=True).run()
+        assert fake_anki.calls["notesInfo"] == 0
+
+
+def test_pull_remote_needs_written_files(vault):
+    directory, config, paths = vault
+
+    # in sidecar mode the pulled edits could not reach the markdown, and would be reverted by the next sync
+    with SyncState() as state, pytest.raises(ValueError):
+        VaultSync.from_directory(directory, state=state, write_ids=False, pull_remote=True)
+
+
+def test_conflicting_edits_keep_the_vault_version(vault, fake_anki):
+    directory, config, paths = vault
+
+    with SyncState() as state:
+        VaultSync.from_directory(directory, state=state).run()
+
+        vault_sync = VaultSync.from_directory(directory, state=state, pull_remote=True)
+        nset = vault_sync.nsets[0]
+        row = nset.notes.cards()[0]
+        id = nset.notes.get_id(row)
+        nset.notes.back[row] = "<p>edited in the vault</p>\n"
+        edit_in_anki(fake_anki, id, "<p>edited in anki</p>")
+
+        vault_sync.run()
+
+        assert vault_sync.conflicts == [(nset.file_path, id)]
+        assert fake_anki.notes[id]["fields"]["Back"] == "<p>edited in the vault</p>\n"
+
+
+def test_expired_deadline_stops_the_sync(vault, fake_anki):
+    directory, config, paths = vault
+
+    vault_sync = VaultSync.from_directory(directory)
+    assert vault_sync.run(deadline=0) is False
+
+    # nothing was sent, and the sync can be run again
+    assert fake_anki.calls["addNote"] == 0
+    assert vault_sync.progress() == {"completed": [], "stage": "deck check", "added": 0, "updated": 0}
+    assert VaultSync.from_directory(directory).run(deadline=60) is True
+    assert len(fake_anki.notes) == config.files * config.cards_per_file
+
+
+def test_hanging_anki_stops_the_sync(vault, fake_anki, monkeypatch):
+    directory, config, paths = vault
+
+    # anki stops answering while the media are uploaded
+    monkeypatch.setitem(requestModule.READ_TIMEOUTS, "multi", 0.2)
+    store = fake_anki.act_storeMediaFile
+
+    def hang(*args, **kwargs):
+        time.sleep(0.5)
+        return store(*args, **kwargs)
+
+    monkeypatch.setattr(fake_anki, "act_storeMediaFile", hang)
+
+    with SyncState() as state:
+        vault_sync = VaultSync.from_directory(directory, state=state)
+        assert vault_sync.run() is False
+
+        # the notes added before the timeout keep their ids
+        progress = vault_sync.progress()
+        assert progress["stage"] == "media upload"
+        assert progress["added"] == config.files * config.cards_per_file
+        for path in paths:
+            assert NoteSet.from_file(path).notes.new_cards() == []
+
+        # no modification time was recorded: every note is checked again
+        nset = NoteSet.from_file(paths[0])
+        assert state.get(nset.notes.get_id(nset.notes.cards()[0]))["mod"] is None
+
+
+def test_hanging_connection_check_stops_the_sync(vault, fake_anki, monkeypatch):
+    directory, config, paths = vault
+
+    # the connection check expires before the media are uploaded, and anki stops answering
+    stalled = threading.Event()
+    respond = FakeAnkiHandler._respond
+
+    def stall(handler):
+        if stalled.is_set():
+            time.sleep(0.5)
+        respond(handler)
+
+    upload = VaultSync.upload_media
+
+    def expire_and_upload(self):
+        monkeypatch.setenv("AnkiConnection", "0")
+        stalled.set()
+        upload(self)
+
+    monkeypatch.setattr(FakeAnkiHandler, "do_GET", stall)
+    monkeypatch.setattr(VaultSync, "upload_media", expire_and_upload)
+    monkeypatch.setattr(requestModule, "CHECK_TIMEOUT", 0.2)
+
+    vault_sync = VaultSync.from_directory(directory)
+    assert vault_sync.run() is False
+
+    # the notes added before the timeout keep their ids
+    assert vault_sync.progress()["stage"] == "media upload"
+    assert len(fake_anki.notes) == config.files * config.cards_per_file
+    for path in paths:
+        assert NoteSet.from_file(path).notes.new_cards() == []
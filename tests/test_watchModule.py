@@ -0,0 +1,187 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from ankicli.noteModule2 import NoteSet
+from ankicli.watchModule import VaultWatcher
+from benchmarks.vault_generator import VaultConfig
+
+
+@pytest.fixture
+def vault_config():
+    return VaultConfig(files=3, cards_per_file=5, image_density=0.3, images=2)
+
+
+def edit(path, word):
+    # add a word to the question of the first card of a file
+    path.write_text(path.read_text(encoding="utf-8").replace(" about ", f" {word} about ", 1), encoding="utf-8")
+
+
+def fronts(fake_anki):
+    return [note["fields"]["Front"] for note in fake_anki.notes.values()]
+
+
+def test_round_syncs_changed_cards(vault, fake_anki, monkeypatch):
+    directory, config, paths = vault
+    watcher = VaultWatcher(directory, interval=0.01, debounce=0.05)
+    watcher.sync(list(watcher.scan()))
+    assert len(fake_anki.notes) == config.files * config.cards_per_file
+
+    # the ids written by the sync are not changes
+    assert watcher.round(timeout=0.2) is None
+
+    parse = NoteSet.from_file
+    parsed = []
+    monkeypatch.setattr(NoteSet, "from_file", lambda path: parsed.append(path) or parse(path))
+    fake_anki.calls.clear()
+
+    edit(paths[1], "edited")
+    vault_sync = watcher.round(timeout=1)
+
+    # only the edited file is parsed, and only the edited card is updated
+    assert parsed == [paths[1]]
+    assert vault_sync.written == {vault_sync.nsets[0].notes.get_id(vault_sync.nsets[0].notes.cards()[0])}
+    assert any(" edited about " in front for front in fronts(fake_anki))
+    assert fake_anki.calls["addNote"] == 0
+
+    # a file touched without a change is not synced again
+    paths[2].write_bytes(paths[2].read_bytes())
+    assert watcher.round(timeout=0.2) is None
+    assert parsed == [paths[1]]
+
+
+def test_new_card_written_back_once(vault, fake_anki):
+    directory, config, paths = vault
+    watcher = VaultWatcher(directory, interval=0.01, debounce=0.05)
+    watcher.sync(list(watcher.scan()))
+
+    with open(paths[0], "a", encoding="utf-8") as f:
+        f.write("\n>A brand new question? :: its answer\n")
+    watcher.round(timeout=1)
+
+    # the id of the new card reaches the file, and this write does not start another round
+    assert len(fake_anki.notes) == config.files * config.cards_per_file + 1
+    assert NoteSet.from_file(paths[0]).notes.new_cards() == []
+    assert watcher.round(timeout=0.2) is None
+    assert watcher.rounds == 1
+
+
+def test_burst_is_debounced(vault, fake_anki):
+    directory, config, paths = vault
+    watcher = VaultWatcher(directory, interval=0.01, debounce=0.15)
+    watcher.sync(list(watcher.scan()))
+
+    def burst():
+        for path in paths:
+            edit(path, "edited")
+            time.sleep(0.05)
+
+    thread = threading.Thread(target=burst)
+    thread.start()
+    changed, deleted = watcher.wait_for_changes(timeout=2)
+    thread.join()
+
+    assert changed == sorted(paths)
+    assert deleted == []
+
+
+def test_deleted_file(vault, fake_anki, capsys):
+    directory, config, paths = vault
+    watcher = VaultWatcher(directory, interval=0.01, debounce=0.05)
+    watcher.sync(list(watcher.scan()))
+
+    paths[0].unlink()
+    assert watcher.round(timeout=1) is None
+    assert paths[0] not in watcher.digests
+    assert "deleted" in capsys.readouterr().out
+    assert len(fake_anki.notes) == config.files * config.cards_per_file
+
+
+def test_failed_sync_is_retried(vault, fake_anki, monkeypatch):
+    directory, config, paths = vault
+    watcher = VaultWatcher(directory, interval=0.01, debounce=0.05)
+    watcher.sync(list(watcher.scan()))
+
+    # anki fails during the first round, the file is synced again with the next change
+    monkeypatch.setattr("ankicli.syncModule.VaultSync.update_existing_notes", lambda self: 1 / 0)
+    edit(paths[0], "edited")
+    watcher.round(timeout=1)
+    assert watcher.failed == {paths[0]}
+    assert watcher.round(timeout=0.2) is None
+
+    monkeypatch.undo()
+    monkeypatch.chdir(directory)
+    edit(paths[1], "edited")
+    vault_sync = watcher.round(timeout=1)
+
+    assert [nset.file_path for nset in vault_sync.nsets] == [paths[0], paths[1]]
+    assert watcher.failed == set()
+    assert sum(" edited about " in front for front in fronts(fake_anki)) == 2
+
+
+def test_unreadable_file_is_retried(vault, fake_anki, monkeypatch):
+    directory, config, paths = vault
+    watcher = VaultWatcher(directory, interval=0.01, debounce=0.05)
+    watcher.sync(list(watcher.scan()))
+
+    # the file is locked while it is saved
+    read_bytes = Path.read_bytes
+
+    def locked(path):
+        if path == paths[0]:
+            raise PermissionError(f"{path} is locked")
+        return read_bytes(path)
+
+    edit(paths[0], "edited")
+    monkeypatch.setattr(Path, "read_bytes", locked)
+    watcher.round(timeout=1)
+    assert watcher.failed == {paths[0]}
+
+    # it is synced once it can be read
+    monkeypatch.setattr(Path, "read_bytes", read_bytes)
+    vault_sync = watcher.round(timeout=1)
+
+    assert [nset.file_path for nset in vault_sync.nsets] == [paths[0]]
+    assert watcher.failed == set()
+    assert any(" edited about " in front for front in fronts(fake_anki))
+
+
+def test_watch_latency(vault, fake_anki):
+    directory, config, paths = vault
+    watcher = VaultWatcher(directory)
+    thread = threading.Thread(target=watcher.watch, kwargs={"timeout": 10})
+    thread.start()
+
+    try:
+        while len(fake_anki.notes) < config.files * config.cards_per_file:
+            time.sleep(0.01)
+        time.sleep(0.1)
+
+        start = time.monotonic()
+        edit(paths[2], "watched")
+        while not any(" watched about " in front for front in fronts(fake_anki)):
+            assert time.monotonic() - start < 1
+            time.sleep(0.01)
+    finally:
+        watcher.stop()
+        thread.join()
+
+    assert watcher.rounds == 1
+
+
+def test_deleted_deck_is_created_again(vault, fake_anki):
+    directory, config, paths = vault
+    watcher = VaultWatcher(directory, interval=0.01, debounce=0.05)
+    watcher.sync(list(watcher.scan()))
+
+    # the deck is deleted in anki while the watcher runs, then a new file is added to it
+    fake_anki.act_deleteDecks(["Benchmark::Deck 0"])
+    (directory / "new.md").write_text(
+        "---\ndeck: Benchmark::Deck 0\n---\n\n>A brand new question? :: its answer\n", encoding="utf-8"
+    )
+    watcher.round(timeout=1)
+
+    assert "Benchmark::Deck 0" in fake_anki.decks
+    assert sum("A brand new question?" in front for front in fronts(fake_anki)) == 1
+    assert watcher.failed == set()